@@ -24,9 +24,25 @@ import os
 import re
 import argparse
 import copy
+import shutil
+import tempfile
+import itertools
+import hashlib
+import cStringIO
+import time
+import uuid
 import yaml
 import pkg_resources
 import multiprocessing
+import csv
+import traceback
+import json
+import collections
+import cProfile
+import pstats
+import binascii
+import base64
+import mmap
 
 #From https://github.com/pyinstaller/pyinstaller/wiki/Recipe-Multiprocessing
 try:
@@ -62,8 +78,7 @@ if sys.platform.startswith('win'):
     # Second override 'Popen' class with our modified version.
     forking.Popen = _Popen
 
-from gchelpers.writers import XlsxHandler
-from gchelpers.db.DbHandler import DbConfig as GcHelperDbConfig
+import xlsxwriter
 
 logging.basicConfig(
     level = logging.DEBUG
@@ -76,10 +91,224 @@ logging.basicConfig(
 from pyesedb import column_types as DBTYPES
 import pyesedb
 
+#Optional, used to convert timestamp columns in batches#
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#Optional, used for the peak RSS in metrics (not available on Windows)#
+try:
+    import resource
+except ImportError:
+    resource = None
+
+#Optional, used to export to Parquet#
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
 #Requires installing python-registry
 #https://github.com/williballenthin/python-registry
 from Registry import Registry
 
+#Number of records held in memory before they are flushed to SQLite#
+DEFAULT_BATCH_SIZE = 10000
+#Size limit of the report query result cache in MB#
+DEFAULT_QUERY_CACHE_SIZE = 256
+#Tables with more records are split into ranges of this many records#
+#when converting with multiple workers#
+DEFAULT_SPLIT_RECORDS = 250000
+#Entries kept per cache of decoded SIDs and strings#
+DEFAULT_DECODE_CACHE_SIZE = 32768
+
+#Formats the export command can write#
+EXPORT_FORMATS = ['csv','jsonl','parquet']
+
+#How the SRUM database and the SOFTWARE hive are read#
+INPUT_IO_MODES = ['native','direct','buffered','mmap']
+#Size in KB of the blocks buffered input reads ahead#
+DEFAULT_READ_AHEAD = 1024
+#Size limit in MB of the blocks buffered input keeps per input#
+DEFAULT_INPUT_CACHE_SIZE = 256
+#Folder in the outpath that caches what is extracted from SOFTWARE hives#
+REGISTRY_CACHE_FOLDER = 'RegistryCache'
+
+#What to store for binary columns that are not decoded#
+BINARY_COLUMN_POLICIES = ['eager','skip','digest']
+
+#With --timestamp_format epoch, tables with timestamp columns are stored as#
+#<table>_Epoch and <table> is a view that presents the timestamps as text#
+EPOCH_TABLE_SUFFIX = '_Epoch'
+
+def GetDatetimeArgument(value):
+    '''Parse a --since/--until value. Either a UTC date/datetime
+    (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS) or a number of days or hours before
+    now (7d, 12h).'''
+    relative = re.match(r'^(\d+)([dh])$',value.strip())
+    if relative:
+        amount = int(relative.group(1))
+        if relative.group(2) == 'd':
+            delta = datetime.timedelta(days=amount)
+        else:
+            delta = datetime.timedelta(hours=amount)
+        return datetime.datetime.utcnow() - delta
+    
+    for datetime_format in ['%Y-%m-%d %H:%M:%S','%Y-%m-%dT%H:%M:%S','%Y-%m-%d']:
+        try:
+            return datetime.datetime.strptime(value.strip(),datetime_format)
+        except ValueError:
+            pass
+    
+    raise argparse.ArgumentTypeError(
+        u'invalid datetime {} (use YYYY-MM-DD[ HH:MM:SS], Nd or Nh)'.format(value)
+    )
+
+def GetColumnPolicyArgument(value):
+    '''Parse a --column_policies value: [Table.]Column=eager|skip|digest'''
+    name,separator,policy = value.rpartition('=')
+    if not separator or not name or policy not in BINARY_COLUMN_POLICIES:
+        raise argparse.ArgumentTypeError(
+            u'invalid column policy {} (use [Table.]Column={})'.format(
+                value,'|'.join(BINARY_COLUMN_POLICIES)
+            )
+        )
+    
+    return name.lower(),policy
+
+def GetPositiveIntArgument(value):
+    '''Parse a count or size option that must be greater than 0'''
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    
+    if number <= 0:
+        raise argparse.ArgumentTypeError(
+            u'invalid value {} (use a whole number greater than 0)'.format(value)
+        )
+    
+    return number
+
+def SetFilterArguments(parser):
+    parser.add_argument(
+        '--tables',
+        dest='tables',
+        action="store",
+        nargs='+',
+        default=None,
+        help='Only convert these tables (resolved names such as NetworkUsageData or ESE table names)'
+    )
+    
+    parser.add_argument(
+        '--exclude_tables',
+        dest='exclude_tables',
+        action="store",
+        nargs='+',
+        default=None,
+        help='Do not convert these tables'
+    )
+    
+    parser.add_argument(
+        '--since',
+        dest='since',
+        action="store",
+        type=GetDatetimeArgument,
+        default=None,
+        help='Only convert records with a TimeStamp at or after this UTC time (YYYY-MM-DD[ HH:MM:SS], or 7d/12h ago)'
+    )
+    
+    parser.add_argument(
+        '--until',
+        dest='until',
+        action="store",
+        type=GetDatetimeArgument,
+        default=None,
+        help='Only convert records with a TimeStamp before this UTC time'
+    )
+
+def SetBinaryPolicyArguments(parser):
+    parser.add_argument(
+        '--binary_columns',
+        dest='binary_columns',
+        action="store",
+        choices=BINARY_COLUMN_POLICIES,
+        default='eager',
+        help='What to store for binary columns: eager (the data), skip (nothing) or digest (SHA-1 and a <column>_Size column, see extract) (default: eager)'
+    )
+    
+    parser.add_argument(
+        '--column_policies',
+        dest='column_policies',
+        action="store",
+        nargs='+',
+        type=GetColumnPolicyArgument,
+        default=None,
+        help='Per column overrides of --binary_columns as [Table.]Column=eager|skip|digest'
+    )
+
+def SetInputArguments(parser):
+    parser.add_argument(
+        '--input_io',
+        dest='input_io',
+        action="store",
+        choices=INPUT_IO_MODES,
+        default='native',
+        help='How inputs are read: native (libesedb opens the file), direct (counted reads straight from the file), buffered (cached read-ahead blocks) or mmap (a memory map of the file). The I/O of all but native is counted in the log and the metrics (default: native)'
+    )
+    
+    parser.add_argument(
+        '--read_ahead',
+        dest='read_ahead',
+        action="store",
+        type=int,
+        default=DEFAULT_READ_AHEAD,
+        help='Size in KB of the blocks read with --input_io buffered (default: {})'.format(
+            DEFAULT_READ_AHEAD
+        )
+    )
+    
+    parser.add_argument(
+        '--input_cache_size',
+        dest='input_cache_size',
+        action="store",
+        type=int,
+        default=DEFAULT_INPUT_CACHE_SIZE,
+        help='Size limit in MB of the blocks kept per input and process with --input_io buffered (default: {})'.format(
+            DEFAULT_INPUT_CACHE_SIZE
+        )
+    )
+    
+    parser.add_argument(
+        '--stage_folder',
+        dest='stage_folder',
+        action="store",
+        type=unicode,
+        default=None,
+        help='Copy the inputs to a temporary folder in this local folder (such as /dev/shm) with large sequential reads before converting them, for inputs on network storage'
+    )
+    
+    parser.add_argument(
+        '--registry_cache_folder',
+        dest='registry_cache_folder',
+        action="store",
+        type=unicode,
+        default=None,
+        help='Folder for the <SHA-1>.json files that cache what is extracted from a SOFTWARE hive by its content hash (default: {} in the outpath)'.format(
+            REGISTRY_CACHE_FOLDER
+        )
+    )
+    
+    parser.add_argument(
+        '--no_registry_cache',
+        dest='registry_cache',
+        action="store_false",
+        default=True,
+        help='Always parse the SOFTWARE hive and do not write a registry cache file'
+    )
+
 def SetProcessingArguments(parser):
     parser.add_argument(
         '--srum_db',
@@ -117,6 +346,285 @@ def SetProcessingArguments(parser):
         help='Do not run reports (Parsing/Database creation only)'
     )
     
+    parser.add_argument(
+        '--batch_size',
+        dest='batch_size',
+        action="store",
+        type=GetPositiveIntArgument,
+        default=DEFAULT_BATCH_SIZE,
+        help='Number of records to buffer per SQLite insert batch (default: {})'.format(
+            DEFAULT_BATCH_SIZE
+        )
+    )
+    
+    parser.add_argument(
+        '--fast_load',
+        dest='fast_load',
+        action="store_true",
+        default=False,
+        help='Use a single connection with journaling and syncing off while converting'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        action="store",
+        type=int,
+        default=1,
+        help='Number of processes used to convert tables (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--split_records',
+        dest='split_records',
+        action="store",
+        type=GetPositiveIntArgument,
+        default=DEFAULT_SPLIT_RECORDS,
+        help='With --workers, tables with more records than this are converted in ranges of this many records (default: {})'.format(
+            DEFAULT_SPLIT_RECORDS
+        )
+    )
+    
+    parser.add_argument(
+        '--rollups',
+        dest='rollups',
+        action="store_true",
+        default=False,
+        help='Build hourly, daily and total per app/user aggregate tables after converting'
+    )
+    
+    parser.add_argument(
+        '--timestamp_format',
+        dest='timestamp_format',
+        action="store",
+        choices=['datetime','epoch'],
+        default='datetime',
+        help='How timestamps are stored. epoch stores INTEGER microseconds since 1970 in <table>_Epoch tables with a <table> view of formatted datetimes (default: datetime)'
+    )
+    
+    parser.add_argument(
+        '--append',
+        dest='append',
+        action="store_true",
+        default=False,
+        help='Keep an existing SRUM.db and only convert records newer than the ones already in it'
+    )
+    
+    parser.add_argument(
+        '--resume',
+        dest='resume',
+        action="store_true",
+        default=False,
+        help='Continue an interrupted conversion into an existing SRUM.db from its journal. Tables it finished are skipped and the others continue after the last committed batch. Use the options of the interrupted run'
+    )
+    
+def SetBatchArguments(parser):
+    hosts_group = parser.add_mutually_exclusive_group(
+        required=True
+    )
+    hosts_group.add_argument(
+        '--manifest',
+        dest='manifest',
+        action="store",
+        type=unicode,
+        default=None,
+        help='CSV file with one host_id,srum_db,software_hive line per host. Relative paths are relative to the manifest'
+    )
+    hosts_group.add_argument(
+        '--input_folder',
+        dest='input_folder',
+        action="store",
+        type=unicode,
+        default=None,
+        help='Folder with one sub folder per host (named by host id) that contains SRUDB.dat and SOFTWARE'
+    )
+    
+    parser.add_argument(
+        '--outpath',
+        dest='outpath',
+        required=True,
+        action="store",
+        type=unicode,
+        default=None,
+        help='Output path where you want your reports and case db'
+    )
+    
+    parser.add_argument(
+        '--no_reports',
+        dest='report_flag',
+        action="store_false",
+        default=True,
+        help='Do not run reports (Parsing/Database creation only)'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        action="store",
+        type=int,
+        default=1,
+        help='Number of hosts to convert at the same time (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--batch_size',
+        dest='batch_size',
+        action="store",
+        type=GetPositiveIntArgument,
+        default=DEFAULT_BATCH_SIZE,
+        help='Number of records to buffer per SQLite insert batch (default: {})'.format(
+            DEFAULT_BATCH_SIZE
+        )
+    )
+    
+    parser.add_argument(
+        '--rollups',
+        dest='rollups',
+        action="store_true",
+        default=False,
+        help='Build hourly, daily and total per app/user aggregate tables after merging'
+    )
+    
+    parser.add_argument(
+        '--timestamp_format',
+        dest='timestamp_format',
+        action="store",
+        choices=['datetime','epoch'],
+        default='datetime',
+        help='How timestamps are stored, see process (default: datetime)'
+    )
+    
+def SetExtractArguments(parser):
+    parser.add_argument(
+        '--srum_db',
+        dest='srum_db',
+        action="store",
+        type=unicode,
+        required=True,
+        help='SRUM Database'
+    )
+    
+    parser.add_argument(
+        '--table',
+        dest='table',
+        action="store",
+        type=unicode,
+        required=True,
+        help='ESE table name or GUID, or the name it is converted to (such as NetworkUsageData)'
+    )
+    
+    parser.add_argument(
+        '--software_hive',
+        dest='software_hive',
+        action="store",
+        type=unicode,
+        default=None,
+        help='SOFTWARE Hive used to resolve --table to the names process converts GUID tables to'
+    )
+    
+    parser.add_argument(
+        '--column',
+        dest='column',
+        action="store",
+        type=unicode,
+        required=True,
+        help='The column to extract'
+    )
+    
+    record_group = parser.add_mutually_exclusive_group(
+        required=True
+    )
+    record_group.add_argument(
+        '--key',
+        dest='key',
+        action="store",
+        type=int,
+        default=None,
+        help='AutoIncId (IdIndex for SruDbIdMapTable) of the record'
+    )
+    record_group.add_argument(
+        '--digest',
+        dest='digest',
+        action="store",
+        type=unicode,
+        default=None,
+        help='SHA-1 digest stored for the value'
+    )
+    
+    parser.add_argument(
+        '--outfile',
+        dest='outfile',
+        action="store",
+        type=unicode,
+        required=True,
+        help='File to write the raw value to'
+    )
+
+def SetExportArguments(parser):
+    parser.add_argument(
+        '--database',
+        dest='database',
+        required=True,
+        action="store",
+        type=unicode,
+        help=u'Database to export from'
+    )
+    parser.add_argument(
+        '--outpath',
+        dest='outpath',
+        required=True,
+        action="store",
+        type=unicode,
+        help='Output Path.'
+    )
+    
+    parser.add_argument(
+        '--format',
+        dest='export_format',
+        action="store",
+        choices=EXPORT_FORMATS,
+        default='csv',
+        help='File format to export to. parquet requires pyarrow (default: csv)'
+    )
+    
+    parser.add_argument(
+        '--source',
+        dest='source',
+        action="store",
+        choices=['templates','tables'],
+        default='templates',
+        help='Export the records worksheet queries of the templates or whole tables (default: templates)'
+    )
+    
+    parser.add_argument(
+        '--tables',
+        dest='tables',
+        action="store",
+        nargs='+',
+        default=None,
+        help='With --source tables, only export these tables'
+    )
+    
+    parser.add_argument(
+        '--chunk_size',
+        dest='chunk_size',
+        action="store",
+        type=GetPositiveIntArgument,
+        default=DEFAULT_BATCH_SIZE,
+        help='Number of records fetched and written at a time (default: {})'.format(
+            DEFAULT_BATCH_SIZE
+        )
+    )
+    
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        action="store",
+        type=GetPositiveIntArgument,
+        default=1,
+        help='Number of queries or tables to export at the same time (default: 1)'
+    )
+
 def SetReportingArguments(parser):
     parser.add_argument(
         '--database',
@@ -157,16 +665,96 @@ Further, you can create report templates to generate XLSX reports based off of Y
         help='Folder that contains YML templates.'
     )
     
-    subparsers = options.add_subparsers(
-        help='Either process or report command is required.',
-        dest='subparser_name'
-    )
-    processing_parser = subparsers.add_parser(
-        'process',
-        help='Processes SRUM and generate reports.',
-    )
-    SetProcessingArguments(
-        processing_parser
+    options.add_argument(
+        '--report_workers',
+        dest='report_workers',
+        action="store",
+        default=1,
+        type=int,
+        help='Number of templates to generate reports for at the same time (default: 1)'
+    )
+    
+    options.add_argument(
+        '--query_cache_size',
+        dest='query_cache_size',
+        action="store",
+        default=DEFAULT_QUERY_CACHE_SIZE,
+        type=int,
+        help='Size limit in MB of the report query result cache kept next to the database. 0 disables the cache (default: {})'.format(
+            DEFAULT_QUERY_CACHE_SIZE
+        )
+    )
+    
+    options.add_argument(
+        '--metrics_file',
+        dest='metrics_file',
+        action="store",
+        default=None,
+        type=unicode,
+        help='Write stage timings (registry, tables, worksheets) with rows, bytes, records/sec and peak RSS to this JSON file'
+    )
+    
+    options.add_argument(
+        '--profile',
+        dest='profile',
+        action="store",
+        default=None,
+        type=unicode,
+        help='Run under cProfile, write the stats to this file and print the top functions. Worker processes are not profiled'
+    )
+    
+    subparsers = options.add_subparsers(
+        help='A process, batch, extract, export or report command is required.',
+        dest='subparser_name'
+    )
+    processing_parser = subparsers.add_parser(
+        'process',
+        help='Processes SRUM and generate reports.',
+    )
+    SetProcessingArguments(
+        processing_parser
+    )
+    SetFilterArguments(
+        processing_parser
+    )
+    SetBinaryPolicyArguments(
+        processing_parser
+    )
+    SetInputArguments(
+        processing_parser
+    )
+    
+    batch_parser = subparsers.add_parser(
+        'batch',
+        help='Processes the SRUM of many hosts into one case database and generate reports.',
+    )
+    SetBatchArguments(
+        batch_parser
+    )
+    SetFilterArguments(
+        batch_parser
+    )
+    SetBinaryPolicyArguments(
+        batch_parser
+    )
+    SetInputArguments(
+        batch_parser
+    )
+    
+    extract_parser = subparsers.add_parser(
+        'extract',
+        help='Extract the raw value of a column stored as a digest from the SRUM database.',
+    )
+    SetExtractArguments(
+        extract_parser
+    )
+    
+    export_parser = subparsers.add_parser(
+        'export',
+        help='Export template queries or tables from an existing SrumMonkey database to CSV, JSON Lines or Parquet.',
+    )
+    SetExportArguments(
+        export_parser
     )
     
     reporting_parser = subparsers.add_parser(
@@ -184,615 +772,4287 @@ def Main():
     arguements = GetOptions()
     options = arguements.parse_args()
     
+    metrics = None
+    if options.metrics_file:
+        metrics = PerformanceMetrics(
+            command=options.subparser_name
+        )
+    
+    try:
+        if options.profile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(
+                    RunCommand,
+                    options,
+                    metrics=metrics
+                )
+            finally:
+                profiler.dump_stats(options.profile)
+                stats = pstats.Stats(profiler)
+                stats.sort_stats('cumulative').print_stats(25)
+        else:
+            RunCommand(
+                options,
+                metrics=metrics
+            )
+    finally:
+        #Also record the stages of a command that failed part way#
+        if metrics is not None:
+            metrics.Write(
+                options.metrics_file
+            )
+
+def RunCommand(options,metrics=None):
+    '''Run a sub-command
+    
+    Args:
+        options: The parsed options
+        metrics: Optional PerformanceMetrics to record stage timings in'''
+    if options.subparser_name == 'extract':
+        #Resolve GUID table names like process does#
+        guid_table = None
+        if options.software_hive:
+            guid_table = RegistryHandler.ReadGuidTable(
+                options.software_hive
+            )
+        
+        extract_handler = ExtractHandler(
+            options.srum_db,
+            guid_table=guid_table
+        )
+        extract_handler.Extract(
+            options.table,
+            options.column,
+            options.outfile,
+            key=options.key,
+            digest=options.digest
+        )
+        return
+    
     if options.subparser_name == 'report':
         report_flag = True
+    elif options.subparser_name == 'export':
+        report_flag = False
     else:
         if options.report_flag:
             report_flag = True
         else:
             report_flag = False
     
-    # Get template folder
-    if report_flag is True:
-        # If no template folder was supplied, check source for default templates
-        template_folder = options.template_folder
-        if not template_folder:
-            if getattr(sys,'frozen',False):
-                location = os.path.join(sys._MEIPASS,'xlsx_templates')
-                location = os.path.join(location,'')
-                location = os.path.abspath(location)
-            else:
-                location = os.path.abspath(
-                    pkg_resources.resource_filename(
-                        'xlsx_templates',
-                        ''
-                    )
-                )
-            template_folder = location
+    # Get template folder (templates can also declare indexes)
+    # Exporting tables is the only command that does not use templates
+    template_folder = None
+    if options.subparser_name != 'export' or options.source == 'templates':
+        template_folder = GetTemplateFolder(
+            options.template_folder
+        )
     
     if options.subparser_name == 'process':
+        #A killed --fast_load run can leave the database damaged, so it is#
+        #converted again instead of resumed#
+        if options.resume and options.fast_load:
+            raise Exception(u'--resume cannot be used with --fast_load. Run the conversion again without --resume.')
+        
         if not os.path.isdir(options.outpath):
             os.makedirs(options.outpath)
             
         options.output_db = os.path.join(options.outpath,'SRUM.db')
         
+        #If Database exists, delete it unless appending to it or resuming#
+        if os.path.isfile(options.output_db) and not (options.append or options.resume):
+            os.remove(options.output_db)
+        
+        output_db_handler = DbHandler(
+            DbConfig(
+                dbname=options.output_db
+            )
+        )
+        
+        #Keep appending in the timestamp format the database was created with#
+        if options.append or options.resume:
+            table_names = [
+                table_name for table_name in output_db_handler.GetTableNames()
+                if table_name not in SrumHandler.METADATA_TABLES
+            ]
+            if any(name.endswith(EPOCH_TABLE_SUFFIX) for name in table_names):
+                options.timestamp_format = 'epoch'
+            elif table_names:
+                options.timestamp_format = 'datetime'
+        
+        stage_folder = None
+        if options.stage_folder:
+            stage_folder = StageInputs(
+                options,
+                metrics=metrics
+            )
+        
+        if options.fast_load:
+            output_db_handler.BeginBulkLoad()
+        
+        try:
+            ConvertSrum(
+                options,
+                output_db_handler,
+                metrics=metrics
+            )
+            
+            if options.rollups:
+                rollup_handler = RollupHandler(
+                    output_db_handler
+                )
+                rollup_handler.BuildRollups()
+            
+            #Index the join and group keys used by the reports#
+            index_handler = IndexHandler(
+                output_db_handler,
+                template_folder=template_folder
+            )
+            index_handler.BuildIndexes()
+        finally:
+            output_db_handler.EndBulkLoad()
+            if stage_folder is not None:
+                shutil.rmtree(stage_folder,ignore_errors=True)
+    elif options.subparser_name == 'batch':
+        if not os.path.isdir(options.outpath):
+            os.makedirs(options.outpath)
+        
+        options.output_db = os.path.join(options.outpath,'SRUM.db')
+        
         #If Database exists, delete it#
         if os.path.isfile(options.output_db):
             os.remove(options.output_db)
         
-        guid_table = None
-        
-        #Enumerate Registry Here#
-        rhandler = RegistryHandler(
-            options
+        output_db_handler = DbHandler(
+            DbConfig(
+                dbname=options.output_db
+            )
         )
-        rhandler.EnumerateRegistryValues()
-        guid_table = rhandler.GetGuidTable()
         
-        # if not options.reports_only_flag:
-        srumHandler = SrumHandler(
+        batch_handler = BatchHandler(
             options,
-            guid_table=guid_table
+            output_db_handler
+        )
+        batch_handler.ProcessHosts()
+        
+        if options.rollups:
+            rollup_handler = RollupHandler(
+                output_db_handler
+            )
+            rollup_handler.BuildRollups()
+        
+        #Index the join and group keys used by the reports#
+        index_handler = IndexHandler(
+            output_db_handler,
+            template_folder=template_folder
+        )
+        index_handler.BuildIndexes()
+    elif options.subparser_name == 'export':
+        db_handler = DbHandler(
+            DbConfig(
+                dbname=options.database
+            )
         )
         
-        srumHandler.ConvertDb()
+        if options.source == 'tables':
+            queries = ExportHandler.GetTableQueries(
+                db_handler,
+                tables=options.tables
+            )
+        else:
+            #Make sure indexes declared by the templates exist#
+            index_handler = IndexHandler(
+                db_handler,
+                template_folder=template_folder
+            )
+            index_handler.BuildIndexes(
+                default_indexes=False
+            )
+            queries = ExportHandler.GetTemplateQueries(
+                template_folder,
+                table_names=db_handler.GetTableNames()
+            )
+        
+        export_handler = ExportHandler(
+            export_format=options.export_format,
+            chunk_size=options.chunk_size,
+            workers=options.workers
+        )
+        export_handler.Export(
+            options.database,
+            options.outpath,
+            queries,
+            table_queries=options.source == 'tables'
+        )
     else:
         options.output_db = options.database
+        
+        #Make sure indexes declared by the templates exist#
+        index_handler = IndexHandler(
+            DbHandler(
+                DbConfig(
+                    dbname=options.output_db
+                )
+            ),
+            template_folder=template_folder
+        )
+        index_handler.BuildIndexes(
+            default_indexes=False
+        )
     
     if report_flag is True:
-        db_config = GcHelperDbConfig(
-            db_type='sqlite',
-            db=options.output_db
+        report_handler = ReportHandler(
+            template_folder,
+            workers=options.report_workers,
+            query_cache_size=options.query_cache_size * 1024 * 1024,
+            metrics=metrics
         )
-            
-        temp_manager = XlsxHandler.XlsxTemplateManager(
-            template_folder
-        )
-        temp_manager.CreateReports(
-            db_config,
+        report_handler.CreateReports(
+            options.output_db,
             options.outpath
         )
     
-class RegistryHandler():
-    '''Registry Operations'''
-    WLANSVCINTERFACEPROFILES_COLUMN_MAPPING = {
-        'ProfileIndex':'INTEGER',
-        'succeeded':'BLOB',
-        'ProfileGuid':'TEXT',
-        'Flags':'INTEGER',
-        'All User Profile Security Descriptor':'TEXT',
-        'CreatorSid':'BLOB',
-        'InterfaceGuid':'TEXT',
-        'SSID':'TEXT',
-        'Nla':'BLOB',
-        'NameLength':'INTEGER',
-        'Name':'TEXT'
-    }
-    WLANSVCINTERFACEPROFILES_COLUMN_ORDER = [
-        'ProfileIndex',
-        'succeeded',
-        'ProfileGuid',
-        'Flags',
-        'All User Profile Security Descriptor',
-        'CreatorSid',
-        'InterfaceGuid',
-        'SSID',
-        'Nla',
-        'NameLength',
-        'Name'
-    ]
-    
-    CUSTOM_COLUMNS = {
-        'All User Profile Security Descriptor':{
-            'type':'utf-16le'
-        },
-        'Channel Hints':{
-            'type':'ChannelHints'
-        }
-    }
-    SQLITE_TYPE = {
-        'DATETIME':[
-            
-        ],
-        'REAL':[
-            
-        ],
-        'INTEGER':[
-            Registry.RegDWord
-        ],
-        'BLOB':[
-        ],
-        'TEXT':[
-        ]
-    }
+class InputFile(object):
+    '''A read-only file object over an input for pyesedb open_file_object
+    and python-registry that counts the I/O done on it.
     
-    def __init__(self,options):
-        self.options = options
-        self.guid_mapping = None
-        self.outputDbConfig = DbConfig(
-            dbname=options.output_db
-        )
-        self.outputDbHandler = DbHandler(
-            self.outputDbConfig
-        )
+    Reads go straight to the file (direct), through a cache of read-ahead
+    blocks (buffered) or to a memory map of the file (mmap). libesedb reads
+    pages at random, which costs a round trip per page on network storage;
+    buffered turns them into fewer, larger reads.'''
+    def __init__(self,path,mode='buffered',block_size=DEFAULT_READ_AHEAD * 1024,cache_size=DEFAULT_INPUT_CACHE_SIZE * 1024 * 1024):
+        '''Open an InputFile
         
-    def _GetWlanSvcKeys(self):
-        '''Insert wireless interface info into database'''
-        try:
-            reg_key = self.registry.open('Microsoft\\WlanSvc\\Interfaces')
-        except Registry.RegistryKeyNotFoundException as error:
-            print(u'No WlanSvc found at Microsoft\\WlanSvc\\Interfaces')
-            return False
+        Args:
+            path: The file to read
+            mode: direct, buffered or mmap
+            block_size: The size of the blocks buffered reads
+            cache_size: The size limit of the blocks buffered keeps'''
+        self.path = path
+        self.mode = mode
+        self.block_size = block_size
+        self.max_blocks = max(cache_size // block_size,1)
+        #{block index:data} in least to most recently used order#
+        self.blocks = collections.OrderedDict()
+        self.position = 0
+        self.counters = collections.OrderedDict([
+            ('reads',0),
+            ('bytes_read',0),
+            ('seeks',0),
+            ('file_reads',0),
+            ('file_bytes',0),
+            ('cache_hits',0),
+            ('cache_misses',0),
+            ('read_seconds',0.0)
+        ])
         
-        profile_list = []
-        for interface_key in reg_key.subkeys():
-            #Get Interface GUID#
-            interface_guid = interface_key.name()
-            #If Interface Key has sub keys, enumerate profiles#
-            if interface_key.subkeys_number() > 0:
-                #Get Profiles Key#
-                profiles_key = interface_key.subkey('Profiles')
-                profile_dict = {
-                    'InterfaceGuid':interface_guid
-                }
-                for profile_key in profiles_key.subkeys():
-                    profile_guid = profile_key.name()
-                    profile_dict['ProfileGuid'] = profile_guid
-                    if profile_key.values_number() > 0:
-                        for value in profile_key.values():
-                            profile_dict[value.name()] = value.value()
-                    if profile_key.subkeys_number() > 0:
-                        metadata_key = profile_key.subkey('MetaData')
-                        if metadata_key.values_number() > 0:
-                            for value in metadata_key.values():
-                                resolved_value = self._GetValue(value)
-                                if isinstance(resolved_value,dict):
-                                    profile_dict.update(resolved_value)
-                                else:
-                                    profile_dict[value.name()] = self._GetValue(value)
-                    
-                    for key in profile_dict:
-                        if key not in RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_MAPPING:
-                            RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_MAPPING[key] = 'BLOB'
-                        
-                        if key not in self.INTERFACE_COLUMN_LISTING:
-                            self.INTERFACE_COLUMN_LISTING.append(key)
-                            
-                    profile_list.append(copy.deepcopy(profile_dict))
+        self.file_object = open(path,'rb')
+        self.size = os.fstat(self.file_object.fileno()).st_size
         
-        self.outputDbHandler.CreateTableFromMapping(
-            'WlanSvcInterfaceProfiles',
-            RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_MAPPING,
-            None,
-            RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_ORDER
-        )
+        self.mmap = None
+        if mode == 'mmap' and self.size:
+            self.mmap = mmap.mmap(
+                self.file_object.fileno(),
+                0,
+                access=mmap.ACCESS_READ
+            )
+    
+    def read(self,size=-1):
+        '''Read up to size bytes from the current position'''
+        start = time.time()
+        if size is None or size < 0:
+            size = self.size - self.position
+        size = max(min(size,self.size - self.position),0)
         
-        self.outputDbHandler.InsertFromListOfDicts(
-            'WlanSvcInterfaceProfiles',
-            profile_list,
-            self.INTERFACE_COLUMN_LISTING
-        )
+        if self.mmap is not None:
+            data = self.mmap[self.position:self.position + size]
+        elif self.mode == 'buffered' and size < self.block_size:
+            data = self._ReadBlocks(self.position,size)
+        else:
+            #Large reads gain nothing from the cache#
+            data = self._ReadFile(self.position,size)
         
-        return True
+        self.position += len(data)
+        self.counters['reads'] += 1
+        self.counters['bytes_read'] += len(data)
+        self.counters['read_seconds'] += time.time() - start
         
-    def GetGuidTable(self):
-        '''Create a guid table from the guid_mapping'''
-        guid_table = {}
-        for key,value in self.guid_mapping.items():
-            guid_table[key] = value
-            guid_table[key+'LT'] = value+'LT'
-            
-        return guid_table
+        return data
+    
+    def seek(self,offset,whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise IOError(u'Invalid offset {} in {}'.format(offset,self.path))
         
-    def _EnumerateSrumExtensions(self):
-        '''Insert wireless interface info into database'''
-        reg_key = self.registry.open('Microsoft\\Windows NT\\CurrentVersion\\SRUM\\Extensions')
-        guid_map = {}
-        for guid_key in reg_key.subkeys():
-            #Get Interface GUID#
-            guid_name = guid_key.name()
-            desc = guid_key.value('(default)').value()
-            tname = RegistryHandler._GetTableName(desc)
-            guid_map[guid_name.upper()] = tname
-            pass
-        self.guid_mapping = guid_map
+        self.position = offset
+        self.counters['seeks'] += 1
     
-    @staticmethod
-    def _GetTableName(desc):
-        tname = desc
-        tname = tname.replace(" ", "")
-        return tname
+    def tell(self):
+        return self.position
     
-    def EnumerateRegistryValues(self):
-        hive = self.options.software_hive
-        self.registry = Registry.Registry(
-            hive
+    def get_size(self):
+        return self.size
+    
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.blocks.clear()
+        self.file_object.close()
+    
+    def _ReadFile(self,offset,size):
+        '''Read from the file itself'''
+        self.file_object.seek(offset)
+        data = self.file_object.read(size)
+        
+        self.counters['file_reads'] += 1
+        self.counters['file_bytes'] += len(data)
+        
+        return data
+    
+    def _ReadBlocks(self,offset,size):
+        '''Read from the cached blocks that hold offset to offset + size'''
+        first = offset // self.block_size
+        last = (offset + size - 1) // self.block_size
+        
+        data = ''.join(
+            self._GetBlock(index) for index in xrange(first,last + 1)
         )
-        self.INTERFACE_COLUMN_LISTING = RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_ORDER
+        start = offset - first * self.block_size
         
-        self._EnumerateSrumExtensions()
-        result = self._GetWlanSvcKeys()
-        if not result:
-            # If there was no key, create the table with default columns #
-            self.outputDbHandler.CreateTableFromMapping(
-                'WlanSvcInterfaceProfiles',
-                RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_MAPPING,
-                None,
-                RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_ORDER
-            )
+        return data[start:start + size]
+    
+    def _GetBlock(self,index):
+        '''Get a block from the cache or read it, evicting the least
+        recently used block if the cache is full'''
+        data = self.blocks.pop(index,None)
+        if data is None:
+            self.counters['cache_misses'] += 1
+            data = self._ReadFile(index * self.block_size,self.block_size)
+            if len(self.blocks) >= self.max_blocks:
+                self.blocks.popitem(last=False)
+        else:
+            self.counters['cache_hits'] += 1
         
-    def _GetValue(self,value):
-        new_value = value.value()
-        vname = value.name()
-        vtype = value.value_type()
+        self.blocks[index] = data
         
-        ###CHECK FOR CUSTOM DEFINED TABLE COLUMNS TYPES###
-        if vname in RegistryHandler.CUSTOM_COLUMNS:
+        return data
+    
+    def Report(self,metrics=None):
+        '''Log the I/O counters and record them as an input stage
+        
+        Args:
+            metrics: Optional PerformanceMetrics to record the stage in'''
+        logging.info(u'Input {} ({}): {}'.format(
+            self.path,
+            self.mode,
+            ', '.join(u'{} {}'.format(name,value) for name,value in self.counters.items())
+        ))
+        
+        if metrics is not None:
+            metrics.AddStage(
+                'input',
+                self.path,
+                self.counters['read_seconds'],
+                rows=self.counters['reads'],
+                size=self.counters['file_bytes'],
+                details=dict(self.counters,mode=self.mode)
+            )
+
+def OpenInputFile(path,options):
+    '''Open an input the way --input_io asks for
+    
+    Args:
+        path: The file to read
+        options: The processing options
+    Returns:
+        input_file: An InputFile or None for native I/O'''
+    if options.input_io == 'native':
+        return None
+    
+    return InputFile(
+        path,
+        mode=options.input_io,
+        block_size=options.read_ahead * 1024,
+        cache_size=options.input_cache_size * 1024 * 1024
+    )
+
+def StageInputs(options,metrics=None):
+    '''Copy the SRUM database and the SOFTWARE hive to a temporary folder
+    in options.stage_folder and point the options at the copies
+    
+    Args:
+        options: The processing options (srum_db, software_hive, stage_folder)
+        metrics: Optional PerformanceMetrics to record the copies in
+    Returns:
+        stage_folder: The temporary folder to remove when done. It is removed
+        here if a copy fails.'''
+    stage_folder = tempfile.mkdtemp(
+        prefix='SRUM.stage.',
+        dir=options.stage_folder
+    )
+    
+    staged_paths = {}
+    try:
+        for name in ['srum_db','software_hive']:
+            path = getattr(options,name)
+            staged_path = os.path.join(
+                stage_folder,
+                u'{}_{}'.format(name,os.path.basename(path))
+            )
+            
+            start = time.time()
+            with open(path,'rb') as source,open(staged_path,'wb') as destination:
+                shutil.copyfileobj(source,destination,16 * 1024 * 1024)
+            if metrics is not None:
+                metrics.AddStage(
+                    'stage',
+                    path,
+                    time.time() - start,
+                    size=PerformanceMetrics.GetFileSize(staged_path)
+                )
+            
+            logging.info(u'Staged {} as {}'.format(path,staged_path))
+            staged_paths[name] = staged_path
+    except:
+        shutil.rmtree(stage_folder,ignore_errors=True)
+        raise
+    
+    #Only point the options at the copies once both were staged#
+    for name,staged_path in staged_paths.items():
+        setattr(options,name,staged_path)
+    
+    return stage_folder
+
+def ConvertSrum(options,db_handler,metrics=None):
+    '''Convert the SOFTWARE hive and the SRUM database of a host
+    
+    Args:
+        options: The processing options (software_hive, srum_db, ...)
+        db_handler: The DbHandler of the output database
+        metrics: Optional PerformanceMetrics to record stage timings in
+    Returns:
+        srum_handler: The SrumHandler that converted the SRUM database'''
+    #Enumerate Registry Here#
+    rhandler = RegistryHandler(
+        options,
+        db_handler=db_handler
+    )
+    start = time.time()
+    rhandler.EnumerateRegistryValues(
+        metrics=metrics
+    )
+    if metrics is not None:
+        metrics.AddStage(
+            'registry',
+            options.software_hive,
+            time.time() - start,
+            rows=rhandler.profile_count,
+            size=PerformanceMetrics.GetFileSize(options.software_hive),
+            details={'cache_hit':rhandler.cache_hit}
+        )
+    guid_table = rhandler.GetGuidTable()
+    
+    srum_handler = SrumHandler(
+        options,
+        guid_table=guid_table,
+        db_handler=db_handler,
+        metrics=metrics
+    )
+    srum_handler.ConvertDb()
+    
+    return srum_handler
+
+#Epochs of the timestamp formats#
+OLE_EPOCH = datetime.datetime(1899,12,30,0,0,0)
+FILETIME_EPOCH = datetime.datetime(1601,1,1)
+UNIX_EPOCH = datetime.datetime(1970,1,1)
+#Largest FILETIME (in microseconds) that fits in a datetime#
+FILETIME_MAX_MICROSECONDS = (
+    (datetime.datetime.max - FILETIME_EPOCH).days * 86400000000 +
+    (datetime.datetime.max - FILETIME_EPOCH).seconds * 1000000 +
+    (datetime.datetime.max - FILETIME_EPOCH).microseconds
+)
+
+def GetOleTimeStamp(raw_timestamp):
+    '''Return Datetime from raw OleTimestamp'''
+    timestamp = struct.unpack(
+        "d",
+        raw_timestamp
+    )[0]
+    
+    timeDelta = datetime.timedelta(days=timestamp)
+    
+    new_datetime = OLE_EPOCH + timeDelta
+  
+    #new_datetime = new_datetime.strftime("%Y-%m-%d %H:%M:%S.%f")
+    
+    return new_datetime
+
+def GetWinTimeStamp(raw_timestamp):
+    '''Return Datetime from raw Win32Timestamp'''
+    timestamp = struct.unpack(
+        "Q",
+        raw_timestamp
+    )[0]
+    
+    microsecs, _ = divmod(
+        timestamp,
+        10
+    )
+    
+    timeDelta = datetime.timedelta(
+        microseconds=microsecs
+    )
+    
+    new_datetime = FILETIME_EPOCH + timeDelta
+    #new_datetime = new_datetime.strftime("%Y-%m-%d %H:%M:%S.%f")
+    
+    return new_datetime
+
+def GetOleDays(value):
+    '''Return the raw OleTimestamp value (days since 1899-12-30) of a
+    datetime'''
+    delta = value - OLE_EPOCH
+    return delta.days + (delta.seconds + delta.microseconds / 1000000.0) / 86400.0
+
+def _UnpackColumn(raw_timestamps,format_char):
+    '''Unpack the 8 byte values of a column chunk in one call
+    
+    Returns:
+        values: A tuple of the unpacked values in the order of the non None
+        raw values or None if a value is not 8 bytes long'''
+    present = [raw for raw in raw_timestamps if raw is not None]
+    if any(len(raw) != 8 for raw in present):
+        return None
+    
+    return struct.unpack(
+        '{}{}'.format(len(present),format_char),
+        ''.join(present)
+    )
+
+def _MergeColumn(raw_timestamps,values):
+    '''Put decoded values back in place of the non None raw values'''
+    values = iter(values)
+    return [None if raw is None else next(values) for raw in raw_timestamps]
+
+def GetOleTimeStamps(raw_timestamps):
+    '''Batch version of GetOleTimeStamp for a column chunk.
+    
+    The chunk is unpacked in one call. The float days to microseconds
+    rounding has to match timedelta exactly, so every distinct value (a
+    provider table has one TimeStamp per collection interval) is converted
+    once with the same arithmetic as GetOleTimeStamp.
+    
+    Args:
+        raw_timestamps: A list of raw 8 byte values or None
+    Returns:
+        values: A list of datetimes (None for None)'''
+    values = _UnpackColumn(raw_timestamps,'d')
+    if values is None:
+        return [None if raw is None else GetOleTimeStamp(raw) for raw in raw_timestamps]
+    
+    converted = {}
+    datetimes = []
+    for value in values:
+        if value not in converted:
+            converted[value] = OLE_EPOCH + datetime.timedelta(days=value)
+        datetimes.append(converted[value])
+    
+    return _MergeColumn(raw_timestamps,datetimes)
+
+def GetWinTimeStamps(raw_timestamps):
+    '''Batch version of GetWinTimeStamp for a column chunk.
+    
+    The FILETIME to microseconds conversion is integer arithmetic, so with
+    NumPy the whole chunk is converted with datetime64 arithmetic. Without
+    NumPy, or if a value does not fit in a datetime, every distinct value
+    is converted once with GetWinTimeStamp.
+    
+    Args:
+        raw_timestamps: A list of raw 8 byte values or None
+    Returns:
+        values: A list of datetimes (None for None)'''
+    values = _UnpackColumn(raw_timestamps,'Q')
+    if values is None:
+        return [None if raw is None else GetWinTimeStamp(raw) for raw in raw_timestamps]
+    
+    if numpy is not None and len(values):
+        microseconds = numpy.array(values,dtype=numpy.uint64) // 10
+        if microseconds.max() <= FILETIME_MAX_MICROSECONDS:
+            datetimes = (
+                numpy.datetime64(FILETIME_EPOCH,'us') +
+                microseconds.astype('timedelta64[us]')
+            ).astype(object).tolist()
+            return _MergeColumn(raw_timestamps,datetimes)
+    
+    converted = {}
+    datetimes = []
+    for value in values:
+        if value not in converted:
+            converted[value] = FILETIME_EPOCH + datetime.timedelta(
+                microseconds=value // 10
+            )
+        datetimes.append(converted[value])
+    
+    return _MergeColumn(raw_timestamps,datetimes)
+
+def GetEpochMicroseconds(values):
+    '''Convert datetimes to integer microseconds since 1970
+    
+    Args:
+        values: A list of datetimes or None
+    Returns:
+        values: A list of integers (None for None)'''
+    epoch_values = []
+    for value in values:
+        if value is None:
+            epoch_values.append(None)
+            continue
+        
+        delta = value - UNIX_EPOCH
+        epoch_values.append(
+            (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+        )
+    
+    return epoch_values
+
+def GetEpochSecondsSql(column):
+    '''SQL expression for the whole seconds (rounded down) of an epoch
+    microseconds column'''
+    return u'("{0}" - ((("{0}" % 1000000) + 1000000) % 1000000)) / 1000000'.format(
+        column
+    )
+
+def GetEpochDatetimeSql(column):
+    '''SQL expression that formats an epoch microseconds column the same way
+    datetime values are stored as text ('YYYY-MM-DD HH:MM:SS[.ffffff]')'''
+    microseconds = u'((("{0}" % 1000000) + 1000000) % 1000000)'.format(column)
+    return (
+        u"datetime({seconds}, 'unixepoch') || "
+        u"CASE WHEN {microseconds} = 0 THEN '' "
+        u"ELSE '.' || substr('00000' || {microseconds}, -6) END"
+    ).format(
+        seconds=GetEpochSecondsSql(column),
+        microseconds=microseconds
+    )
+
+def GetTemplateFolder(template_folder=None):
+    '''Get the template folder. If no template folder was supplied, check
+    source for default templates.
+    
+    Args:
+        template_folder: The --template_folder option
+    Returns:
+        template_folder: The folder or None if the default templates can not
+        be found, in which case no template indexes or reports are created'''
+    if template_folder:
+        return template_folder
+    
+    if getattr(sys,'frozen',False):
+        location = os.path.join(sys._MEIPASS,'xlsx_templates')
+    else:
+        try:
+            location = pkg_resources.resource_filename(
+                'xlsx_templates',
+                ''
+            )
+        except ImportError as error:
+            logging.warning(u'Default templates not found ({}), use --template_folder'.format(error))
+            return None
+    
+    location = os.path.abspath(location)
+    if not os.path.isdir(location):
+        logging.warning(u'Default template folder {} not found, use --template_folder'.format(location))
+        return None
+    
+    return location
+
+def GetTemplates(template_folder):
+    '''Yield the YAML templates in a template folder
+    
+    Args:
+        template_folder: The folder that contains YML templates
+    Yields:
+        (filename, template): The template file name and its parsed content'''
+    if not template_folder or not os.path.isdir(template_folder):
+        return
+    
+    for filename in sorted(os.listdir(template_folder)):
+        if not filename.lower().endswith(('.yml','.yaml')):
+            continue
+        
+        with open(os.path.join(template_folder,filename),'rb') as fh:
+            template = yaml.safe_load(fh)
+        
+        if isinstance(template,dict):
+            yield filename,template
+
+def GetWorksheetQuery(attributes,table_names):
+    '''Get the query of a records worksheet. A worksheet can have a
+    rollup_query over the RollupHandler tables it lists in rollup_tables,
+    which is used instead of sql_query when the database has all of them.
+    
+    Args:
+        attributes: The attributes of the worksheet
+        table_names: The table names of the database
+    Returns:
+        sql_query: The query to run'''
+    rollup_tables = attributes.get('rollup_tables') or []
+    if attributes.get('rollup_query') and rollup_tables:
+        existing = set(name.lower() for name in table_names)
+        if all(name.lower() in existing for name in rollup_tables):
+            return attributes['rollup_query']
+    
+    return attributes['sql_query']
+
+def GetPeakRss():
+    '''Get the peak resident set size in MB of this process and its
+    finished workers, or None where the resource module is not available'''
+    if resource is None:
+        return None
+    
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    #ru_maxrss is bytes on OSX and KB elsewhere#
+    if sys.platform == 'darwin':
+        return peak / (1024.0 * 1024.0)
+    
+    return peak / 1024.0
+
+class PerformanceMetrics():
+    '''Stage timings of a run, written to the --metrics_file as JSON'''
+    def __init__(self,command=None):
+        '''Create a PerformanceMetrics
+        
+        Args:
+            command: The sub-command being run'''
+        self.command = command
+        self.start = time.time()
+        self.stages = []
+    
+    def AddStage(self,stage,name,elapsed,rows=None,size=None,details=None):
+        '''Record a finished stage
+        
+        Args:
+            stage: The kind of stage (registry, table, merge, worksheet, report)
+            name: What the stage processed, e.g. the table name
+            elapsed: The seconds the stage took
+            rows: Optional number of rows processed
+            size: Optional number of bytes read or written
+            details: Optional dict of extra values, e.g. {part:seconds}'''
+        info = {
+            'stage':stage,
+            'name':name,
+            'elapsed':elapsed,
+            'rows':rows,
+            'bytes':size
+        }
+        if rows is not None and elapsed > 0:
+            info['records_per_sec'] = rows / elapsed
+        if details:
+            info.update(details)
+        
+        self.stages.append(info)
+    
+    @staticmethod
+    def TimeIterator(iterable,timings,key):
+        '''Yield the items of an iterable, adding the seconds spent waiting
+        on it to timings[key]'''
+        next_item = iter(iterable).next
+        while True:
+            start = time.time()
+            try:
+                item = next_item()
+            finally:
+                timings[key] = timings.get(key,0.0) + time.time() - start
+            yield item
+    
+    @staticmethod
+    def GetFileSize(path):
+        '''Get the size of a file, 0 if it does not exist'''
+        if path and os.path.isfile(path):
+            return os.path.getsize(path)
+        
+        return 0
+    
+    def Write(self,metrics_file):
+        '''Write the stages and the totals of the run to a JSON file'''
+        with open(metrics_file,'wb') as fh:
+            json.dump({
+                'version':__VERSION__,
+                'command':self.command,
+                'elapsed':time.time() - self.start,
+                'peak_rss_mb':GetPeakRss(),
+                'stages':self.stages
+            },fh,indent=4)
+        
+        logging.info(u'Wrote metrics to {}'.format(metrics_file))
+
+class IndexHandler():
+    '''Creates the indexes and statistics that report queries rely on'''
+    #Join and group keys used by the report templates#
+    INDEX_COLUMNS = [
+        'AppId',
+        'UserId',
+        'TimeStamp',
+        'IdIndex',
+        'ProfileIndex',
+        'L2ProfileId',
+        'Basename',
+        'Basename2',
+        'HostId'
+    ]
+    #Name columns derived from IdBlob once so reports do not call#
+    #basename()/BasenameN() for every joined row. {column:components}#
+    ID_MAP_NAME_COLUMNS = [
+        ('Basename',1),
+        ('Basename2',2)
+    ]
+    
+    def __init__(self,db_handler,template_folder=None):
+        '''Create an IndexHandler
+        
+        Args:
+            db_handler: The DbHandler of the database to index
+            template_folder: Optional folder of templates that declare indexes'''
+        self.db_handler = db_handler
+        self.template_folder = template_folder
+    
+    def GetIndexDefinitions(self,default_indexes=True):
+        '''Get the indexes to create
+        
+        Args:
+            default_indexes: Include an index for every INDEX_COLUMNS column
+        Returns:
+            definitions: A list of (table, [columns]) tuples'''
+        definitions = []
+        table_names = self.db_handler.GetTableNames()
+        
+        if default_indexes:
+            for table_name in table_names:
+                columns = self.db_handler.GetColumnNames(table_name)
+                for column in IndexHandler.INDEX_COLUMNS:
+                    if column in columns:
+                        definitions.append((table_name,[column]))
+        
+        #Templates can declare indexes with:#
+        #indexes:#
+        #  - table: 'WindowsNetworkDataUsageMonitor'#
+        #    columns: ['AppId','L2ProfileId']#
+        for filename,template in GetTemplates(self.template_folder):
+            for index in template.get('indexes') or []:
+                table_name = index['table']
+                #Index the table behind an epoch timestamp view#
+                if table_name + EPOCH_TABLE_SUFFIX in table_names:
+                    table_name = table_name + EPOCH_TABLE_SUFFIX
+                
+                if table_name not in table_names:
+                    logging.warning(u'{}: no table {} to index'.format(
+                        filename,index['table']
+                    ))
+                    continue
+                
+                columns = self.db_handler.GetColumnNames(table_name)
+                missing = [column for column in index['columns'] if column not in columns]
+                if missing:
+                    logging.warning(u'{}: no column {} in {} to index'.format(
+                        filename,', '.join(missing),index['table']
+                    ))
+                    continue
+                definitions.append((table_name,list(index['columns'])))
+        
+        return definitions
+    
+    def BuildIndexes(self,default_indexes=True):
+        '''Create missing name columns and indexes and refresh the query
+        planner statistics
+        
+        Args:
+            default_indexes: Include an index for every INDEX_COLUMNS column
+        Returns:
+            created: The number of indexes created'''
+        self.CreateIdMapNameColumns()
+        
+        created = 0
+        for table_name,columns in self.GetIndexDefinitions(default_indexes=default_indexes):
+            if self.db_handler.CreateIndex(table_name,columns):
+                logging.info(u'Created index on {} ({})'.format(
+                    table_name,', '.join(columns)
+                ))
+                created += 1
+        
+        if created or default_indexes:
+            self.db_handler.Analyze()
+        
+        return created
+    
+    def CreateIdMapNameColumns(self):
+        '''Add the ID_MAP_NAME_COLUMNS to SruDbIdMapTable. Each distinct IdBlob
+        is only split once. Databases converted before the columns existed
+        get them here when they are indexed for a report or an export.'''
+        if 'SruDbIdMapTable' not in self.db_handler.GetTableNames():
+            return
+        
+        for column,components in IndexHandler.ID_MAP_NAME_COLUMNS:
+            self.db_handler.AddColumn(
+                'SruDbIdMapTable',
+                column,
+                'TEXT'
+            )
+        
+        #Only rows added since the last run (--append) have no names yet#
+        names = {}
+        rows = []
+        for rowid,id_blob in self.db_handler.FetchAll(
+                u"SELECT rowid, IdBlob FROM 'SruDbIdMapTable' WHERE \"{}\" IS NULL".format(
+                    IndexHandler.ID_MAP_NAME_COLUMNS[0][0]
+                )):
+            if id_blob not in names:
+                names[id_blob] = tuple(
+                    BasenameN(id_blob,components)
+                    for column,components in IndexHandler.ID_MAP_NAME_COLUMNS
+                )
+            rows.append(names[id_blob] + (rowid,))
+        
+        self.db_handler.ExecuteMany(
+            u"UPDATE 'SruDbIdMapTable' SET {} WHERE rowid = ?".format(
+                ', '.join(
+                    u"'{}' = ?".format(column)
+                    for column,components in IndexHandler.ID_MAP_NAME_COLUMNS
+                )
+            ),
+            rows
+        )
+
+class RollupHandler():
+    '''Builds pre-aggregated time bucket tables over the provider tables so
+    reports can read thousands of rows instead of millions.
+    
+    For every source table three tables are created:
+        <table>_Hourly: per AppId/UserId/hour sums
+        <table>_Daily: per AppId/UserId/day sums
+        <table>_Total: per AppId/UserId sums with first and last hour seen
+    The source table is scanned once; the daily and total tables are built
+    from the hourly table.'''
+    #Source table: columns to sum#
+    ROLLUP_TABLES = {
+        'ApplicationResourceUsageProvider':[
+            'ForegroundCycleTime',
+            'BackgroundCycleTime',
+            'FaceTime',
+            'ForegroundContextSwitches',
+            'BackgroundContextSwitches',
+            'ForegroundBytesRead',
+            'ForegroundBytesWritten',
+            'ForegroundNumReadOperations',
+            'ForegroundNumWriteOperations',
+            'ForegroundNumberOfFlushes',
+            'BackgroundBytesRead',
+            'BackgroundBytesWritten',
+            'BackgroundNumReadOperations',
+            'BackgroundNumWriteOperations',
+            'BackgroundNumberOfFlushes'
+        ],
+        'WindowsNetworkDataUsageMonitor':[
+            'BytesSent',
+            'BytesRecvd'
+        ]
+    }
+    #Columns every rollup is grouped by#
+    KEY_COLUMNS = [
+        'AppId',
+        'UserId'
+    ]
+    
+    def __init__(self,db_handler):
+        '''Create a RollupHandler
+        
+        Args:
+            db_handler: The DbHandler of the converted database'''
+        self.db_handler = db_handler
+    
+    def BuildRollups(self):
+        '''(Re)build the rollup tables for every source table in the database'''
+        table_names = self.db_handler.GetTableNames()
+        for table_name in sorted(RollupHandler.ROLLUP_TABLES):
+            epoch = table_name + EPOCH_TABLE_SUFFIX in table_names
+            if epoch:
+                source_table = table_name + EPOCH_TABLE_SUFFIX
+            elif table_name in table_names:
+                source_table = table_name
+            else:
+                continue
+            
+            columns = self.db_handler.GetColumnNames(source_table)
+            sum_columns = [
+                column for column in RollupHandler.ROLLUP_TABLES[table_name]
+                if column in columns
+            ]
+            
+            print 'Building Rollups for {}'.format(table_name)
+            
+            for statement in RollupHandler.GetRollupStatements(table_name,sum_columns,epoch=epoch):
+                self.db_handler.Execute(statement)
+    
+    @staticmethod
+    def GetRollupStatements(table_name,sum_columns,epoch=False):
+        '''Get the statements that build the rollup tables for a table
+        
+        Args:
+            table_name: The source table
+            sum_columns: The columns to sum
+            epoch: The TimeStamps are epoch microseconds in <table>_Epoch
+        Returns:
+            statements: A list of SQL statements'''
+        if epoch:
+            source_table = table_name + EPOCH_TABLE_SUFFIX
+            bucket = u"strftime('%Y-%m-%d %H:00:00', {}, 'unixepoch')".format(
+                GetEpochSecondsSql('TimeStamp')
+            )
+        else:
+            source_table = table_name
+            bucket = u"strftime('%Y-%m-%d %H:00:00', TimeStamp)"
+        
+        keys = ', '.join(u'"{}"'.format(column) for column in RollupHandler.KEY_COLUMNS)
+        sums = ''.join(
+            u', SUM("{0}") AS "{0}"'.format(column) for column in sum_columns
+        )
+        hourly = u'{}_Hourly'.format(table_name)
+        daily = u'{}_Daily'.format(table_name)
+        total = u'{}_Total'.format(table_name)
+        
+        statements = []
+        for rollup in [hourly,daily,total]:
+            statements.append(u"DROP TABLE IF EXISTS '{}'".format(rollup))
+        
+        statements.append(
+            u"CREATE TABLE '{hourly}' AS SELECT {keys}, "
+            u"{bucket} AS \"TimeBucket\", "
+            u"COUNT(*) AS \"RecordCount\"{sums} "
+            u"FROM '{table}' GROUP BY {keys}, \"TimeBucket\"".format(
+                hourly=hourly,keys=keys,bucket=bucket,sums=sums,table=source_table
+            )
+        )
+        statements.append(
+            u"CREATE TABLE '{daily}' AS SELECT {keys}, "
+            u"substr(TimeBucket, 1, 10) AS \"TimeBucket\", "
+            u"SUM(RecordCount) AS \"RecordCount\"{sums} "
+            u"FROM '{hourly}' GROUP BY {keys}, substr(TimeBucket, 1, 10)".format(
+                daily=daily,keys=keys,sums=sums,hourly=hourly
+            )
+        )
+        statements.append(
+            u"CREATE TABLE '{total}' AS SELECT {keys}, "
+            u"MIN(TimeBucket) AS \"FirstTimeBucket\", MAX(TimeBucket) AS \"LastTimeBucket\", "
+            u"SUM(RecordCount) AS \"RecordCount\"{sums} "
+            u"FROM '{hourly}' GROUP BY {keys}".format(
+                total=total,keys=keys,sums=sums,hourly=hourly
+            )
+        )
+        
+        return statements
+
+class BatchHandler():
+    '''Converts the SRUM databases of many hosts into one case database.
+    
+    Every host is converted into its own database in a pool of worker
+    processes and then merged into the case database with a HostId column
+    added to every table. Ids that only mean something within a host
+    (SruDbIdMapTable IdIndex, the AppId/UserId that reference it and the
+    WLAN profile ids) are namespaced as HostNumber << 32 + id, so the joins
+    in the report templates stay within a host. Hosts that fail are recorded
+    in SrumMonkeyHosts and reported at the end without stopping the run.'''
+    HOSTS_TABLE = 'SrumMonkeyHosts'
+    HOSTS_MAPPING = {
+        'HostNumber':'INTEGER',
+        'HostId':'TEXT',
+        'SrumDb':'TEXT',
+        'SoftwareHive':'TEXT',
+        'Status':'TEXT',
+        'Error':'TEXT'
+    }
+    HOSTS_COLUMNS = [
+        'HostNumber',
+        'HostId',
+        'SrumDb',
+        'SoftwareHive',
+        'Status',
+        'Error'
+    ]
+    #Columns holding ids that are only unique within a host#
+    NAMESPACED_COLUMNS = [
+        'IdIndex',
+        'AppId',
+        'UserId',
+        'ProfileIndex',
+        'L2ProfileId'
+    ]
+    
+    def __init__(self,options,db_handler):
+        '''Create a BatchHandler
+        
+        Args:
+            options: The batch options
+            db_handler: The DbHandler of the case database'''
+        self.options = options
+        self.db_handler = db_handler
+        self.workers = options.workers
+        #Views to create over epoch tables {view:(table,timestamp_columns)}#
+        self.timestamp_views = {}
+        #[(host_id, error)]#
+        self.failed = []
+    
+    def GetHosts(self):
+        '''Get the hosts to process from the manifest or the input folder
+        
+        Returns:
+            hosts: A list of (host_id, srum_db, software_hive) tuples. A path
+            is None if it is missing.'''
+        hosts = []
+        if self.options.manifest:
+            manifest_folder = os.path.dirname(os.path.abspath(self.options.manifest))
+            with open(self.options.manifest,'rb') as fh:
+                for row in csv.reader(fh):
+                    row = [value.strip().decode('utf-8') for value in row]
+                    if not row or not row[0] or row[0].startswith('#'):
+                        continue
+                    
+                    host_id,srum_db,software_hive = (row + [u'',u''])[:3]
+                    hosts.append((
+                        host_id,
+                        os.path.join(manifest_folder,srum_db) if srum_db else None,
+                        os.path.join(manifest_folder,software_hive) if software_hive else None
+                    ))
+        else:
+            for host_id in sorted(os.listdir(self.options.input_folder)):
+                host_folder = os.path.join(self.options.input_folder,host_id)
+                if not os.path.isdir(host_folder):
+                    continue
+                
+                files = {}
+                for root,dirs,filenames in os.walk(host_folder):
+                    for filename in sorted(filenames):
+                        files.setdefault(
+                            filename.lower(),
+                            os.path.join(root,filename)
+                        )
+                hosts.append((
+                    host_id,
+                    files.get('srudb.dat'),
+                    files.get('software')
+                ))
+        
+        return hosts
+    
+    def ProcessHosts(self):
+        '''Convert every host and merge it into the case database
+        
+        Returns:
+            failed: A list of (host_id, error) of the hosts that failed'''
+        self.db_handler.CreateTableFromMapping(
+            BatchHandler.HOSTS_TABLE,
+            BatchHandler.HOSTS_MAPPING,
+            None,
+            BatchHandler.HOSTS_COLUMNS
+        )
+        
+        hosts = self.GetHosts()
+        host_folder = tempfile.mkdtemp(
+            prefix='SRUM.hosts.',
+            dir=os.path.dirname(os.path.abspath(self.options.output_db))
+        )
+        
+        try:
+            tasks = []
+            seen = set()
+            for host_number,(host_id,srum_db,software_hive) in enumerate(hosts,1):
+                error = None
+                if host_id in seen:
+                    error = u'Duplicate host id'
+                elif srum_db is None or not os.path.isfile(srum_db):
+                    error = u'SRUM database not found: {}'.format(srum_db)
+                elif software_hive is None or not os.path.isfile(software_hive):
+                    error = u'SOFTWARE hive not found: {}'.format(software_hive)
+                seen.add(host_id)
+                
+                if error is not None:
+                    self._RecordHost(host_number,host_id,srum_db,software_hive,error)
+                    continue
+                
+                tasks.append((
+                    self.options,
+                    host_number,
+                    host_id,
+                    srum_db,
+                    software_hive,
+                    os.path.join(host_folder,'{}.db'.format(host_number))
+                ))
+            
+            if self.workers > 1:
+                pool = multiprocessing.Pool(
+                    processes=self.workers
+                )
+                try:
+                    self._MergeHosts(
+                        pool.imap_unordered(ConvertHostDb,tasks)
+                    )
+                    pool.close()
+                finally:
+                    pool.terminate()
+                    pool.join()
+            else:
+                self._MergeHosts(
+                    itertools.imap(ConvertHostDb,tasks)
+                )
+        finally:
+            shutil.rmtree(host_folder,ignore_errors=True)
+        
+        for view_name,(table_name,timestamp_columns) in sorted(self.timestamp_views.items()):
+            self.db_handler.CreateTimestampView(
+                view_name,
+                table_name,
+                timestamp_columns
+            )
+        
+        print 'Processed {} hosts, {} failed'.format(
+            len(hosts),
+            len(self.failed)
+        )
+        for host_id,error in self.failed:
+            logging.error(u'Host {} failed: {}'.format(host_id,error))
+        
+        return self.failed
+    
+    def _MergeHosts(self,results):
+        '''Merge host databases into the case database as they finish
+        
+        Args:
+            results: An iterator of ConvertHostDb results'''
+        for host_number,host_id,srum_db,software_hive,host_db,timestamp_views,error in results:
+            if error is None:
+                try:
+                    self._MergeHost(host_number,host_id,host_db)
+                    self.timestamp_views.update(timestamp_views)
+                    print 'Merged Host {}'.format(host_id)
+                except Exception as merge_error:
+                    error = u'Merge failed: {}'.format(merge_error)
+            
+            self._RecordHost(host_number,host_id,srum_db,software_hive,error)
+            if os.path.isfile(host_db):
+                os.remove(host_db)
+    
+    def _MergeHost(self,host_number,host_id,host_db):
+        '''Merge a host database into the case database
+        
+        Args:
+            host_number: The number of the host, used to namespace ids
+            host_id: The id of the host
+            host_db: The path of the host database'''
+        host_db_handler = DbHandler(
+            DbConfig(
+                dbname=host_db,
+                read_only=True
+            )
+        )
+        table_names = [
+            table_name for table_name in host_db_handler.GetTableNames()
+            if table_name not in SrumHandler.METADATA_TABLES
+        ]
+        case_table_names = self.db_handler.GetTableNames()
+        
+        #Hosts can have different columns for the same table#
+        for table_name in table_names:
+            field_order,field_mapping = host_db_handler.GetFieldMapping(
+                table_name
+            )
+            if table_name not in case_table_names:
+                field_mapping['HostId'] = 'TEXT'
+                self.db_handler.CreateTableFromMapping(
+                    table_name,
+                    field_mapping,
+                    None,
+                    ['HostId'] + field_order
+                )
+            else:
+                for column in field_order:
+                    self.db_handler.AddColumn(
+                        table_name,
+                        column,
+                        field_mapping[column]
+                    )
+        
+        namespace = host_number << 32
+        self.db_handler.MergeDatabase(
+            host_db,
+            table_names,
+            extra_values=[('HostId',host_id)],
+            column_expressions=dict(
+                (column,u'{{0}} + {}'.format(namespace))
+                for column in BatchHandler.NAMESPACED_COLUMNS
+            )
+        )
+    
+    def _RecordHost(self,host_number,host_id,srum_db,software_hive,error):
+        '''Record the outcome of a host in the hosts table'''
+        if error is not None:
+            self.failed.append((host_id,error))
+        
+        self.db_handler.InsertFromIterator(
+            BatchHandler.HOSTS_TABLE,
+            [(
+                host_number,
+                host_id,
+                srum_db,
+                software_hive,
+                u'Failed' if error is not None else u'Processed',
+                error
+            )],
+            BatchHandler.HOSTS_COLUMNS
+        )
+
+def ConvertHostDb(task):
+    '''Convert the SOFTWARE hive and SRUM database of one host into a host
+    database. Runs in a worker process; errors are returned, not raised.
+    
+    Args:
+        task: (options, host_number, host_id, srum_db, software_hive,
+            host database path)
+    Returns:
+        (host_number, host_id, srum_db, software_hive, host_db,
+        timestamp_views, error): error is None if the host was converted'''
+    options,host_number,host_id,srum_db,software_hive,host_db = task
+    
+    print u'Processing Host {}'.format(host_id)
+    
+    host_options = copy.copy(options)
+    host_options.srum_db = srum_db
+    host_options.software_hive = software_hive
+    host_options.output_db = host_db
+    host_options.workers = 1
+    host_options.split_records = DEFAULT_SPLIT_RECORDS
+    host_options.append = False
+    host_options.resume = False
+    
+    #Host databases are temporary so durability does not matter#
+    db_handler = DbHandler(
+        DbConfig(
+            dbname=host_db
+        )
+    )
+    db_handler.BeginBulkLoad()
+    stage_folder = None
+    try:
+        if options.stage_folder:
+            stage_folder = StageInputs(
+                host_options
+            )
+        
+        srum_handler = ConvertSrum(
+            host_options,
+            db_handler
+        )
+        timestamp_views = srum_handler.timestamp_views
+        error = None
+    except Exception as convert_error:
+        logging.debug(traceback.format_exc())
+        timestamp_views = {}
+        error = u'{}: {}'.format(type(convert_error).__name__,convert_error)
+    finally:
+        db_handler.EndBulkLoad()
+        if stage_folder is not None:
+            shutil.rmtree(stage_folder,ignore_errors=True)
+    
+    return host_number,host_id,srum_db,software_hive,host_db,timestamp_views,error
+
+class ReportHandler():
+    '''Creates XLSX reports from the YAML templates in a template folder'''
+    def __init__(self,template_folder,workers=1,query_cache_size=0,metrics=None):
+        '''Create a ReportHandler
+        
+        Args:
+            template_folder: The folder that contains YML templates
+            workers: The maximum number of templates to run at the same time
+            query_cache_size: The query result cache size in bytes. 0 disables
+                the cache.
+            metrics: Optional PerformanceMetrics to record stage timings in'''
+        self.template_folder = template_folder
+        self.workers = workers
+        self.query_cache_size = query_cache_size
+        self.metrics = metrics
+    
+    def CreateReports(self,db_path,outpath):
+        '''Create a workbook for every template. With more than one worker
+        the templates are farmed out to a process pool where each worker
+        opens its own read-only connection.
+        
+        Args:
+            db_path: The SrumMonkey database to report on
+            outpath: The folder to write the workbooks to
+        Raises:
+            Exception: A report failed. The other reports are still created.'''
+        if not os.path.isdir(outpath):
+            os.makedirs(outpath)
+        
+        tasks = []
+        for filename,template in GetTemplates(self.template_folder):
+            tasks.append((
+                os.path.join(self.template_folder,filename),
+                db_path,
+                outpath,
+                self.query_cache_size,
+                self.metrics is not None
+            ))
+        
+        workers = min(self.workers,len(tasks))
+        if workers > 1:
+            pool = multiprocessing.Pool(
+                processes=workers
+            )
+            try:
+                results = pool.imap_unordered(
+                    CreateTemplateReport,
+                    tasks
+                )
+                failed = self._ReportProgress(results,len(tasks))
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            failed = self._ReportProgress(
+                (CreateTemplateReport(task) for task in tasks),
+                len(tasks)
+            )
+        
+        if failed:
+            raise Exception(u'{} of {} reports failed'.format(
+                failed,len(tasks)
+            ))
+    
+    def _ReportProgress(self,results,total):
+        '''Print the result of every report as it finishes
+        
+        Returns:
+            failed: The number of reports that failed'''
+        failed = 0
+        for done,(filename,elapsed,error,stages) in enumerate(results,1):
+            if self.metrics is not None:
+                self.metrics.stages.extend(stages)
+            
+            if error is not None:
+                logging.error(u'Report {} failed: {}'.format(filename,error))
+                failed += 1
+            else:
+                print 'Finished Report {} in {:.2f}s [{}/{}]'.format(
+                    filename,elapsed,done,total
+                )
+        
+        return failed
+
+class XlsxTemplateReport():
+    '''A workbook defined by a YAML template'''
+    #Excel's row limit per worksheet, records past it spill to a new worksheet#
+    MAX_ROWS = 1048576
+    #Excel's worksheet name limit#
+    MAX_NAME_LENGTH = 31
+    
+    def __init__(self,template_path):
+        '''Create an XlsxTemplateReport
+        
+        Args:
+            template_path: The YML template file'''
+        self.template_path = template_path
+        with open(template_path,'rb') as fh:
+            self.template = yaml.safe_load(fh)
+    
+    def CreateReport(self,db_handler,outpath,query_cache=None,metrics=None):
+        '''Run the worksheet queries of the template and write the workbook.
+        The workbook is written to a .part file that only replaces the
+        workbook once every worksheet was written.
+        
+        Args:
+            db_handler: The DbHandler of the database to report on
+            outpath: The folder to write the workbook to
+            query_cache: Optional QueryCache for the worksheet queries
+            metrics: Optional PerformanceMetrics to record worksheet timings in'''
+        self.query_cache = query_cache
+        self.metrics = metrics
+        #Worksheets with a rollup_query use it if the rollup tables exist#
+        self.table_names = db_handler.GetTableNames()
+        report_file = os.path.join(outpath,self.template['workbook_name'])
+        partial_file = report_file + '.part'
+        #Rows are streamed to temp files instead of being held in memory#
+        workbook = xlsxwriter.Workbook(
+            partial_file,
+            {'constant_memory':True}
+        )
+        
+        #Worksheet info used to resolve {Sheet[EndRow]} in chart series#
+        sheet_info = {}
+        try:
+            try:
+                for worksheet_template in self.template.get('worksheets') or []:
+                    worksheet_name = worksheet_template['worksheet_name']
+                    worksheet_type = worksheet_template.get('worksheet_type')
+                    attributes = worksheet_template.get('attributes') or {}
+                    
+                    if worksheet_type == 'records':
+                        sheet_info.update(self._WriteRecords(
+                            workbook,
+                            worksheet_name,
+                            attributes,
+                            db_handler
+                        ))
+                    elif worksheet_type == 'chart':
+                        self._WriteChart(
+                            workbook,
+                            worksheet_name,
+                            attributes,
+                            sheet_info
+                        )
+                    else:
+                        logging.error(u'Unknown worksheet_type {} for worksheet {}'.format(
+                            worksheet_type,worksheet_name
+                        ))
+            finally:
+                #Also removes the temp files of the worksheets#
+                workbook.close()
+            
+            if os.path.isfile(report_file):
+                os.remove(report_file)
+            os.rename(partial_file,report_file)
+        finally:
+            if os.path.isfile(partial_file):
+                os.remove(partial_file)
+    
+    def _WriteRecords(self,workbook,worksheet_name,attributes,db_handler):
+        '''Write the results of a worksheet query. Records past the row limit
+        of a worksheet continue on Name_2, Name_3... worksheets.
+        
+        Returns:
+            sheet_info: {name:{'EndRow':row}} for the worksheet and every
+            spill-over worksheet, where row is the last row (1 based) written'''
+        column_formats = {}
+        for index,format_info in (attributes.get('xlsx_column_formats') or {}).items():
+            column_formats[int(index)] = (
+                format_info,
+                workbook.add_format(format_info.get('format') or {})
+            )
+        
+        header_format = workbook.add_format({'bold':True})
+        
+        sql_query = GetWorksheetQuery(
+            attributes,
+            self.table_names
+        )
+        
+        #Time spent running the query and waiting on its rows#
+        timings = {'query':0.0}
+        start = time.time()
+        if self.query_cache is not None:
+            column_names,records = self.query_cache.ExecuteQuery(
+                db_handler,
+                sql_query,
+                label=u'{}/{}'.format(self.template['workbook_name'],worksheet_name)
+            )
+        else:
+            column_names,records = db_handler.ExecuteQuery(
+                sql_query
+            )
+        timings['query'] += time.time() - start
+        if self.metrics is not None:
+            records = PerformanceMetrics.TimeIterator(
+                records,
+                timings,
+                'query'
+            )
+        
+        sheet_info = {}
+        record_count = 0
+        sheet_name = worksheet_name
+        worksheet = XlsxTemplateReport._AddRecordsWorksheet(
+            workbook,
+            sheet_name,
+            attributes,
+            column_names,
+            header_format
+        )
+        
+        row_num = 0
+        for record in records:
+            if row_num + 1 == XlsxTemplateReport.MAX_ROWS:
+                sheet_info[sheet_name] = {'EndRow':row_num + 1}
+                sheet_name = XlsxTemplateReport._GetSpillName(
+                    worksheet_name,
+                    len(sheet_info) + 1
+                )
+                logging.info(u'{} reached the row limit, continuing on {}'.format(
+                    worksheet_name,sheet_name
+                ))
+                worksheet = XlsxTemplateReport._AddRecordsWorksheet(
+                    workbook,
+                    sheet_name,
+                    attributes,
+                    column_names,
+                    header_format
+                )
+                row_num = 0
+            
+            row_num += 1
+            record_count += 1
+            
+            for col_num,value in enumerate(record):
+                XlsxTemplateReport._WriteCell(
+                    worksheet,
+                    row_num,
+                    col_num,
+                    value,
+                    column_formats.get(col_num)
+                )
+        
+        sheet_info[sheet_name] = {'EndRow':row_num + 1}
+        
+        if self.metrics is not None:
+            elapsed = time.time() - start
+            self.metrics.AddStage(
+                'worksheet',
+                u'{}/{}'.format(self.template['workbook_name'],worksheet_name),
+                elapsed,
+                rows=record_count,
+                details={
+                    'query':timings['query'],
+                    'write':elapsed - timings['query'],
+                    'worksheets':len(sheet_info)
+                }
+            )
+        
+        return sheet_info
+    
+    @staticmethod
+    def _AddRecordsWorksheet(workbook,sheet_name,attributes,column_names,header_format):
+        '''Add a records worksheet with its frozen panes and header row'''
+        worksheet = workbook.add_worksheet(sheet_name)
+        
+        freeze_panes = attributes.get('freeze_panes')
+        if freeze_panes:
+            worksheet.freeze_panes(
+                freeze_panes.get('row',0),
+                freeze_panes.get('col',0)
+            )
+        
+        worksheet.write_row(0,0,column_names,header_format)
+        
+        return worksheet
+    
+    @staticmethod
+    def _GetSpillName(worksheet_name,number):
+        '''Get the name of spill-over worksheet number (2 based), shortening
+        the worksheet name to keep it within Excel's name limit'''
+        suffix = u'_{}'.format(number)
+        return worksheet_name[:XlsxTemplateReport.MAX_NAME_LENGTH - len(suffix)] + suffix
+    
+    @staticmethod
+    def _WriteCell(worksheet,row_num,col_num,value,column_format):
+        if value is None:
+            return
+        
+        if column_format is not None:
+            format_info,cell_format = column_format
+            if format_info.get('column_type') == 'datetime':
+                value = XlsxTemplateReport._GetDatetime(
+                    value,
+                    format_info.get('strptime')
+                )
+            
+            if isinstance(value,datetime.datetime):
+                worksheet.write_datetime(row_num,col_num,value,cell_format)
+            else:
+                worksheet.write(row_num,col_num,value,cell_format)
+        elif isinstance(value,basestring):
+            worksheet.write_string(row_num,col_num,value)
+        elif isinstance(value,(int,long,float)):
+            worksheet.write_number(row_num,col_num,value)
+        elif isinstance(value,(buffer,bytearray)):
+            worksheet.write_string(row_num,col_num,str(value).encode('hex'))
+        else:
+            worksheet.write(row_num,col_num,value)
+    
+    @staticmethod
+    def _GetDatetime(value,strptime):
+        '''Get a datetime from a value using the template strptime format.
+        Fractional seconds are accepted even if the format does not have
+        them. Returns value unchanged if it can not be parsed.'''
+        if not isinstance(value,basestring) or not strptime:
+            return value
+        
+        try:
+            return datetime.datetime.strptime(value,strptime)
+        except ValueError:
+            try:
+                return datetime.datetime.strptime(value,strptime + '.%f')
+            except ValueError:
+                return value
+    
+    def _WriteChart(self,workbook,worksheet_name,attributes,sheet_info):
+        '''Insert a chart whose series reference earlier worksheets'''
+        worksheet = workbook.add_worksheet(worksheet_name)
+        chart = workbook.add_chart(attributes['chart'])
+        
+        for series in attributes.get('series') or []:
+            chart.add_series(
+                XlsxTemplateReport._ResolveReferences(series,sheet_info)
+            )
+        
+        if 'title' in attributes:
+            chart.set_title(attributes['title'])
+        if 'x_axis' in attributes:
+            chart.set_x_axis(attributes['x_axis'])
+        if 'y_axis' in attributes:
+            chart.set_y_axis(attributes['y_axis'])
+        if 'legend' in attributes:
+            chart.set_legend(attributes['legend'])
+        if 'size' in attributes:
+            chart.set_size(attributes['size'])
+        
+        worksheet.insert_chart(
+            attributes.get('insert_cell','A1'),
+            chart
+        )
+    
+    @staticmethod
+    def _ResolveReferences(value,sheet_info):
+        '''Replace {Sheet[EndRow]} references in a chart series'''
+        if isinstance(value,dict):
+            return dict(
+                (key,XlsxTemplateReport._ResolveReferences(item,sheet_info))
+                for key,item in value.items()
+            )
+        elif isinstance(value,list):
+            return [XlsxTemplateReport._ResolveReferences(item,sheet_info) for item in value]
+        elif isinstance(value,basestring):
+            return value.format(**sheet_info)
+        
+        return value
+
+def CreateTemplateReport(task):
+    '''Create the workbook for one template. Runs in a worker process when
+    reports are created in parallel.
+    
+    Args:
+        task: (template path, database path, output folder, query cache size,
+            collect metrics)
+    Returns:
+        (filename, elapsed, error, stages): The template file name, the
+        seconds it took, the error message if it failed and the metrics
+        stages of its worksheets'''
+    template_path,db_path,outpath,query_cache_size,collect_metrics = task
+    filename = os.path.basename(template_path)
+    
+    metrics = None
+    if collect_metrics:
+        metrics = PerformanceMetrics()
+    
+    print 'Creating Report {}'.format(filename)
+    start = time.time()
+    try:
+        report = XlsxTemplateReport(
+            template_path
+        )
+        db_handler = DbHandler(
+            DbConfig(
+                dbname=db_path,
+                read_only=True
+            )
+        )
+        query_cache = None
+        if query_cache_size > 0:
+            query_cache = QueryCache(
+                db_path,
+                query_cache_size
+            )
+        
+        report.CreateReport(
+            db_handler,
+            outpath,
+            query_cache=query_cache,
+            metrics=metrics
+        )
+        
+        if query_cache is not None:
+            logging.info(u'{}: query cache {} hits, {} misses'.format(
+                filename,query_cache.hits,query_cache.misses
+            ))
+        
+        if metrics is not None:
+            metrics.AddStage(
+                'report',
+                filename,
+                time.time() - start,
+                size=PerformanceMetrics.GetFileSize(
+                    os.path.join(outpath,report.template['workbook_name'])
+                )
+            )
+    except Exception as error:
+        return filename,time.time() - start,str(error),metrics.stages if metrics else []
+    
+    return filename,time.time() - start,None,metrics.stages if metrics else []
+
+class QueryCache():
+    '''Caches report query results in a sidecar folder next to the database.
+    
+    An entry is keyed by the normalized query text and a fingerprint of the
+    database file, so a changed database never returns stale results. Least
+    recently used entries are evicted once the folder grows over max_size.
+    
+    Entries are SQLite files with the column names and the rows, which keeps
+    the value types of the results and, unlike pickles, cannot run code when a
+    planted entry is read.'''
+    #Rows inserted into an entry file at a time#
+    CHUNK_ROWS = 5000
+    #Entry file extension#
+    EXTENSION = '.sqlite'
+    #Values an entry can store as they are#
+    VALUE_TYPES = (int,long,float,unicode,str,buffer,type(None))
+    
+    def __init__(self,db_path,max_size):
+        '''Create a QueryCache
+        
+        Args:
+            db_path: The database the queries run against
+            max_size: The maximum size of the cache folder in bytes'''
+        self.cache_folder = db_path + '.qcache'
+        self.max_size = max_size
+        self.fingerprint = QueryCache.GetFingerprint(db_path)
+        self.hits = 0
+        self.misses = 0
+        
+        if not os.path.isdir(self.cache_folder):
+            try:
+                os.makedirs(self.cache_folder)
+            except OSError:
+                #Another report worker created it#
+                pass
+    
+    @staticmethod
+    def GetFingerprint(db_path):
+        '''Fingerprint a SQLite database from its size, modification time and
+        header. The header has the file change counter and schema cookie.'''
+        stat = os.stat(db_path)
+        with open(db_path,'rb') as fh:
+            header = fh.read(100)
+        
+        return hashlib.sha1('{}:{}:{}'.format(
+            stat.st_size,
+            stat.st_mtime,
+            header.encode('hex')
+        )).hexdigest()
+    
+    @staticmethod
+    def NormalizeQuery(sql_string):
+        '''Collapse whitespace and drop trailing semicolons'''
+        return ' '.join(sql_string.split()).rstrip(';').strip()
+    
+    def GetKey(self,sql_string):
+        return hashlib.sha1(u'{}\n{}'.format(
+            self.fingerprint,
+            QueryCache.NormalizeQuery(sql_string)
+        ).encode('utf-8')).hexdigest()
+    
+    def ExecuteQuery(self,db_handler,sql_string,label=None):
+        '''Get the results of a query from the cache or from the database.
+        Results read from the database are written to the cache while they are
+        being consumed.
+        
+        Args:
+            db_handler: The DbHandler to run the query with on a miss
+            sql_string: The query
+            label: Optional name for the log message (e.g. the worksheet)
+        Returns:
+            (column_names, records): The column names and an iterator of rows'''
+        entry_path = os.path.join(
+            self.cache_folder,
+            self.GetKey(sql_string) + QueryCache.EXTENSION
+        )
+        
+        if os.path.isfile(entry_path):
+            try:
+                column_names,records = self._ReadEntry(entry_path)
+            except sqlite3.Error as error:
+                logging.warning(u'Ignoring query cache entry {}: {}'.format(entry_path,error))
+            else:
+                self.hits += 1
+                logging.info(u'Query cache hit: {}'.format(label or sql_string))
+                os.utime(entry_path,None)
+                return column_names,records
+        
+        self.misses += 1
+        logging.info(u'Query cache miss: {}'.format(label or sql_string))
+        column_names,cursor = db_handler.ExecuteQuery(sql_string)
+        
+        return column_names,self._WriteEntry(
+            entry_path,
+            column_names,
+            cursor,
+            db_handler
+        )
+    
+    @staticmethod
+    def _ReadEntry(entry_path):
+        '''Open an entry file
+        
+        Returns:
+            (column_names, records): The column names and an iterator of rows
+            that closes the entry once it is exhausted'''
+        dbh = sqlite3.connect(entry_path)
+        try:
+            dbh.execute('PRAGMA query_only=ON')
+            column_names = [
+                name for (name,) in dbh.execute(
+                    'SELECT "Name" FROM "Columns" ORDER BY rowid'
+                )
+            ]
+            cursor = dbh.execute('SELECT * FROM "Rows" ORDER BY rowid')
+        except:
+            dbh.close()
+            raise
+        
+        def records():
+            try:
+                for record in cursor:
+                    yield record
+            finally:
+                dbh.close()
+        
+        return column_names,records()
+    
+    def _WriteEntry(self,entry_path,column_names,cursor,db_handler):
+        '''Yield records while writing them to a temporary entry file that is
+        moved into place once all records were read. Results that grow over
+        max_size or hold values an entry cannot store are not cached. The
+        query connection is released once the records are consumed.'''
+        handle,temp_path = tempfile.mkstemp(
+            dir=self.cache_folder,
+            suffix='.tmp'
+        )
+        os.close(handle)
+        entry_dbh = sqlite3.connect(temp_path)
+        caching = True
+        try:
+            entry_dbh.execute('PRAGMA journal_mode=OFF')
+            entry_dbh.execute('PRAGMA synchronous=OFF')
+            entry_dbh.execute('CREATE TABLE \'Columns\' (\'Name\')')
+            entry_dbh.executemany(
+                'INSERT INTO "Columns" VALUES (?)',
+                [(name,) for name in column_names]
+            )
+            entry_dbh.execute(u'CREATE TABLE \'Rows\' ({})'.format(
+                ', '.join(u"'c{}'".format(index) for index in range(len(column_names)))
+            ))
+            insert_sql = u'INSERT INTO "Rows" VALUES ({})'.format(
+                ', '.join(['?'] * len(column_names))
+            )
+            
+            chunk = []
+            for record in cursor:
+                yield record
+                
+                if not caching:
+                    continue
+                
+                if not all(isinstance(value,QueryCache.VALUE_TYPES) for value in record):
+                    caching = False
+                    continue
+                
+                chunk.append(record)
+                if len(chunk) >= QueryCache.CHUNK_ROWS:
+                    entry_dbh.executemany(insert_sql,chunk)
+                    entry_dbh.commit()
+                    chunk = []
+                    if os.path.getsize(temp_path) > self.max_size:
+                        caching = False
+            
+            if caching and chunk:
+                entry_dbh.executemany(insert_sql,chunk)
+            entry_dbh.commit()
+            entry_dbh.close()
+            
+            if caching and os.path.getsize(temp_path) <= self.max_size:
+                try:
+                    os.rename(temp_path,entry_path)
+                except OSError:
+                    #Another report worker stored the same query first#
+                    pass
+        finally:
+            entry_dbh.close()
+            db_handler.ReleaseDbHandle(cursor.connection)
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+        
+        self._Evict()
+    
+    
+    def _Evict(self):
+        '''Remove least recently used entries until the cache fits max_size'''
+        entries = []
+        total = 0
+        for filename in os.listdir(self.cache_folder):
+            if filename.endswith('.tmp'):
+                continue
+            
+            entry_path = os.path.join(self.cache_folder,filename)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime,stat.st_size,entry_path))
+            total += stat.st_size
+        
+        entries.sort()
+        for mtime,size,entry_path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            total -= size
+
+class ParquetSchemaError(Exception):
+    '''A chunk of records needs wider Parquet column types than the ones
+    the file was started with'''
+
+class ExportHandler():
+    '''Streams template queries or whole tables from a SrumMonkey database
+    to CSV, JSON Lines or Parquet files'''
+    EXTENSIONS = {
+        'csv':'.csv',
+        'jsonl':'.jsonl',
+        'parquet':'.parquet'
+    }
+    #The type of the values of the SQLite column types SrumMonkey creates#
+    DECLARED_VALUE_TYPES = {
+        'INTEGER':int,
+        'REAL':float,
+        'BLOB':buffer,
+        'TEXT':unicode
+    }
+    
+    def __init__(self,export_format='csv',chunk_size=DEFAULT_BATCH_SIZE,workers=1):
+        '''Create an ExportHandler
+        
+        Args:
+            export_format: csv, jsonl or parquet
+            chunk_size: The number of records fetched and written at a time
+            workers: The maximum number of queries to export at the same time'''
+        self.export_format = export_format
+        self.chunk_size = chunk_size
+        self.workers = workers
+    
+    @staticmethod
+    def GetTemplateQueries(template_folder,table_names=None):
+        '''Get the query of every records worksheet in the templates
+        
+        Args:
+            template_folder: The folder that contains YML templates
+            table_names: The table names of the database, to use the
+                rollup_query of worksheets whose rollup tables exist
+        Returns:
+            queries: [(name, sql_query)] where name is <workbook>_<worksheet>'''
+        queries = []
+        for filename,template in GetTemplates(template_folder):
+            workbook_name = os.path.splitext(template['workbook_name'])[0]
+            for worksheet_template in template.get('worksheets') or []:
+                if worksheet_template.get('worksheet_type') != 'records':
+                    continue
+                
+                queries.append((
+                    u'{}_{}'.format(workbook_name,worksheet_template['worksheet_name']),
+                    GetWorksheetQuery(
+                        worksheet_template['attributes'],
+                        table_names or []
+                    )
+                ))
+        
+        return queries
+    
+    @staticmethod
+    def GetTableQueries(db_handler,tables=None):
+        '''Get a query for every table in the database
+        
+        Args:
+            db_handler: The DbHandler of the database
+            tables: Optional table names to limit the export to
+        Returns:
+            queries: [(table name, sql_query)]'''
+        table_names = db_handler.GetTableNames()
+        
+        if tables:
+            selected = set(name.lower() for name in tables)
+            for name in selected - set(name.lower() for name in table_names):
+                logging.error(u'No table {} in the database'.format(name))
+            table_names = [name for name in table_names if name.lower() in selected]
+        
+        return [
+            (table_name,u'SELECT * FROM "{}"'.format(table_name))
+            for table_name in table_names
+        ]
+    
+    def Export(self,db_path,outpath,queries,table_queries=False):
+        '''Export the results of queries to one file per query. With more
+        than one worker the queries are farmed out to a process pool where
+        each worker opens its own read-only connection.
+        
+        Args:
+            db_path: The SrumMonkey database to export from
+            outpath: The folder to write the files to
+            queries: [(name, sql_query)]
+            table_queries: The queries are from GetTableQueries, so the
+                declared types of the table columns are known'''
+        if self.export_format == 'parquet' and pyarrow is None:
+            logging.error(u'Exporting to Parquet requires pyarrow')
+            return
+        
+        if not os.path.isdir(outpath):
+            os.makedirs(outpath)
+        
+        tasks = []
+        for name,sql_string in queries:
+            tasks.append((
+                name,
+                sql_string,
+                db_path,
+                os.path.join(outpath,name + ExportHandler.EXTENSIONS[self.export_format]),
+                self.export_format,
+                self.chunk_size,
+                name if table_queries else None
+            ))
+        
+        workers = min(self.workers,len(tasks))
+        if workers > 1:
+            pool = multiprocessing.Pool(
+                processes=workers
+            )
+            try:
+                results = pool.imap_unordered(
+                    ExportQuery,
+                    tasks
+                )
+                self._ReportProgress(results,len(tasks))
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            self._ReportProgress(
+                (ExportQuery(task) for task in tasks),
+                len(tasks)
+            )
+    
+    def _ReportProgress(self,results,total):
+        for done,(name,count,elapsed,error) in enumerate(results,1):
+            if error is not None:
+                logging.error(u'Export {} failed: {}'.format(name,error))
+            else:
+                print u'Exported {} ({} records) in {:.2f}s [{}/{}]'.format(
+                    name,count,elapsed,done,total
+                )
+    
+    @staticmethod
+    def _GetTextValue(value):
+        '''Get a value that can be written as text. Binary values are hex
+        encoded like they are in the XLSX reports.'''
+        if isinstance(value,(buffer,bytearray)):
+            return str(value).encode('hex')
+        elif isinstance(value,(datetime.datetime,datetime.date)):
+            return unicode(value)
+        
+        return value
+    
+    @staticmethod
+    def WriteCsv(outfile,column_names,chunks):
+        '''Write chunks of records to a UTF-8 CSV file with a header row
+        
+        Returns:
+            count: The number of records written'''
+        count = 0
+        with open(outfile,'wb') as fh:
+            writer = csv.writer(fh)
+            writer.writerow([name.encode('utf-8') for name in column_names])
+            for chunk in chunks:
+                rows = []
+                for record in chunk:
+                    row = []
+                    for value in record:
+                        value = ExportHandler._GetTextValue(value)
+                        if isinstance(value,unicode):
+                            value = value.encode('utf-8')
+                        row.append(value)
+                    rows.append(row)
+                
+                writer.writerows(rows)
+                count += len(chunk)
+        
+        return count
+    
+    @staticmethod
+    def WriteJsonl(outfile,column_names,chunks):
+        '''Write chunks of records to a JSON Lines file, one object per record
+        
+        Returns:
+            count: The number of records written'''
+        count = 0
+        with open(outfile,'wb') as fh:
+            for chunk in chunks:
+                lines = []
+                for record in chunk:
+                    lines.append(json.dumps(collections.OrderedDict(
+                        zip(column_names,[ExportHandler._GetTextValue(value) for value in record])
+                    )))
+                
+                fh.write('\n'.join(lines) + '\n')
+                count += len(chunk)
+        
+        return count
+    
+    @staticmethod
+    def GetDeclaredValueTypes(db_handler,table_name):
+        '''Get the type of the values of every column from the declared
+        column types of a table
+        
+        Returns:
+            value_types: A set per column, empty if the declared type does
+            not tell'''
+        field_order,field_mapping = db_handler.GetFieldMapping(
+            table_name
+        )
+        value_types = []
+        for name in field_order:
+            value_type = ExportHandler.DECLARED_VALUE_TYPES.get(
+                (field_mapping[name] or u'').upper()
+            )
+            value_types.append(set([value_type]) if value_type else set())
+        
+        return value_types
+    
+    @staticmethod
+    def GetValueTypes(chunks):
+        '''Get the types of the values of every column over all the records.
+        SQLite columns can hold values of any type, so Parquet column types
+        are derived from every value rather than the first chunk.
+        
+        Returns:
+            value_types: A set of the types of the non NULL values per column'''
+        value_types = None
+        for chunk in chunks:
+            if value_types is None:
+                value_types = [set() for value in chunk[0]]
+            
+            for index,values in enumerate(zip(*chunk)):
+                value_types[index].update(itertools.imap(type,values))
+        
+        for types in value_types or []:
+            types.discard(type(None))
+        
+        return value_types
+    
+    @staticmethod
+    def WriteParquet(outfile,column_names,chunks,value_types=None):
+        '''Write chunks of records to a Parquet file, one row group per chunk.
+        The column types are the given value types plus the types of the
+        first chunk.
+        
+        Args:
+            value_types: Optional types of the values per column, from
+                GetDeclaredValueTypes or GetValueTypes
+        Raises:
+            ParquetSchemaError: A later chunk needs a wider column type
+        Returns:
+            count: The number of records written'''
+        count = 0
+        schema = None
+        writer = None
+        try:
+            for chunk in chunks:
+                chunk_types = ExportHandler.GetValueTypes([chunk])
+                if writer is None:
+                    value_types = [
+                        set(types) for types in value_types or [()] * len(chunk_types)
+                    ]
+                for types,more in zip(value_types,chunk_types):
+                    types.update(more)
+                
+                if writer is None:
+                    schema = ExportHandler._GetParquetSchema(
+                        column_names,
+                        value_types
+                    )
+                    writer = pyarrow.parquet.ParquetWriter(outfile,schema)
+                elif ExportHandler._GetParquetSchema(column_names,value_types) != schema:
+                    raise ParquetSchemaError(
+                        u'Record {} needs wider column types'.format(count)
+                    )
+                
+                writer.write_table(ExportHandler._GetParquetTable(schema,chunk))
+                count += len(chunk)
+            
+            if writer is None:
+                schema = ExportHandler._GetParquetSchema(column_names,value_types)
+                writer = pyarrow.parquet.ParquetWriter(outfile,schema)
+                writer.write_table(ExportHandler._GetParquetTable(schema,[]))
+        finally:
+            if writer is not None:
+                writer.close()
+        
+        return count
+    
+    @staticmethod
+    def _GetParquetSchema(column_names,value_types):
+        '''Get the Parquet schema for the types of the values per column.
+        Integers and floats widen to float64, anything mixed with text and
+        columns that are only NULL are strings.'''
+        fields = []
+        for index,name in enumerate(column_names):
+            if value_types:
+                column_types = value_types[index]
+            else:
+                column_types = set()
+            
+            if not column_types:
+                data_type = pyarrow.string()
+            elif column_types <= set([int,long]):
+                data_type = pyarrow.int64()
+            elif column_types <= set([int,long,float]):
+                data_type = pyarrow.float64()
+            elif column_types <= set([buffer,bytearray]):
+                data_type = pyarrow.binary()
+            else:
+                data_type = pyarrow.string()
+            
+            fields.append(pyarrow.field(name,data_type))
+        
+        return pyarrow.schema(fields)
+    
+    @staticmethod
+    def _GetParquetTable(schema,chunk):
+        arrays = []
+        for index,field in enumerate(schema):
+            values = [record[index] for record in chunk]
+            if field.type == pyarrow.string():
+                values = [
+                    None if value is None else unicode(ExportHandler._GetTextValue(value))
+                    for value in values
+                ]
+            elif field.type == pyarrow.binary():
+                values = [
+                    None if value is None else str(value)
+                    for value in values
+                ]
+            elif field.type == pyarrow.float64():
+                values = [
+                    None if value is None else float(value)
+                    for value in values
+                ]
+            
+            arrays.append(pyarrow.array(values,type=field.type))
+        
+        return pyarrow.Table.from_arrays(arrays,schema=schema)
+
+def ExportQuery(task):
+    '''Export the results of one query. Runs in a worker process when
+    queries are exported in parallel.
+    
+    Args:
+        task: (name, query, database path, output file, format, chunk size,
+            table name or None)
+    Returns:
+        (name, count, elapsed, error): The export name, the number of records
+        written, the seconds it took and the error message if it failed'''
+    name,sql_string,db_path,outfile,export_format,chunk_size,table_name = task
+    writers = {
+        'csv':ExportHandler.WriteCsv,
+        'jsonl':ExportHandler.WriteJsonl,
+        'parquet':ExportHandler.WriteParquet
+    }
+    
+    start = time.time()
+    #Write to a temporary name so a failed export does not leave a partial file#
+    partial_file = outfile + '.part'
+    try:
+        db_handler = DbHandler(
+            DbConfig(
+                dbname=db_path,
+                read_only=True
+            )
+        )
+        writer_args = {}
+        if export_format == 'parquet' and table_name is not None:
+            writer_args['value_types'] = ExportHandler.GetDeclaredValueTypes(
+                db_handler,
+                table_name
+            )
+        
+        column_names,cursor = db_handler.ExecuteQuery(
+            sql_string
+        )
+        try:
+            count = writers[export_format](
+                partial_file,
+                column_names,
+                iter(lambda: cursor.fetchmany(chunk_size),[]),
+                **writer_args
+            )
+        except ParquetSchemaError as error:
+            #Scan every record for the column types and write the file again#
+            logging.info(u'{}: {}, exporting it again'.format(name,error))
+            db_handler.ReleaseDbHandle(cursor.connection)
+            column_names,cursor = db_handler.ExecuteQuery(
+                sql_string
+            )
+            value_types = ExportHandler.GetValueTypes(
+                iter(lambda: cursor.fetchmany(chunk_size),[])
+            )
+            db_handler.ReleaseDbHandle(cursor.connection)
+            for types,declared in zip(value_types or [],writer_args.get('value_types') or []):
+                types.update(declared)
+            writer_args['value_types'] = value_types
+            
+            column_names,cursor = db_handler.ExecuteQuery(
+                sql_string
+            )
+            count = writers[export_format](
+                partial_file,
+                column_names,
+                iter(lambda: cursor.fetchmany(chunk_size),[]),
+                **writer_args
+            )
+        db_handler.ReleaseDbHandle(cursor.connection)
+        
+        if os.path.isfile(outfile):
+            os.remove(outfile)
+        os.rename(partial_file,outfile)
+    except Exception as error:
+        if os.path.isfile(partial_file):
+            os.remove(partial_file)
+        return name,0,time.time() - start,str(error)
+    
+    return name,count,time.time() - start,None
+
+class RegistryHandler():
+    '''Registry Operations'''
+    WLANSVCINTERFACEPROFILES_COLUMN_MAPPING = {
+        'ProfileIndex':'INTEGER',
+        'succeeded':'BLOB',
+        'ProfileGuid':'TEXT',
+        'Flags':'INTEGER',
+        'All User Profile Security Descriptor':'TEXT',
+        'CreatorSid':'BLOB',
+        'InterfaceGuid':'TEXT',
+        'SSID':'TEXT',
+        'Nla':'BLOB',
+        'NameLength':'INTEGER',
+        'Name':'TEXT'
+    }
+    WLANSVCINTERFACEPROFILES_COLUMN_ORDER = [
+        'ProfileIndex',
+        'succeeded',
+        'ProfileGuid',
+        'Flags',
+        'All User Profile Security Descriptor',
+        'CreatorSid',
+        'InterfaceGuid',
+        'SSID',
+        'Nla',
+        'NameLength',
+        'Name'
+    ]
+    
+    CUSTOM_COLUMNS = {
+        'All User Profile Security Descriptor':{
+            'type':'utf-16le'
+        },
+        'Channel Hints':{
+            'type':'ChannelHints'
+        }
+    }
+    SQLITE_TYPE = {
+        'DATETIME':[
+            
+        ],
+        'REAL':[
+            
+        ],
+        'INTEGER':[
+            Registry.RegDWord
+        ],
+        'BLOB':[
+        ],
+        'TEXT':[
+        ]
+    }
+    
+    #Bump when what is extracted from the hive changes to ignore old caches#
+    CACHE_VERSION = 2
+    
+    def __init__(self,options,db_handler=None):
+        self.options = options
+        self.guid_mapping = None
+        #Number of WlanSvc profiles found#
+        self.profile_count = 0
+        #The hive was not parsed because it was in the registry cache#
+        self.cache_hit = False
+        self.outputDbConfig = DbConfig(
+            dbname=options.output_db
+        )
+        self.outputDbHandler = db_handler
+        if self.outputDbHandler is None:
+            self.outputDbHandler = DbHandler(
+                self.outputDbConfig
+            )
+        
+    def _GetWlanSvcProfiles(self):
+        '''Get the wireless interface profiles of the hive
+        
+        Returns:
+            profile_list: A list of {column:value} rows or None if the hive
+            has no WlanSvc key'''
+        try:
+            reg_key = self.registry.open('Microsoft\\WlanSvc\\Interfaces')
+        except Registry.RegistryKeyNotFoundException as error:
+            print(u'No WlanSvc found at Microsoft\\WlanSvc\\Interfaces')
+            return None
+        
+        profile_list = []
+        for interface_key in reg_key.subkeys():
+            #Get Interface GUID#
+            interface_guid = interface_key.name()
+            #If Interface Key has sub keys, enumerate profiles#
+            if interface_key.subkeys_number() > 0:
+                #Get Profiles Key#
+                profiles_key = interface_key.subkey('Profiles')
+                for profile_key in profiles_key.subkeys():
+                    profile_dict = {
+                        'InterfaceGuid':interface_guid,
+                        'ProfileGuid':profile_key.name()
+                    }
+                    if profile_key.values_number() > 0:
+                        for value in profile_key.values():
+                            profile_dict[value.name()] = value.value()
+                    if profile_key.subkeys_number() > 0:
+                        metadata_key = profile_key.subkey('MetaData')
+                        if metadata_key.values_number() > 0:
+                            for value in metadata_key.values():
+                                resolved_value = self._GetValue(value)
+                                if isinstance(resolved_value,dict):
+                                    profile_dict.update(resolved_value)
+                                else:
+                                    profile_dict[value.name()] = resolved_value
+                    
+                    profile_list.append(profile_dict)
+        
+        return profile_list
+    
+    def _InsertWlanSvcProfiles(self,profile_list):
+        '''Insert wireless interface info into database
+        
+        Args:
+            profile_list: A list of {column:value} rows or None if the hive
+                has no WlanSvc key'''
+        for profile_dict in profile_list or []:
+            for key in profile_dict:
+                if key not in RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_MAPPING:
+                    RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_MAPPING[key] = 'BLOB'
+                
+                if key not in self.INTERFACE_COLUMN_LISTING:
+                    self.INTERFACE_COLUMN_LISTING.append(key)
+        
+        self.outputDbHandler.CreateTableFromMapping(
+            'WlanSvcInterfaceProfiles',
+            RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_MAPPING,
+            None,
+            RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_ORDER
+        )
+        
+        if profile_list is None:
+            return
+        
+        #The hive holds the current profiles, replace the appended ones#
+        if self.options.append or self.options.resume:
+            self.outputDbHandler.Execute(
+                "DELETE FROM 'WlanSvcInterfaceProfiles'"
+            )
+        
+        self.profile_count = len(profile_list)
+        self.outputDbHandler.InsertFromIterator(
+            'WlanSvcInterfaceProfiles',
+            DbHandler.IterDictRows(
+                profile_list,
+                self.INTERFACE_COLUMN_LISTING
+            ),
+            self.INTERFACE_COLUMN_LISTING
+        )
+        
+    def GetGuidTable(self):
+        '''Create a guid table from the guid_mapping'''
+        guid_table = {}
+        for key,value in self.guid_mapping.items():
+            guid_table[key] = value
+            guid_table[key+'LT'] = value+'LT'
+            
+        return guid_table
+        
+    def _EnumerateSrumExtensions(self):
+        '''Insert wireless interface info into database'''
+        self.guid_mapping = RegistryHandler._GetSrumExtensions(
+            self.registry
+        )
+    
+    @staticmethod
+    def _GetSrumExtensions(registry):
+        '''Get the table names of the SRUM extensions of a hive
+        
+        Returns:
+            guid_map: {GUID:table name}'''
+        reg_key = registry.open('Microsoft\\Windows NT\\CurrentVersion\\SRUM\\Extensions')
+        guid_map = {}
+        for guid_key in reg_key.subkeys():
+            #Get Interface GUID#
+            guid_name = guid_key.name()
+            desc = guid_key.value('(default)').value()
+            tname = RegistryHandler._GetTableName(desc)
+            guid_map[guid_name.upper()] = tname
+            pass
+        return guid_map
+    
+    @staticmethod
+    def ReadGuidTable(software_hive):
+        '''Read only the SRUM extension table names of a hive, for commands
+        that need the converted table names without converting the hive
+        
+        Returns:
+            guid_table: {GUID:table name} like GetGuidTable'''
+        guid_table = {}
+        guid_map = RegistryHandler._GetSrumExtensions(
+            Registry.Registry(software_hive)
+        )
+        for key,value in guid_map.items():
+            guid_table[key] = value
+            guid_table[key+'LT'] = value+'LT'
+        
+        return guid_table
+    
+    @staticmethod
+    def _GetTableName(desc):
+        tname = desc
+        tname = tname.replace(" ", "")
+        return tname
+    
+    def EnumerateRegistryValues(self,metrics=None):
+        self.INTERFACE_COLUMN_LISTING = RegistryHandler.WLANSVCINTERFACEPROFILES_COLUMN_ORDER
+        
+        #python-registry reads the whole hive into memory at once, so it is#
+        #read once here for both the cache key and the parser#
+        data = self._ReadHive(
+            metrics=metrics
+        )
+        
+        cache_path = None
+        cache_entry = None
+        if self.options.registry_cache:
+            cache_path = self._GetCachePath(
+                hashlib.sha1(data).hexdigest()
+            )
+            cache_entry = RegistryHandler._ReadCache(
+                cache_path
+            )
+        
+        if cache_entry is not None:
+            logging.info(u'Registry cache hit: {}'.format(cache_path))
+            self.cache_hit = True
+            self.guid_mapping = cache_entry['guid_mapping']
+            profile_list = cache_entry['profiles']
+        else:
+            self.registry = Registry.Registry(
+                cStringIO.StringIO(data)
+            )
+            self._EnumerateSrumExtensions()
+            profile_list = self._GetWlanSvcProfiles()
+            
+            if cache_path is not None:
+                RegistryHandler._WriteCache(
+                    cache_path,
+                    {
+                        'version':RegistryHandler.CACHE_VERSION,
+                        'guid_mapping':self.guid_mapping,
+                        'profiles':None if profile_list is None else [
+                            dict(
+                                (key,RegistryHandler._EncodeCacheValue(value))
+                                for key,value in profile_dict.items()
+                            )
+                            for profile_dict in profile_list
+                        ]
+                    }
+                )
+        
+        self._InsertWlanSvcProfiles(
+            profile_list
+        )
+    
+    def _ReadHive(self,metrics=None):
+        '''Read the whole SOFTWARE hive the way --input_io asks for
+        
+        Args:
+            metrics: Optional PerformanceMetrics to record the input in
+        Returns:
+            data: The hive'''
+        hive = self.options.software_hive
+        input_file = OpenInputFile(
+            hive,
+            self.options
+        )
+        if input_file is None:
+            with open(hive,'rb') as fh:
+                return fh.read()
+        
+        try:
+            data = input_file.read()
+            input_file.Report(
+                metrics=metrics
+            )
+        finally:
+            input_file.close()
+        
+        return data
+    
+    def _GetCachePath(self,hive_hash):
+        '''Get the registry cache file of a hive. The cache is kept with the
+        output rather than the evidence.
+        
+        Args:
+            hive_hash: The SHA-1 of the hive content
+        Returns:
+            cache_path: --registry_cache_folder (default: REGISTRY_CACHE_FOLDER
+            in the outpath)/<SHA-1>.json'''
+        cache_folder = self.options.registry_cache_folder
+        if not cache_folder:
+            cache_folder = os.path.join(
+                self.options.outpath,
+                REGISTRY_CACHE_FOLDER
+            )
+        
+        return os.path.join(
+            cache_folder,
+            u'{}.json'.format(hive_hash)
+        )
+    
+    @staticmethod
+    def _EncodeCacheValue(value):
+        '''Make a registry value JSON safe. Byte strings (binary values) are
+        stored as {"base64":...} so they come back as bytes.'''
+        if isinstance(value,str):
+            return {'base64':base64.b64encode(value)}
+        elif isinstance(value,(list,tuple)):
+            return [RegistryHandler._EncodeCacheValue(item) for item in value]
+        
+        return value
+    
+    @staticmethod
+    def _DecodeCacheValue(value):
+        '''Reverse _EncodeCacheValue'''
+        if isinstance(value,dict):
+            return base64.b64decode(value['base64'])
+        elif isinstance(value,list):
+            return [RegistryHandler._DecodeCacheValue(item) for item in value]
+        
+        return value
+    
+    @staticmethod
+    def _ReadCache(cache_path):
+        '''Read a registry cache file
+        
+        Returns:
+            cache_entry: {version, guid_mapping, profiles} or None if there is
+            no usable cache file'''
+        if not os.path.isfile(cache_path):
+            return None
+        
+        try:
+            with open(cache_path,'rb') as fh:
+                cache_entry = json.load(fh)
+            
+            if cache_entry.get('version') != RegistryHandler.CACHE_VERSION:
+                return None
+            
+            if cache_entry['profiles'] is not None:
+                cache_entry['profiles'] = [
+                    dict(
+                        (key,RegistryHandler._DecodeCacheValue(value))
+                        for key,value in profile_dict.items()
+                    )
+                    for profile_dict in cache_entry['profiles']
+                ]
+            cache_entry['guid_mapping'] = dict(cache_entry['guid_mapping'])
+        except Exception as error:
+            logging.warning(u'Ignoring registry cache {}: {}'.format(cache_path,error))
+            return None
+        
+        return cache_entry
+    
+    @staticmethod
+    def _WriteCache(cache_path,cache_entry):
+        '''Write a registry cache file. The cache is only an optimization, so
+        a folder that cannot be written to or values that cannot be stored
+        are logged and skipped.'''
+        cache_folder = os.path.dirname(cache_path)
+        temp_path = None
+        try:
+            if not os.path.isdir(cache_folder):
+                os.makedirs(cache_folder)
+            
+            handle,temp_path = tempfile.mkstemp(
+                dir=cache_folder,
+                suffix='.tmp'
+            )
+            with os.fdopen(handle,'wb') as fh:
+                json.dump(cache_entry,fh)
+            
+            try:
+                os.rename(temp_path,cache_path)
+            except OSError:
+                #Windows does not replace an existing (unusable) cache file#
+                os.remove(cache_path)
+                os.rename(temp_path,cache_path)
+        except (IOError,OSError,TypeError,ValueError) as error:
+            logging.warning(u'Could not write registry cache {}: {}'.format(cache_path,error))
+            if temp_path is not None and os.path.isfile(temp_path):
+                os.remove(temp_path)
+            return
+        
+        logging.info(u'Wrote registry cache {}'.format(cache_path))
+    
+    def _GetValue(self,value):
+        new_value = value.value()
+        vname = value.name()
+        vtype = value.value_type()
+        
+        ###CHECK FOR CUSTOM DEFINED TABLE COLUMNS TYPES###
+        if vname in RegistryHandler.CUSTOM_COLUMNS:
             new_value = self._GetCustomValue(
                 RegistryHandler.CUSTOM_COLUMNS[vname],
                 new_value
             )
             
-            return new_value
+            return new_value
+        
+        return new_value
+    
+    def _GetCustomValue(self,custom_info,data):
+        value = data
+        if 'type' in custom_info:
+            if custom_info['type'] == 'utf-16le':
+                value = data.decode('utf-16le')
+            elif custom_info['type'] == 'ChannelHints':
+                value = ChannelHints(data)
+            elif custom_info['type'] == 'WinDatetime':
+                value = GetWinTimeStamp(data)
+                
+        return value
+    
+class DecodeCache(object):
+    '''A bounded cache of decoded values keyed by their raw bytes.
+    
+    Entries are kept in two generations. A value found in the previous
+    generation moves to the current one, and once the current generation is
+    full it replaces the previous one, so values not used for a generation
+    are dropped. Repeated raw values decode to the same object, so repeated
+    strings are also only held once.'''
+    def __init__(self,decoder,max_size=DEFAULT_DECODE_CACHE_SIZE):
+        '''Create a DecodeCache
+        
+        Args:
+            decoder: A callable that decodes raw bytes (never returns None)
+            max_size: The maximum number of entries kept'''
+        self.decoder = decoder
+        self.generation_size = max(1,max_size // 2)
+        self.current = {}
+        self.previous = {}
+    
+    def Decode(self,data):
+        '''Get the decoded value of data, decoding it on a miss'''
+        value = self.current.get(data)
+        if value is None:
+            value = self.previous.get(data)
+            if value is None:
+                value = self.decoder(data)
+            
+            if len(self.current) >= self.generation_size:
+                self.previous = self.current
+                self.current = {}
+            self.current[data] = value
+        
+        return value
+
+def DecodeSid(data):
+    '''Decode a binary SID to its S-1-... string'''
+    sid = SID(data)
+    if sid:
+        return str(sid)
+    
+    return data
+
+def DecodeUtf16(data):
+    return data.decode('utf-16le')
+
+class SrumHandler():
+    '''A Handler for converting SRU to SQLite'''
+    CURRENT_LOCATION = {
+        'table':None,
+        'table_enum':None,
+        'column':None
+    }
+    GUID_TABLES = {
+        '{DD6636C4-8929-4683-974E-22C046A43763}':'NetworkConnectivityData',
+        '{D10CA2FE-6FCF-4F6D-848E-B2E99266FA89}':'ApplicationResourceUsageData',
+        '{973F5D5C-1D90-4944-BE8E-24B94231A174}':'NetworkUsageData',
+        '{D10CA2FE-6FCF-4F6D-848E-B2E99266FA86}':'EnergyUsageData',
+        '{FEE4E14F-02A9-4550-B5CE-5FA2DA202E37}':'WindowsPushNotificationData',
+        '{FEE4E14F-02A9-4550-B5CE-5FA2DA202E37}LT':'WindowsPushNotificationDataLT',
+    }
+    SQLITE_TYPE = {
+        'DATETIME':[
+            pyesedb.column_types.DATE_TIME
+        ],
+        'REAL':[
+            pyesedb.column_types.DOUBLE_64BIT,
+            pyesedb.column_types.FLOAT_32BIT
+        ],
+        'INTEGER':[
+            pyesedb.column_types.BOOLEAN,
+            pyesedb.column_types.INTEGER_16BIT_SIGNED,
+            pyesedb.column_types.INTEGER_16BIT_UNSIGNED,
+            pyesedb.column_types.INTEGER_32BIT_SIGNED,
+            pyesedb.column_types.INTEGER_32BIT_UNSIGNED,
+            pyesedb.column_types.INTEGER_64BIT_SIGNED,
+            pyesedb.column_types.INTEGER_8BIT_UNSIGNED
+        ],
+        'BLOB':[
+            pyesedb.column_types.BINARY_DATA,
+            pyesedb.column_types.LARGE_BINARY_DATA
+        ],
+        'TEXT':[
+            pyesedb.column_types.GUID,
+            pyesedb.column_types.LARGE_TEXT,
+            pyesedb.column_types.SUPER_LARGE_VALUE,
+            pyesedb.column_types.TEXT
+        ]
+    }
+    
+    #How to unpack fixed size column types#
+    TYPE_STRUCTS = {
+        DBTYPES.DOUBLE_64BIT:struct.Struct('d'),
+        DBTYPES.FLOAT_32BIT:struct.Struct('f'),
+        DBTYPES.BOOLEAN:struct.Struct('?'),
+        DBTYPES.INTEGER_8BIT_UNSIGNED:struct.Struct('B'),
+        DBTYPES.INTEGER_16BIT_SIGNED:struct.Struct('h'),
+        DBTYPES.INTEGER_16BIT_UNSIGNED:struct.Struct('H'),
+        DBTYPES.INTEGER_32BIT_SIGNED:struct.Struct('i'),
+        DBTYPES.INTEGER_32BIT_UNSIGNED:struct.Struct('I'),
+        DBTYPES.INTEGER_64BIT_SIGNED:struct.Struct('q')
+    }
+    
+    #Custom types that are decoded a column chunk at a time#
+    BATCH_DECODERS = {
+        'OleDatetime':GetOleTimeStamps,
+        'WinDatetime':GetWinTimeStamps
+    }
+    #Records per chunk for the batch decoders#
+    DECODE_CHUNK_ROWS = 1024
+    
+    #Column types the binary column policies apply to#
+    BINARY_TYPES = [
+        DBTYPES.BINARY_DATA,
+        DBTYPES.LARGE_BINARY_DATA,
+        DBTYPES.SUPER_LARGE_VALUE
+    ]
+    
+    #Column types that are stored as is#
+    RAW_TYPES = [
+        DBTYPES.LARGE_TEXT,
+        DBTYPES.SUPER_LARGE_VALUE,
+        DBTYPES.TEXT,
+        DBTYPES.BINARY_DATA,
+        DBTYPES.LARGE_BINARY_DATA
+    ]
+    
+    #If Columns have same name but need to be treated differently#
+    #{table_name:{column_name:custom_info}}#
+    CUSTOM_TABLES = {
+        
+    }
+    
+    #Records the last converted key of every table for --append#
+    HIGH_WATER_MARK_TABLE = 'SrumMonkeyHighWaterMark'
+    #Columns that increase with every record (first one found is used)#
+    HIGH_WATER_MARK_COLUMNS = [
+        'AutoIncId',
+        'IdIndex'
+    ]
+    #Records how far every table of a conversion got for --resume#
+    JOURNAL_TABLE = 'SrumMonkeyJournal'
+    #Tables about the conversion rather than the SRUM database#
+    METADATA_TABLES = [
+        HIGH_WATER_MARK_TABLE,
+        JOURNAL_TABLE
+    ]
+    
+    #Decoded SIDs and strings shared by the handlers of a process, so hosts#
+    #with the same users and applications only decode them once#
+    SID_CACHE = DecodeCache(DecodeSid)
+    STRING_CACHE = DecodeCache(DecodeUtf16)
+    
+    #How to decode a special column#
+    CUSTOM_COLUMNS = {
+        'EventTimestamp':{
+            'type':'WinDatetime'
+        },
+        'ConnectStartTime':{
+            'type':'WinDatetime'
+        },
+        'LocaleName':{
+            'type':'utf-16le'
+        },
+        'Key':{
+            'type':'utf-16le'
+        },
+        'IdBlob':{
+            'type':'IdBlob'
+        }
+    }
+
+    def __init__(self,options,guid_table=None,db_handler=None,metrics=None):
+        '''Create a SrumHandler
+        
+        Args:
+            options: Options
+            guid_table: Optional guid table mapping
+            db_handler: Optional DbHandler for the output database
+            metrics: Optional PerformanceMetrics to record table timings in'''
+        self.options = options
+        self.srum_db = options.srum_db
+        self.output_db = options.output_db
+        self.batch_size = options.batch_size
+        self.workers = options.workers
+        self.split_records = options.split_records
+        self.timestamp_format = options.timestamp_format
+        self.append = options.append
+        self.resume = options.resume
+        #Table selection, lower case names#
+        self.tables = set(name.lower() for name in options.tables or [])
+        self.exclude_tables = set(name.lower() for name in options.exclude_tables or [])
+        #TimeStamp window#
+        self.since = options.since
+        self.until = options.until
+        #Binary column policies#
+        self.binary_columns = options.binary_columns
+        self.column_policies = dict(options.column_policies or [])
+        #{table_name:high water mark} of the output database#
+        self.high_water_marks = {}
+        #{table_name:(number_of_records,next_record,complete)} to resume from#
+        self.journal = {}
+        #Index of the record after the last one decoded#
+        self.next_record = 0
+        #Views to create over epoch tables {view:(table,timestamp_columns)}#
+        self.timestamp_views = {}
+        self.metrics = metrics
+        #Seconds spent on the current table {part:seconds}#
+        self.table_timings = {}
+        
+        self.esedb_file = pyesedb.file()
+        self.input_file = OpenInputFile(
+            self.srum_db,
+            options
+        )
+        if self.input_file is None:
+            self.esedb_file.open(self.srum_db)
+        else:
+            self.esedb_file.open_file_object(self.input_file)
+        
+        if guid_table:
+            SrumHandler.GUID_TABLES = guid_table
+        
+        self.outputDbConfig = DbConfig(
+            dbname=self.output_db
+        )
+        
+        self.outputDbHandler = db_handler
+        if self.outputDbHandler is None:
+            self.outputDbHandler = DbHandler(
+                self.outputDbConfig
+            )
+        
+    def _CreateTableNameFromGuid(self,guid):
+        '''If you wanted to change the table name of a guid table'''
+        new_table_name = guid
+        
+        #new_table_name = new_table_name.replace('{','')
+        #new_table_name = new_table_name.replace('}','')
+        #new_table_name = new_table_name.replace('-','')
+        
+        return new_table_name
+        
+    def ConvertDb(self):
+        '''Convert SRU Database to a SQLite Database'''
+        self.high_water_marks = self._GetHighWaterMarks()
+        self.journal = self._GetJournal()
+        
+        if self.workers > 1:
+            self._ConvertDbParallel()
+        else:
+            for table in self.esedb_file.tables:
+                self._SetCurrentTable(
+                    table
+                )
+                
+                if not self._IsTableSelected(table):
+                    continue
+                
+                self._CreateTable(
+                    table
+                )
+                
+                start = self._GetStart(
+                    table
+                )
+                if start is None:
+                    print 'Skipping Table {} as {} [converted before]'.format(
+                        table.name,self.table_name
+                    )
+                    continue
+                
+                self._StartJournal(
+                    table,
+                    start
+                )
+                
+                if start:
+                    print 'Converting Table {} as {} [records {}-{}]'.format(
+                        table.name,self.table_name,start,table.get_number_of_records()
+                    )
+                else:
+                    print 'Converting Table {} as {}'.format(table.name,self.table_name)
+                
+                self._InsertTable(
+                    table,
+                    start=start or None,
+                    stop=table.get_number_of_records() if start else None,
+                    progress=self._JournalBatch
+                )
+                
+                self._SetHighWaterMark(
+                    table
+                )
+                self._CompleteJournal(
+                    table
+                )
+        
+        IndexHandler(
+            self.outputDbHandler
+        ).CreateIdMapNameColumns()
+        self._CreateTimestampViews()
+        
+        if self.input_file is not None:
+            self.input_file.Report(
+                metrics=self.metrics
+            )
+    
+    def _GetHighWaterMarks(self):
+        '''Create the high water mark table if needed and read it
+        
+        Returns:
+            high_water_marks: {table_name:high water mark}'''
+        self.outputDbHandler.Execute(
+            u"CREATE TABLE IF NOT EXISTS '{}' ("
+            u"'TableName' TEXT PRIMARY KEY, "
+            u"'KeyColumn' TEXT, "
+            u"'HighWaterMark' INTEGER)".format(
+                SrumHandler.HIGH_WATER_MARK_TABLE
+            )
+        )
+        
+        return dict(self.outputDbHandler.FetchAll(
+            u"SELECT TableName, HighWaterMark FROM '{}'".format(
+                SrumHandler.HIGH_WATER_MARK_TABLE
+            )
+        ))
+    
+    def _GetJournal(self):
+        '''Create the journal table if needed and read it. Unless resuming,
+        the journal of the previous run is cleared.
+        
+        Returns:
+            journal: {table_name:(number_of_records,next_record,complete)}'''
+        self.outputDbHandler.Execute(
+            u"CREATE TABLE IF NOT EXISTS '{}' ("
+            u"'TableName' TEXT PRIMARY KEY, "
+            u"'NumberOfRecords' INTEGER, "
+            u"'NextRecord' INTEGER, "
+            u"'Complete' INTEGER)".format(
+                SrumHandler.JOURNAL_TABLE
+            )
+        )
+        
+        if not self.resume:
+            self.outputDbHandler.Execute(
+                u"DELETE FROM '{}'".format(SrumHandler.JOURNAL_TABLE)
+            )
+            return {}
+        
+        return dict(
+            (table_name,(number_of_records,next_record,bool(complete)))
+            for table_name,number_of_records,next_record,complete in self.outputDbHandler.FetchAll(
+                u"SELECT TableName, NumberOfRecords, NextRecord, Complete FROM '{}'".format(
+                    SrumHandler.JOURNAL_TABLE
+                )
+            )
+        )
+    
+    def _GetStart(self,table):
+        '''Get the index of the first record of the current table to convert.
+        
+        With --resume, tables in the journal continue after the last batch
+        the interrupted run committed. Other tables start as without it
+        (see _GetAppendStart).
+        
+        Args:
+            table: A pyesedb table object
+        Returns:
+            start: The index of the first record to convert or None if the
+            interrupted run completed the table'''
+        entry = self.journal.get(self.storage_name)
+        if entry is None:
+            return self._GetAppendStart(table)
+        
+        number_of_records,next_record,complete = entry
+        if number_of_records != table.get_number_of_records():
+            raise Exception(u'{}: the journal is for {} records but the table has {}. The SRUM database changed since the interrupted run; convert it without --resume.'.format(
+                self.table_name,number_of_records,table.get_number_of_records()
+            ))
+        elif complete:
+            return None
+        
+        return next_record
+    
+    def _StartJournal(self,table,start):
+        '''Record that the current table is being converted from a record
+        
+        Args:
+            table: A pyesedb table object
+            start: The index of the first record to convert'''
+        self.outputDbHandler.Execute(
+            u"INSERT OR REPLACE INTO '{}' (TableName, NumberOfRecords, NextRecord, Complete) VALUES (?, ?, ?, 0)".format(
+                SrumHandler.JOURNAL_TABLE
+            ),
+            (self.storage_name,table.get_number_of_records(),start)
+        )
+    
+    @staticmethod
+    def _SetJournalRecord(cursor,table_name,next_record):
+        '''Record the index of the record after the last committed one. Runs
+        in the transaction that commits the records.
+        
+        Args:
+            cursor: A cursor of the output database
+            table_name: The table the records are stored in
+            next_record: The index of the first record not committed yet'''
+        cursor.execute(
+            u"UPDATE '{}' SET NextRecord = ? WHERE TableName = ?".format(
+                SrumHandler.JOURNAL_TABLE
+            ),
+            (next_record,table_name)
+        )
+    
+    def _JournalBatch(self,cursor):
+        '''InsertFromIterator progress callback of the current table'''
+        SrumHandler._SetJournalRecord(
+            cursor,
+            self.storage_name,
+            self.next_record
+        )
+    
+    def _CompleteJournal(self,table):
+        '''Record that the current table is converted
+        
+        Args:
+            table: A pyesedb table object'''
+        self.outputDbHandler.Execute(
+            u"UPDATE '{}' SET NextRecord = ?, Complete = 1 WHERE TableName = ?".format(
+                SrumHandler.JOURNAL_TABLE
+            ),
+            (table.get_number_of_records(),self.storage_name)
+        )
+    
+    @staticmethod
+    def _GetKeyColumn(table):
+        '''Get the column used as the high water mark of a table
+        
+        Args:
+            table: A pyesedb table object
+        Returns:
+            key: (index, name, unpack) or None if the table has no such column'''
+        columns = dict(
+            (column.name,(index,column.type))
+            for index,column in enumerate(table.columns)
+        )
+        for name in SrumHandler.HIGH_WATER_MARK_COLUMNS:
+            if name not in columns:
+                continue
+            
+            index,column_type = columns[name]
+            if column_type in SrumHandler.TYPE_STRUCTS:
+                return index,name,SrumHandler.TYPE_STRUCTS[column_type].unpack
+        
+        return None
+    
+    @staticmethod
+    def _GetRecordKey(table,key,record_index):
+        '''Get the key column value of a record
+        
+        Args:
+            table: A pyesedb table object
+            key: A key from _GetKeyColumn
+            record_index: The index of the record
+        Returns:
+            value: The key value or None'''
+        index,name,unpack = key
+        data = table.get_record(record_index).get_value_data(index)
+        if data is None:
+            return None
+        
+        return unpack(data)[0]
+    
+    def _GetAppendStart(self,table):
+        '''Get the index of the first record of the current table to convert.
+        
+        With --append, records up to the high water mark of the table are
+        already in the output database. ESE tables are stored in key order,
+        so the first newer record is found with a binary search instead of
+        reading every record. Tables without a key column are emptied and
+        converted again.
+        
+        Args:
+            table: A pyesedb table object
+        Returns:
+            start: The index of the first record to convert'''
+        if not self.append:
+            return 0
+        
+        key = self._GetKeyColumn(table)
+        if key is None:
+            self.outputDbHandler.Execute(
+                u"DELETE FROM '{}'".format(self.storage_name)
+            )
+            return 0
+        
+        high_water_mark = self.high_water_marks.get(self.table_name)
+        if high_water_mark is None:
+            #Database from before high water marks were recorded#
+            high_water_mark = self.outputDbHandler.FetchAll(
+                u"SELECT MAX(\"{}\") FROM '{}'".format(key[1],self.storage_name)
+            )[0][0]
+            if high_water_mark is None:
+                return 0
+        
+        low = 0
+        high = table.get_number_of_records()
+        while low < high:
+            middle = (low + high) // 2
+            value = SrumHandler._GetRecordKey(table,key,middle)
+            if value is not None and value <= high_water_mark:
+                low = middle + 1
+            else:
+                high = middle
+        
+        return low
+    
+    def _SetHighWaterMark(self,table):
+        '''Record the key of the last record of the current table. With
+        --since or --until the last record may be outside of the window, so
+        the last key that was converted is recorded instead. Records of the
+        window are then not converted again by the next --append.
+        
+        Args:
+            table: A pyesedb table object'''
+        key = self._GetKeyColumn(table)
+        number_of_records = table.get_number_of_records()
+        if key is None or number_of_records == 0:
+            return
+        
+        if (self.since or self.until) and self._GetWindowColumn(table) is not None:
+            high_water_mark = self.outputDbHandler.FetchAll(
+                u"SELECT MAX(\"{}\") FROM '{}'".format(key[1],self.storage_name)
+            )[0][0]
+        else:
+            high_water_mark = SrumHandler._GetRecordKey(
+                table,
+                key,
+                number_of_records - 1
+            )
+        previous = self.high_water_marks.get(self.table_name)
+        if high_water_mark is None:
+            return
+        elif previous is not None and high_water_mark < previous:
+            logging.warning(u'{}: {} {} is lower than the recorded {}. The SRUM database may have been recreated; no records were appended.'.format(
+                self.table_name,key[1],high_water_mark,previous
+            ))
+            return
+        
+        self.outputDbHandler.Execute(
+            u"INSERT OR REPLACE INTO '{}' (TableName, KeyColumn, HighWaterMark) VALUES (?, ?, ?)".format(
+                SrumHandler.HIGH_WATER_MARK_TABLE
+            ),
+            (self.table_name,key[1],high_water_mark)
+        )
+        self.high_water_marks[self.table_name] = high_water_mark
+    
+    def _CreateTimestampViews(self):
+        '''Create a view for every epoch table that presents the timestamp
+        columns as text so that templates can query it like a table with
+        datetime columns.'''
+        for view_name,(table_name,timestamp_columns) in sorted(self.timestamp_views.items()):
+            self.outputDbHandler.CreateTimestampView(
+                view_name,
+                table_name,
+                timestamp_columns
+            )
+    
+    def _ConvertDbParallel(self):
+        '''Convert tables in a pool of worker processes. Each worker converts a
+        table into its own shard database which is then merged into the output
+        database.'''
+        shard_folder = tempfile.mkdtemp(
+            prefix='SRUM.shards.',
+            dir=os.path.dirname(os.path.abspath(self.output_db))
+        )
+        
+        try:
+            tasks = []
+            next_part = {}
+            pending = {}
+            #{table_name:[the stop of every range]}#
+            stops = {}
+            for table in self.esedb_file.tables:
+                self._SetCurrentTable(
+                    table
+                )
+                if not self._IsTableSelected(table):
+                    continue
+                
+                self._CreateTable(
+                    table
+                )
+                
+                start = self._GetStart(
+                    table
+                )
+                if start is None:
+                    print 'Skipping Table {} as {} [converted before]'.format(
+                        table.name,self.table_name
+                    )
+                    continue
+                
+                self._StartJournal(
+                    table,
+                    start
+                )
+                next_part[self.storage_name] = 0
+                pending[self.storage_name] = {}
+                
+                ranges = SrumHandler._GetRecordRanges(
+                    table.get_number_of_records(),
+                    self.split_records,
+                    start=start
+                )
+                stops[self.storage_name] = [stop for start,stop in ranges]
+                for part,(start,stop) in enumerate(ranges):
+                    shard_db = os.path.join(
+                        shard_folder,
+                        '{}.db'.format(len(tasks))
+                    )
+                    tasks.append((
+                        stop - start,
+                        (self.options,SrumHandler.GUID_TABLES,table.name,part,start,stop,shard_db,self.metrics is not None)
+                    ))
+            
+            #Start the largest tables and ranges first so they do not finish#
+            #last. The sort is stable so the ranges of a table stay in order.#
+            tasks.sort(key=lambda task: task[0],reverse=True)
+            
+            pool = multiprocessing.Pool(
+                processes=self.workers
+            )
+            try:
+                results = pool.imap_unordered(
+                    ConvertTableShard,
+                    [task for count,task in tasks]
+                )
+                for table_name,part,shard_db,stages in results:
+                    if self.metrics is not None:
+                        self.metrics.stages.extend(stages)
+                    
+                    #Merge the ranges of a table in record order#
+                    pending[table_name][part] = shard_db
+                    while next_part[table_name] in pending[table_name]:
+                        shard_db = pending[table_name].pop(next_part[table_name])
+                        merge_start = time.time()
+                        self.outputDbHandler.MergeDatabase(
+                            shard_db,
+                            [table_name],
+                            progress=lambda cursor: SrumHandler._SetJournalRecord(
+                                cursor,
+                                table_name,
+                                stops[table_name][next_part[table_name]]
+                            )
+                        )
+                        if self.metrics is not None:
+                            self.metrics.AddStage(
+                                'merge',
+                                table_name,
+                                time.time() - merge_start,
+                                size=PerformanceMetrics.GetFileSize(shard_db),
+                                details={'part':next_part[table_name]}
+                            )
+                        os.remove(shard_db)
+                        next_part[table_name] += 1
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+            
+            for table in self.esedb_file.tables:
+                self._SetCurrentTable(
+                    table
+                )
+                if self.storage_name in next_part:
+                    self._SetHighWaterMark(
+                        table
+                    )
+                    self._CompleteJournal(
+                        table
+                    )
+        finally:
+            shutil.rmtree(shard_folder,ignore_errors=True)
+    
+    @staticmethod
+    def _GetRecordRanges(number_of_records,split_records,start=0):
+        '''Split a table into record index ranges
+        
+        Args:
+            number_of_records: The number of records in the table
+            split_records: The maximum number of records per range
+            start: The index of the first record to convert
+        Returns:
+            ranges: A list of (start, stop) tuples. A table that is not
+            larger than split_records is one (start, number_of_records)
+            range. Empty if there are no records from start on.'''
+        if start and start >= number_of_records:
+            return []
+        elif number_of_records - start <= split_records:
+            return [(start,number_of_records)]
+        
+        ranges = []
+        for range_start in xrange(start,number_of_records,split_records):
+            ranges.append((
+                range_start,
+                min(range_start + split_records,number_of_records)
+            ))
+        
+        return ranges
+    
+    def _SetCurrentTable(self,table):
+        '''Set the output table name for a pyesedb table
+        
+        Args:
+            table: A pyesedb table object'''
+        #Enumerate if GUID Table#
+        self.table_name = table.name
+        if self.table_name.upper() in SrumHandler.GUID_TABLES:
+            self.table_name = SrumHandler.GUID_TABLES[self.table_name]
+            
+        ###Check if Table Name is GUID###
+        regexp = re.compile(r'^\{[0-9a-zA-Z]{8}\-[0-9a-zA-Z]{4}\-[0-9a-zA-Z]{4}\-[0-9a-zA-Z]{4}\-[0-9a-zA-Z]{12}\}')
+        if regexp.search(self.table_name) is not None:
+            self.table_name = self._CreateTableNameFromGuid(
+                self.table_name
+            )
+        
+        #The table records are stored in#
+        self.storage_name = self.table_name
+        if self.timestamp_format == 'epoch' and self._GetTimestampColumns(table):
+            self.storage_name = self.table_name + EPOCH_TABLE_SUFFIX
+        
+        SrumHandler.CURRENT_LOCATION['table'] = table.name
+        SrumHandler.CURRENT_LOCATION['table_enum'] = self.table_name
+    
+    def _IsTableSelected(self,table):
+        '''Check the current table against --tables and --exclude_tables
+        
+        Args:
+            table: A pyesedb table object
+        Returns:
+            selected: True if the table is to be converted'''
+        names = set([
+            table.name.lower(),
+            self.table_name.lower()
+        ])
+        if self.tables and not names & self.tables:
+            return False
+        elif names & self.exclude_tables:
+            return False
+        
+        return True
+    
+    def _GetWindowColumn(self,table):
+        '''Get the index of the OleDatetime TimeStamp column --since and
+        --until are checked against
+        
+        Args:
+            table: A pyesedb table object
+        Returns:
+            index: The column index or None if the table has no TimeStamp'''
+        for index,column in enumerate(table.columns):
+            if column.name == 'TimeStamp' and column.type == DBTYPES.DATE_TIME:
+                return index
+        
+        return None
+    
+    def _FilterRecords(self,table,records):
+        '''Skip the records outside of the --since/--until window. The raw
+        TimeStamp is compared as an OLE day count before any column of the
+        record is decoded.
+        
+        Args:
+            table: A pyesedb table object
+            records: An iterator of (record index, pyesedb record) tuples
+        Returns:
+            records: An iterator of the tuples of the records in the window'''
+        index = self._GetWindowColumn(table)
+        if index is None or not (self.since or self.until):
+            return records
+        
+        since = GetOleDays(self.since) if self.since else None
+        until = GetOleDays(self.until) if self.until else None
+        unpack = SrumHandler.TYPE_STRUCTS[DBTYPES.DOUBLE_64BIT].unpack
+        
+        def in_window(item):
+            data = item[1].get_value_data(index)
+            if data is None or len(data) != 8:
+                return False
+            
+            value = unpack(data)[0]
+            if since is not None and value < since:
+                return False
+            elif until is not None and value >= until:
+                return False
+            
+            return True
         
-        return new_value
-    
-    def _GetCustomValue(self,custom_info,data):
-        value = data
-        if 'type' in custom_info:
-            if custom_info['type'] == 'utf-16le':
-                value = data.decode('utf-16le')
-            elif custom_info['type'] == 'ChannelHints':
-                value = ChannelHints(data)
-            elif custom_info['type'] == 'WinDatetime':
-                value = GetWinTimeStamp(data)
-                
-        return value
+        return itertools.ifilter(in_window,records)
     
-class SrumHandler():
-    '''A Handler for converting SRU to SQLite'''
-    CURRENT_LOCATION = {
-        'table':None,
-        'table_enum':None,
-        'column':None
-    }
-    GUID_TABLES = {
-        '{DD6636C4-8929-4683-974E-22C046A43763}':'NetworkConnectivityData',
-        '{D10CA2FE-6FCF-4F6D-848E-B2E99266FA89}':'ApplicationResourceUsageData',
-        '{973F5D5C-1D90-4944-BE8E-24B94231A174}':'NetworkUsageData',
-        '{D10CA2FE-6FCF-4F6D-848E-B2E99266FA86}':'EnergyUsageData',
-        '{FEE4E14F-02A9-4550-B5CE-5FA2DA202E37}':'WindowsPushNotificationData',
-        '{FEE4E14F-02A9-4550-B5CE-5FA2DA202E37}LT':'WindowsPushNotificationDataLT',
-    }
-    SQLITE_TYPE = {
-        'DATETIME':[
-            pyesedb.column_types.DATE_TIME
-        ],
-        'REAL':[
-            pyesedb.column_types.DOUBLE_64BIT,
-            pyesedb.column_types.FLOAT_32BIT
-        ],
-        'INTEGER':[
-            pyesedb.column_types.BOOLEAN,
-            pyesedb.column_types.INTEGER_16BIT_SIGNED,
-            pyesedb.column_types.INTEGER_16BIT_UNSIGNED,
-            pyesedb.column_types.INTEGER_32BIT_SIGNED,
-            pyesedb.column_types.INTEGER_32BIT_UNSIGNED,
-            pyesedb.column_types.INTEGER_64BIT_SIGNED,
-            pyesedb.column_types.INTEGER_8BIT_UNSIGNED
-        ],
-        'BLOB':[
-            pyesedb.column_types.BINARY_DATA,
-            pyesedb.column_types.LARGE_BINARY_DATA
-        ],
-        'TEXT':[
-            pyesedb.column_types.GUID,
-            pyesedb.column_types.LARGE_TEXT,
-            pyesedb.column_types.SUPER_LARGE_VALUE,
-            pyesedb.column_types.TEXT
-        ]
-    }
+    def _GetTimestampColumns(self,table):
+        '''Get the names of the timestamp columns of a table
+        
+        Args:
+            table: A pyesedb table object
+        Returns:
+            column_names: A list of column names'''
+        column_names = []
+        for column in table.columns:
+            custom_info = self._GetCustomInfo(column.name)
+            if custom_info is not None:
+                if custom_info.get('type') in SrumHandler.BATCH_DECODERS:
+                    column_names.append(column.name)
+            elif column.type == DBTYPES.DATE_TIME:
+                column_names.append(column.name)
+        
+        return column_names
     
-    #If Columns have same name but need to be treated differently#
-    CUSTOM_TABLES = {
+    def _GetCustomInfo(self,column_name):
+        '''Get the custom info of a column of the current table
         
-    }
+        Returns:
+            custom_info: The CUSTOM_TABLES or CUSTOM_COLUMNS info or None'''
+        custom_table = SrumHandler.CUSTOM_TABLES.get(self.table_name,{})
+        if column_name in custom_table:
+            return custom_table[column_name]
+        
+        return SrumHandler.CUSTOM_COLUMNS.get(column_name)
     
-    #How to decode a special column#
-    CUSTOM_COLUMNS = {
-        'EventTimestamp':{
-            'type':'WinDatetime'
-        },
-        'ConnectStartTime':{
-            'type':'WinDatetime'
-        },
-        'LocaleName':{
-            'type':'utf-16le'
-        },
-        'Key':{
-            'type':'utf-16le'
-        },
-        'IdBlob':{
-            'type':'IdBlob'
+    def _InsertTable(self,table,start=None,stop=None,progress=None):
+        '''Decode and insert the records of a table
+        
+        Args:
+            table: A pyesedb table object
+            start: Optional first record index
+            stop: Optional record index to stop before
+            progress: Optional InsertFromIterator progress callback. When it
+                runs, self.next_record is the index after the record of the
+                last row of the batch.
+        Returns:
+            count: The number of records inserted'''
+        column_names = [
+            name for index,name,column,policy in self._GetOutputColumns(table)
+        ]
+        
+        rows = self._EnumerateRecords(table,start=start,stop=stop)
+        if self.metrics is None:
+            return self.outputDbHandler.InsertFromIterator(
+                self.storage_name,
+                rows,
+                column_names,
+                batch_size=self.batch_size,
+                progress=progress
+            )
+        
+        #Split the time into reading records, decoding them and inserting#
+        self.table_timings = {'ese_read':0.0,'records':0.0}
+        output_size = PerformanceMetrics.GetFileSize(self.output_db)
+        table_start = time.time()
+        count = self.outputDbHandler.InsertFromIterator(
+            self.storage_name,
+            PerformanceMetrics.TimeIterator(rows,self.table_timings,'records'),
+            column_names,
+            batch_size=self.batch_size,
+            progress=progress
+        )
+        elapsed = time.time() - table_start
+        
+        details = {
+            'ese_read':self.table_timings['ese_read'],
+            'decode':self.table_timings['records'] - self.table_timings['ese_read'],
+            'insert':elapsed - self.table_timings['records']
         }
-    }
-
-    def __init__(self,options,guid_table=None):
-        '''Create a SrumHandler
+        if start is not None or stop is not None:
+            details['start'] = start
+            details['stop'] = stop
+        
+        self.metrics.AddStage(
+            'table',
+            self.table_name,
+            elapsed,
+            rows=count,
+            size=PerformanceMetrics.GetFileSize(self.output_db) - output_size,
+            details=details
+        )
+        
+        return count
+            
+    def _EnumerateRecords(self,table,start=None,stop=None):
+        '''Yield decoded records for a table one at a time
         
         Args:
-            options: Options
-            guid_table: Optional guid table mapping'''
-        self.srum_db = options.srum_db
-        self.output_db = options.output_db
+            table: A pyesedb table object
+            start: Optional first record index
+            stop: Optional record index to stop before
+            
+        Yields:
+            row: a record as a tuple in column order'''
+        plan = self._CompileDecoderPlan(
+            table
+        )
+        if start is None and stop is None:
+            records = table.records
+        else:
+            records = (
+                table.get_record(index) for index in xrange(start,stop)
+            )
+        if self.metrics is not None:
+            records = PerformanceMetrics.TimeIterator(
+                records,
+                self.table_timings,
+                'ese_read'
+            )
+        self.next_record = start or 0
+        records = itertools.izip(
+            itertools.count(self.next_record),
+            records
+        )
+        records = self._FilterRecords(
+            table,
+            records
+        )
         
-        self.esedb_file = pyesedb.file()
-        self.esedb_file.open(self.srum_db)
+        #Columns whose raw values are decoded a chunk of records at a time#
+        batch_columns = [
+            (position,batch_decoder)
+            for position,(index,name,decoder,batch_decoder) in enumerate(plan)
+            if batch_decoder is not None
+        ]
         
-        if guid_table:
-            SrumHandler.GUID_TABLES = guid_table
+        if not batch_columns:
+            for index,record in records:
+                row = tuple(self._DecodeRecord(
+                    plan,
+                    record
+                ))
+                self.next_record = index + 1
+                yield row
+            return
         
-        self.outputDbConfig = DbConfig(
-            dbname=self.output_db
+        while True:
+            chunk = list(itertools.islice(records,SrumHandler.DECODE_CHUNK_ROWS))
+            if not chunk:
+                break
+            
+            rows = [
+                self._DecodeRecord(plan,record)
+                for index,record in chunk
+            ]
+            for position,batch_decoder in batch_columns:
+                values = batch_decoder([row[position] for row in rows])
+                for row,value in itertools.izip(rows,values):
+                    row[position] = value
+            
+            for (index,record),row in itertools.izip(chunk,rows):
+                self.next_record = index + 1
+                yield tuple(row)
+            
+    def _CreateTable(self,table):
+        '''Create a table
+        
+        Args:
+            table: A pyesedb table object'''
+        column_names = [
+            name for index,name,column,policy in self._GetOutputColumns(table)
+        ]
+        
+        field_mapping = self._CreateFieldMapping(
+            table
         )
         
-        self.outputDbHandler = DbHandler(
-            self.outputDbConfig
+        if self.storage_name != self.table_name:
+            self.timestamp_views[self.table_name] = (
+                self.storage_name,
+                self._GetTimestampColumns(table)
+            )
+        
+        self.outputDbHandler.CreateTableFromMapping(
+            self.storage_name,
+            field_mapping,
+            None,
+            column_names
         )
         
-    def _CreateTableNameFromGuid(self,guid):
-        '''If you wanted to change the table name of a guid table'''
-        new_table_name = guid
+    def _CreateFieldMapping(self,table):
+        '''Create a field mapping (table schema) for the SQLite table
         
-        #new_table_name = new_table_name.replace('{','')
-        #new_table_name = new_table_name.replace('}','')
-        #new_table_name = new_table_name.replace('-','')
+        Args:
+            table: A pyesedb table object
+            
+        Return:
+            field_mapping: A dictionary of column to type mappings'''
+        field_mapping = {}
+        for index,key,column,policy in self._GetOutputColumns(table):
+            if policy == 'digest':
+                field_mapping[key] = 'TEXT'
+            elif policy == 'size':
+                field_mapping[key] = 'INTEGER'
+            elif column.type in SrumHandler.SQLITE_TYPE['TEXT']:
+                field_mapping[key] = 'TEXT'
+            elif column.type in SrumHandler.SQLITE_TYPE['BLOB']:
+                field_mapping[key] = 'BLOB'
+            elif column.type in SrumHandler.SQLITE_TYPE['INTEGER']:
+                field_mapping[key] = 'INTEGER'
+            elif column.type in SrumHandler.SQLITE_TYPE['REAL']:
+                field_mapping[key] = 'REAL'
+            elif column.type in SrumHandler.SQLITE_TYPE['DATETIME']:
+                if self.timestamp_format == 'epoch':
+                    field_mapping[key] = 'INTEGER'
+                else:
+                    field_mapping[key] = 'DATETIME'
+            else:
+                logging.error('Type not accounted for in table mapping creation: {}'.format(column.type))
+                sys.exit(1)
         
-        return new_table_name
+        return field_mapping
+    
+    def _GetBinaryPolicy(self,column):
+        '''Get the policy of a column of the current table. Policies only
+        apply to binary columns without a custom decoder.
         
-    def ConvertDb(self):
-        '''Convert SRU Database to a SQLite Database'''
-        for table in self.esedb_file.tables:
-            #Enumerate if GUID Table#
-            self.table_name = table.name
-            if self.table_name.upper() in SrumHandler.GUID_TABLES:
-                self.table_name = SrumHandler.GUID_TABLES[self.table_name]
-                
-            ###Check if Table Name is GUID###
-            regexp = re.compile(r'^\{[0-9a-zA-Z]{8}\-[0-9a-zA-Z]{4}\-[0-9a-zA-Z]{4}\-[0-9a-zA-Z]{4}\-[0-9a-zA-Z]{12}\}')
-            if regexp.search(self.table_name) is not None:
-                self.table_name = self._CreateTableNameFromGuid(
-                    self.table_name
-                )
+        Args:
+            column: A pyesedb column object
+        Returns:
+            policy: eager, skip or digest'''
+        if column.type not in SrumHandler.BINARY_TYPES:
+            return 'eager'
+        elif self._GetCustomInfo(column.name) is not None:
+            return 'eager'
+        
+        for name in [u'{}.{}'.format(self.table_name,column.name),column.name]:
+            if name.lower() in self.column_policies:
+                return self.column_policies[name.lower()]
+        
+        return self.binary_columns
+    
+    def _GetOutputColumns(self,table):
+        '''Get the SQLite columns of a table after applying the binary column
+        policies
+        
+        Args:
+            table: A pyesedb table object
+        Returns:
+            columns: A list of (index, name, column, policy) tuples in output
+            order. A digest column is followed by its <column>_Size column
+            with the policy size and the index None.'''
+        columns = []
+        for index,column in enumerate(table.columns):
+            policy = self._GetBinaryPolicy(column)
+            if policy == 'skip':
+                continue
+            
+            columns.append((index,column.name,column,policy))
+            if policy == 'digest':
+                columns.append((None,column.name + '_Size',column,'size'))
+        
+        return columns
+    
+    def _CompileDecoderPlan(self,table):
+        '''Compile the decoders for a table once so that records can be decoded
+        without looking up column names and types for every cell.
+        
+        Args:
+            table: A pyesedb table object
+        Returns:
+            plan: A list of (index, name, decoder, batch_decoder) tuples in
+            column order. A decoder is called as decoder(data, row) where row
+            is the list of values already decoded for the record. If
+            batch_decoder is not None the decoder keeps the raw data and
+            batch_decoder converts a list of raw values for a chunk of
+            records at once. An index of None decodes the raw data of the
+            previous column again.'''
+        output_columns = self._GetOutputColumns(table)
+        column_names = [name for index,name,column,policy in output_columns]
+        
+        plan = []
+        for index,name,column,policy in output_columns:
+            if policy == 'digest':
+                plan.append((index,name,lambda data,row: hashlib.sha1(data).hexdigest(),None))
+                continue
+            elif policy == 'size':
+                plan.append((index,name,lambda data,row: len(data),None))
+                continue
             
-            SrumHandler.CURRENT_LOCATION['table'] = table.name
-            SrumHandler.CURRENT_LOCATION['table_enum'] = self.table_name
+            custom_info = self._GetCustomInfo(name)
             
-            print 'Converting Table {} as {}'.format(table.name,self.table_name)
+            if custom_info is not None:
+                batch_decoder = SrumHandler.BATCH_DECODERS.get(
+                    custom_info.get('type')
+                )
+            elif column.type == DBTYPES.DATE_TIME:
+                batch_decoder = SrumHandler.BATCH_DECODERS['OleDatetime']
+            else:
+                batch_decoder = None
             
-            column_names = []
-            for column in table.columns:
-                column_names.append(column.name)
-                
-            self._CreateTable(
-                table
-            )
+            if batch_decoder is not None and self.timestamp_format == 'epoch':
+                batch_decoder = lambda raw_values,decode=batch_decoder: GetEpochMicroseconds(
+                    decode(raw_values)
+                )
             
-            num_of_columns = table.get_number_of_columns()
-            items_to_insert = []
-            for record in table.records:
-                enum_record = self._EnumerateRecord(
-                    num_of_columns,
-                    record
+            if batch_decoder is not None:
+                decoder = lambda data,row: data
+            elif custom_info is not None:
+                decoder = self._GetCustomDecoder(
+                    custom_info,
+                    column_names
+                )
+            else:
+                decoder = SrumHandler._GetTypeDecoder(
+                    column.type
                 )
-                items_to_insert.append(enum_record)
-                
-            self.outputDbHandler.InsertFromListOfDicts(
-                self.table_name,
-                items_to_insert,
-                column_names
-            )
             
-    def _CreateTable(self,table):
-        '''Create a table
+            plan.append((index,name,decoder,batch_decoder))
+        
+        return plan
+    
+    def _DecodeRecord(self,plan,record):
+        '''Decode a record with a compiled decoder plan
         
         Args:
-            table: A pyesedb table object'''
-        column_names = []
-        for column in table.columns:
-            column_names.append(column.name)
+            plan: A plan from _CompileDecoderPlan
+            record: a pyesedb record object
+        Returns:
+            row: the record as a list in column order'''
+        row = []
+        append = row.append
+        get_value_data = record.get_value_data
+        data = None
+        for index,name,decoder,batch_decoder in plan:
+            if index is not None:
+                data = get_value_data(index)
+            if data is None:
+                append(None)
+                continue
+            
+            try:
+                append(decoder(data,row))
+            except Exception:
+                SrumHandler.CURRENT_LOCATION['column'] = name
+                raise
         
-        field_mapping = self._CreateFieldMapping(
+        return row
+    
+    @staticmethod
+    def _GetTypeDecoder(dtype):
+        '''Get the decoder for a pyesedb column type
+        
+        Args:
+            dtype: The pyesedb column type
+        Returns:
+            decoder: A callable taking (data, row)'''
+        if dtype in SrumHandler.TYPE_STRUCTS:
+            unpack = SrumHandler.TYPE_STRUCTS[dtype].unpack
+            return lambda data,row: unpack(data)[0]
+        elif dtype in SrumHandler.RAW_TYPES:
+            return lambda data,row: data
+        elif dtype == DBTYPES.GUID:
+            return lambda data,row: str(uuid.UUID(bytes_le=data))
+        elif dtype == DBTYPES.DATE_TIME:
+            return lambda data,row: GetOleTimeStamp(data)
+        
+        def unknown(data,row):
+            msg = 'UNKNOWN TYPE {}'.format(dtype)
+            logging.error(msg)
+            raise Exception(msg)
+        
+        return unknown
+    
+    def _GetCustomDecoder(self,custom_info,column_names):
+        '''Get a decoder for a column based off of defined criteria.
+        
+        Used to parse binary data within columns such as timestamps.
+        
+        Args:
+            custom_info: A columns info from SrumHandler.CUSTOM_COLUMNS
+            column_names: The column names of the table in order
+        Returns:
+            decoder: A callable taking (data, row)'''
+        ctype = custom_info.get('type')
+        if ctype == 'utf-16le':
+            decode = SrumHandler.STRING_CACHE.Decode
+            return lambda data,row: decode(data)
+        elif ctype == 'OleDatetime':
+            return lambda data,row: GetOleTimeStamp(data)
+        elif ctype == 'WinDatetime':
+            return lambda data,row: GetWinTimeStamp(data)
+        elif ctype == 'IdBlob':
+            id_type_index = column_names.index('IdType')
+            return lambda data,row: SrumHandler._DecodeIdBlob(
+                data,
+                row[id_type_index]
+            )
+        
+        return lambda data,row: data
+    
+    @staticmethod
+    def _DecodeIdBlob(data,id_type):
+        '''Decode an IdBlob from the SruDbIdMapTable
+        
+        Args:
+            data: The raw IdBlob
+            id_type: The IdType of the record
+        Returns:
+            value: A path/name string, a SID string or the raw data'''
+        if id_type == 2 or id_type == 1 or id_type == 0:
+            return SrumHandler.STRING_CACHE.Decode(data)
+        elif id_type == 3:
+            return SrumHandler.SID_CACHE.Decode(data)
+        
+        return data
+
+def ConvertTableShard(task):
+    '''Convert one ESE table, or a record range of it, into a shard database.
+    Runs in a worker process and opens its own pyesedb file.
+    
+    Args:
+        task: (options, guid_table, esedb table name, part, start, stop,
+            shard database path, collect metrics)
+    Returns:
+        (table_name, part, shard_db, stages): The table the records are
+        stored in, the range part number, the shard path and the metrics
+        stages of the shard'''
+    options,guid_table,esedb_table_name,part,start,stop,shard_db,collect_metrics = task
+    
+    metrics = None
+    if collect_metrics:
+        metrics = PerformanceMetrics()
+    
+    shard_options = copy.copy(options)
+    shard_options.output_db = shard_db
+    shard_options.workers = 1
+    
+    #Shards are temporary so durability does not matter#
+    db_handler = DbHandler(
+        DbConfig(
+            dbname=shard_db
+        )
+    )
+    db_handler.BeginBulkLoad()
+    try:
+        handler = SrumHandler(
+            shard_options,
+            guid_table=guid_table,
+            db_handler=db_handler,
+            metrics=metrics
+        )
+        table = handler.esedb_file.get_table_by_name(
+            esedb_table_name
+        )
+        handler._SetCurrentTable(
             table
         )
         
-        self.outputDbHandler.CreateTableFromMapping(
-            self.table_name,
-            field_mapping,
-            None,
-            column_names
+        print 'Converting Table {} as {} [records {}-{}]'.format(
+            table.name,handler.table_name,start,stop
         )
         
-    def _CreateFieldMapping(self,table):
-        '''Create a field mapping (table schema) for the SQLite table
+        handler._CreateTable(
+            table
+        )
+        handler._InsertTable(
+            table,
+            start=start,
+            stop=stop
+        )
+        if handler.input_file is not None:
+            handler.input_file.Report(
+                metrics=metrics
+            )
+    finally:
+        db_handler.EndBulkLoad()
+    
+    return handler.storage_name,part,shard_db,metrics.stages if metrics else []
+
+class ExtractHandler():
+    '''Extracts raw column values from a SRUM database, for columns that
+    were converted with the digest policy'''
+    def __init__(self,srum_db,guid_table=None):
+        '''Create an ExtractHandler
         
         Args:
-            table: A pyesedb table object
-            
-        Return:
-            field_mapping: A dictionary of column to type mappings'''
-        field_mapping = {}
-        for column in table.columns:
-            key = column.name
-            
-            if column.type in SrumHandler.SQLITE_TYPE['TEXT']:
-                field_mapping[key] = 'TEXT'
-            elif column.type in SrumHandler.SQLITE_TYPE['BLOB']:
-                field_mapping[key] = 'BLOB'
-            elif column.type in SrumHandler.SQLITE_TYPE['INTEGER']:
-                field_mapping[key] = 'INTEGER'
-            elif column.type in SrumHandler.SQLITE_TYPE['REAL']:
-                field_mapping[key] = 'REAL'
-            elif column.type in SrumHandler.SQLITE_TYPE['DATETIME']:
-                field_mapping[key] = 'DATETIME'
-            else:
-                logging.error('Type not accounted for in table mapping creation: {}'.format(column.type))
-                sys.exit(1)
+            srum_db: The SRUM database
+            guid_table: Optional {GUID:table name} from the SOFTWARE hive
+                (RegistryHandler.ReadGuidTable). Without it GUID tables have
+                their built-in names, like SrumHandler.'''
+        self.esedb_file = pyesedb.file()
+        self.esedb_file.open(srum_db)
+        self.guid_table = guid_table or SrumHandler.GUID_TABLES
+    
+    def GetTable(self,table_name):
+        '''Get a table by its ESE name or the name it is converted to
         
-        return field_mapping
+        Returns:
+            table: A pyesedb table object or None'''
+        for table in self.esedb_file.tables:
+            names = [table.name.lower()]
+            if table.name.upper() in self.guid_table:
+                names.append(self.guid_table[table.name.upper()].lower())
+            if table_name.lower() in names:
+                return table
+        
+        return None
     
-    def _EnumerateRecord(self,num_of_columns,record):
-        '''Enumerate vales for a record
+    def GetValue(self,table,column_name,key=None,digest=None):
+        '''Get the raw value of a column for the record with a key, or the
+        first record whose value has a SHA-1 digest
         
-        Args:
-            num_of_columns: The number of columns in the record
-            record: a pyesedb record object
-            
         Returns:
-            values: the record as a dictionary'''
-        values = {}
-        for index in range(0,num_of_columns):
-            self.CURRENT_VALUES = values
-            data = self._GetColumnValueFromRecord(
-                record,
-                index
-            )
+            data: The raw value or None if no record matched'''
+        column_names = [column.name for column in table.columns]
+        if column_name not in column_names:
+            raise Exception(u'No column {} in {}'.format(column_name,table.name))
+        index = column_names.index(column_name)
+        
+        if key is not None:
+            key_column = SrumHandler._GetKeyColumn(table)
+            if key_column is None:
+                raise Exception(u'{} has no key column'.format(table.name))
+            
+            #Records are stored in key order#
+            low = 0
+            high = table.get_number_of_records()
+            while low < high:
+                middle = (low + high) // 2
+                value = SrumHandler._GetRecordKey(table,key_column,middle)
+                if value is not None and value < key:
+                    low = middle + 1
+                else:
+                    high = middle
             
-            values.update(data)
+            if low < table.get_number_of_records() and SrumHandler._GetRecordKey(table,key_column,low) == key:
+                return table.get_record(low).get_value_data(index)
             
-        return values
+            return None
         
-    def _GetColumnValueFromRecord(self,record,index):
-        '''Get enumerated value based off of column and/or type
+        digest = digest.lower()
+        for record in table.records:
+            data = record.get_value_data(index)
+            if data is not None and hashlib.sha1(data).hexdigest() == digest:
+                return data
         
-        Args:
-            record: a pyesedb record object
-            index: the column index for record
-        Return:
-            value: The value of a column for the record
-        '''
-        item = {}
-        value = None
-        name = record.get_column_name(index)
-        dtype = record.get_column_type(index)
-        data = record.get_value_data(index)
+        return None
+    
+    def Extract(self,table_name,column_name,outfile,key=None,digest=None):
+        '''Write the raw value of a column to a file
         
-        SrumHandler.CURRENT_LOCATION['column'] = name
+        Returns:
+            extracted: True if a value was found and written'''
+        table = self.GetTable(table_name)
+        if table is None:
+            logging.error(u'No table {} in the SRUM database (tables converted with a SOFTWARE hive need --software_hive)'.format(table_name))
+            return False
         
+        data = self.GetValue(table,column_name,key=key,digest=digest)
         if data is None:
-            item = {name:None}
-            return item
-        
-        ###CHECK FOR CUSTOM DEFINED TABLE COLUMNS TYPES###
-        if self.table_name in SrumHandler.CUSTOM_TABLES:
-            if name in SrumHandler.CUSTOM_TABLES[self.table_name]:
-                value = self._GetCustomValue(
-                    SrumHandler.CUSTOM_TABLES[name][self.table_name],
-                    data
-                )
-                item = {name:value}
-                return item
-            
-        ###CHECK FOR CUSTOM DEFINED TABLE COLUMNS TYPES###
-        if name in SrumHandler.CUSTOM_COLUMNS:
-                value = self._GetCustomValue(
-                    SrumHandler.CUSTOM_COLUMNS[name],
-                    data
-                )
-                item = {name:value}
-                return item
-        
-        if dtype == DBTYPES.DOUBLE_64BIT:
-            value = struct.unpack('d',data)[0]
-        if dtype == DBTYPES.FLOAT_32BIT:
-            value = struct.unpack('f',data)[0]
-        if dtype == DBTYPES.BOOLEAN:
-            value = struct.unpack('?',data)[0]
-        elif dtype == DBTYPES.INTEGER_8BIT_UNSIGNED:
-            value = struct.unpack('B',data)[0]
-        elif dtype == DBTYPES.INTEGER_16BIT_SIGNED:
-            value = struct.unpack('h',data)[0]
-        elif dtype == DBTYPES.INTEGER_16BIT_UNSIGNED:
-            value = struct.unpack('H',data)[0]
-        elif dtype == DBTYPES.INTEGER_32BIT_SIGNED:
-            value = struct.unpack('i',data)[0]
-        elif dtype == DBTYPES.INTEGER_32BIT_UNSIGNED:
-            value = struct.unpack('I',data)[0]
-        elif dtype == DBTYPES.INTEGER_64BIT_SIGNED:
-            value = struct.unpack('q',data)[0]
-        elif dtype == DBTYPES.GUID:
-            value = uuid.UUID(bytes=data)
-        elif dtype == DBTYPES.LARGE_TEXT:
-            value = data
-        elif dtype == DBTYPES.SUPER_LARGE_VALUE:
-            value = data
-        elif dtype == DBTYPES.TEXT:
-            value = data
-        elif dtype == DBTYPES.BINARY_DATA:
-            value = data
-        elif dtype == DBTYPES.LARGE_BINARY_DATA:
-            value = data
-        elif dtype == DBTYPES.DATE_TIME:
-            value = GetOleTimeStamp(data)
-        else:
-            msg = 'UNKNOWN TYPE {}'.format(dtype)
-            logging.error(msg)
-            raise Exception(msg)
-        
-        item = {name:value}
+            logging.error(u'No {} value found in {}'.format(column_name,table.name))
+            return False
         
-        return item
-    
-    def _GetCustomValue(self,custom_info,data):
-        '''Get a value from a column based off of defined criteria.
+        with open(outfile,'wb') as fh:
+            fh.write(data)
         
-        Used to parse binary data within columns such as timestamps.
+        print u'Extracted {} bytes (SHA-1 {}) to {}'.format(
+            len(data),
+            hashlib.sha1(data).hexdigest(),
+            outfile
+        )
         
-        Args:
-            custom_info: A columns info from SrumHandler.CUSTOM_COLUMNS
-            data: The raw data from a records column
-        Returns:
-            value: The custom value'''
-        value = data
-        if 'type' in custom_info:
-            if custom_info['type'] == 'utf-16le':
-                value = data.decode('utf-16le')
-            elif custom_info['type'] == 'OleDatetime':
-                value = GetOleTimeStamp(data)
-            elif custom_info['type'] == 'WinDatetime':
-                value = GetWinTimeStamp(data)
-            elif custom_info['type'] == 'IdBlob':
-                if self.CURRENT_VALUES['IdType'] == 2 or self.CURRENT_VALUES['IdType'] == 1 or self.CURRENT_VALUES['IdType'] == 0:
-                    value = data.decode('utf-16le')
-                elif self.CURRENT_VALUES['IdType'] == 3:
-                    sid = SID(data)
-                    if sid:
-                        value = str(sid)
-                
-        return value
+        return True
 
 class Authority(long):
-    def __new__(self, buf):
-       return long.__new__(self, struct.unpack(">Q",('\x00\x00'+buf[0:6]))[0])
+    def __new__(self, buf, offset=0):
+       high,low = struct.unpack_from(">HL",buf,offset)
+       return long.__new__(self, (high << 32) | low)
     
 class SubAuthority(long):
-    def __new__(self, buf):
-       return long.__new__(self, struct.unpack("<L",buf[0:4])[0])
+    def __new__(self, buf, offset=0):
+       return long.__new__(self, struct.unpack_from("<L",buf,offset)[0])
 
 class SID(object):
     def __init__(self,buf):
-        self.revision = struct.unpack("<B",buf[0:1])[0]
-        self.sub_authority_count = struct.unpack("<B",buf[1:2])[0]
-        self.authority = Authority(buf[2:8])
-        self.sub_authorities = []
+        # Read the fields in place instead of slicing copies of the buffer
+        buf = memoryview(buf)
+        self.revision,self.sub_authority_count = struct.unpack_from("<BB",buf,0)
+        self.authority = Authority(buf,2)
         
         # Get sub authorities
-        offset = 8
-        for i in range(self.sub_authority_count):
-            self.sub_authorities.append(
-                SubAuthority(buf[offset:offset+4])
-            )
-            offset += 4
+        self.sub_authorities = [
+            SubAuthority(buf,offset)
+            for offset in xrange(8,8 + 4 * self.sub_authority_count,4)
+        ]
     
     def __str__(self):
         return 'S-{}-{}-{}'.format(
@@ -801,75 +5061,72 @@ class SID(object):
             '-'.join(str(x) for x in self.sub_authorities)
         )
 
-def GetOleTimeStamp(raw_timestamp):
-    '''Return Datetime from raw OleTimestamp'''
-    timestamp = struct.unpack(
-        "d",
-        raw_timestamp
-    )[0]
-    
-    origDateTime = datetime.datetime(
-        1899,
-        12,
-        30,
-        0,
-        0,
-        0
-    )
-    
-    timeDelta = datetime.timedelta(days=timestamp)
-    
-    new_datetime = origDateTime + timeDelta
-  
-    #new_datetime = new_datetime.strftime("%Y-%m-%d %H:%M:%S.%f")
-    
-    return new_datetime
-
-def GetWinTimeStamp(raw_timestamp):
-    '''Return Datetime from raw Win32Timestamp'''
-    timestamp = struct.unpack(
-        "Q",
-        raw_timestamp
-    )[0]
+def BasenameN(path,n):
+    '''Return the last n components of a Windows path
     
-    if datetime < 0:
+    Args:
+        path: The path
+        n: The number of trailing components to keep
+    Returns:
+        name: The components joined with a backslash or None if path is not a
+        string'''
+    if not isinstance(path,basestring):
         return None
     
-    microsecs, _ = divmod(
-        timestamp,
-        10
-    )
-    
-    timeDelta = datetime.timedelta(
-        microseconds=microsecs
-    )
-    
-    origDateTime = datetime.datetime(
-        1601,
-        1,
-        1
-    )
-    
-    new_datetime = origDateTime + timeDelta
-    #new_datetime = new_datetime.strftime("%Y-%m-%d %H:%M:%S.%f")
+    return '\\'.join(re.split(r'[\\/]',path)[-n:])
+
+def RegExp(pattern,value):
+    '''SQLite REGEXP operator'''
+    if value is None:
+        return False
     
-    return new_datetime
+    return re.search(pattern,value) is not None
+
+def RegisterFunctions(dbh):
+    '''Register the functions report queries can call'''
+    dbh.create_function('basename',1,lambda path: BasenameN(path,1))
+    dbh.create_function('BasenameN',2,BasenameN)
+    dbh.create_function('REGEXP',2,RegExp)
 
 class ChannelHints(dict):
     def __init__(self,data):
-        self['NameLength'] = struct.unpack("I",data[0:4])[0]
-        self['Name'] = data[4:4+self['NameLength']]
-        self['SSID'] = data[36:36+32].encode('hex')
+        data = memoryview(data)
+        self['NameLength'] = struct.unpack_from("I",data,0)[0]
+        self['Name'] = data[4:4+self['NameLength']].tobytes()
+        self['SSID'] = binascii.hexlify(data[36:36+32])
     
 class DbConfig():
     '''This tells the DbHandler what to connect too'''
-    def __init__(self,dbname=None):
+    def __init__(self,dbname=None,read_only=False):
         self.db = dbname
+        self.read_only = read_only
 
 class DbHandler():
+    #Load time settings. The output is rebuilt from scratch on failure, so#
+    #crash durability while loading is traded for speed.#
+    BULK_LOAD_PRAGMAS = [
+        ('page_size',32768),
+        ('journal_mode','OFF'),
+        ('synchronous','OFF'),
+        ('locking_mode','EXCLUSIVE'),
+        ('temp_store','MEMORY'),
+        ('cache_size',-262144)
+    ]
+    #Settings restored once the load is finished#
+    DURABLE_PRAGMAS = [
+        ('journal_mode','DELETE'),
+        ('synchronous','FULL'),
+        ('locking_mode','NORMAL')
+    ]
+    
     def __init__(self,db_config,table=None):
         #Db Flags#
         self.db_config = db_config
+        #INSERT statements by (table, column order, verb)#
+        self.insert_statements = {}
+        #Persistent connection while in bulk load mode#
+        self.dbh = None
+        self.bulk_load = False
         
     def CreateTableFromMapping(self,tbl_name,field_mapping,primary_key_str,field_order):
         dbh = self.GetDbHandle()
@@ -920,34 +5177,263 @@ class DbHandler():
             
         return sql
     
+    def GetInsertStatement(self,table,column_order,INSERT_STR=None):
+        '''Get the INSERT statement for a table and column order. Statements
+        are built once and reused so sqlite3 can keep them prepared.
+        
+        Args:
+            table: The table name to insert into
+            column_order: The column order for the insert
+            INSERT_STR: The insert verb (default: INSERT OR IGNORE)
+        Returns:
+            sql: The parameterized INSERT statement'''
+        key = (table,tuple(column_order),INSERT_STR)
+        if key not in self.insert_statements:
+            self.insert_statements[key] = self.CreateInsertString(
+                table,
+                {},
+                column_order,
+                INSERT_STR=INSERT_STR
+            )
+        
+        return self.insert_statements[key]
+    
     def InsertFromListOfDicts(self,table,rows_to_insert,column_order,INSERT_STR=None):
+        return self.InsertFromIterator(
+            table,
+            DbHandler.IterDictRows(rows_to_insert,column_order),
+            column_order,
+            INSERT_STR=INSERT_STR
+        )
+    
+    @staticmethod
+    def IterDictRows(rows,column_order):
+        '''Yield row dictionaries as tuples in column_order. Missing keys
+        become None.'''
+        for row in rows:
+            yield tuple(row.get(key) for key in column_order)
+    
+    def InsertFromIterator(self,table,row_iter,column_order,batch_size=DEFAULT_BATCH_SIZE,INSERT_STR=None,progress=None):
+        '''Bulk insert rows from an iterator with executemany, committing
+        every batch_size rows so that only one batch is ever held in memory.
+        
+        Args:
+            table: The table name to insert into
+            row_iter: An iterable of row sequences in column_order
+            column_order: The column order for the insert
+            batch_size: The number of rows to buffer per commit
+            INSERT_STR: The insert verb (default: INSERT OR IGNORE)
+            progress: Optional callable(cursor) run after every batch in the
+                transaction of the batch, to record progress with the rows
+        Returns:
+            count: The number of rows inserted'''
         dbh = self.GetDbHandle()
         # Set text_factory to str so we can insert raw bytes
         dbh.text_factory = str
         sql_c = dbh.cursor()
         
-        for row in rows_to_insert:
-            in_row = []
-            sql = self.CreateInsertString(
-                table,
-                row,
-                column_order,
-                INSERT_STR=None
-            )
-            
-            for key in column_order:
-                if key in row.keys():
-                    in_row.append(row[key])
-                else:
-                    in_row.append(None)
+        sql = self.GetInsertStatement(
+            table,
+            column_order,
+            INSERT_STR=INSERT_STR
+        )
+        
+        count = 0
+        row_iter = iter(row_iter)
+        while True:
+            batch = list(itertools.islice(row_iter,batch_size))
+            if not batch:
+                break
             
             try:
-                sql_c.execute(sql,in_row)
+                sql_c.executemany(sql,batch)
             except Exception as e:
-                error_str = "[ERROR] {}\n[SQL] {}\n[ROW] {}".format(str(e),sql,str(row))
+                error_str = "[ERROR] {}\n[SQL] {}\n[BATCH ROWS] {}-{}".format(
+                    str(e),sql,count,count+len(batch)
+                )
                 raise Exception('SQL Error. Error: {}'.format(error_str))
+            
+            if progress is not None:
+                progress(sql_c)
+            
+            # In bulk load mode the whole table is one transaction #
+            if not self.bulk_load:
+                dbh.commit()
+            count += len(batch)
+        
+        dbh.commit()
+        self.ReleaseDbHandle(dbh)
+        
+        return count
+    
+    def MergeDatabase(self,db_path,table_names,extra_values=None,column_expressions=None,progress=None):
+        '''Copy the rows of tables in another SQLite database into the same
+        tables of this database with ATTACH and INSERT...SELECT. The tables
+        must already exist here with at least the columns of the other
+        database.
+        
+        Args:
+            db_path: The database to merge from
+            table_names: The tables to copy
+            extra_values: Optional list of (column, value) to set on every
+                copied row
+            column_expressions: Optional {column:SQL expression} to copy a
+                column through. {0} in the expression is the quoted column
+            progress: Optional callable(cursor) run in the transaction of
+                the copy, to record progress with the rows'''
+        extra_values = extra_values or []
+        column_expressions = column_expressions or {}
+        
+        dbh = self.GetDbHandle()
+        cursor = dbh.cursor()
+        
+        cursor.execute('ATTACH DATABASE ? AS shard',(db_path,))
+        try:
+            for table_name in table_names:
+                cursor.execute("PRAGMA shard.table_info('{0:s}')".format(table_name))
+                columns = [row[1] for row in cursor.fetchall()]
+                
+                insert_columns = [column for column,value in extra_values] + columns
+                select_columns = [u'?' for column,value in extra_values]
+                for column in columns:
+                    quoted = u'"{}"'.format(column)
+                    if column in column_expressions:
+                        select_columns.append(column_expressions[column].format(quoted))
+                    else:
+                        select_columns.append(quoted)
+                
+                cursor.execute(
+                    u"INSERT INTO main.'{0:s}' ({1:s}) SELECT {2:s} FROM shard.'{0:s}'".format(
+                        table_name,
+                        ', '.join(u'"{}"'.format(column) for column in insert_columns),
+                        ', '.join(select_columns)
+                    ),
+                    [value for column,value in extra_values]
+                )
+            if progress is not None:
+                progress(cursor)
+            dbh.commit()
+        finally:
+            cursor.execute('DETACH DATABASE shard')
+        
+        self.ReleaseDbHandle(dbh)
+    
+    def GetTableNames(self):
+        '''Get the names of the tables in the database'''
+        dbh = self.GetDbHandle()
+        cursor = dbh.cursor()
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+        )
+        table_names = [row[0] for row in cursor.fetchall()]
+        self.ReleaseDbHandle(dbh)
+        
+        return table_names
+    
+    def GetColumnNames(self,table_name):
+        '''Get the column names of a table in order'''
+        dbh = self.GetDbHandle()
+        cursor = dbh.cursor()
+        cursor.execute("PRAGMA table_info('{0:s}')".format(table_name))
+        column_names = [row[1] for row in cursor.fetchall()]
+        self.ReleaseDbHandle(dbh)
+        
+        return column_names
+    
+    def GetFieldMapping(self,table_name):
+        '''Get the schema of a table in the form CreateTableFromMapping uses
+        
+        Returns:
+            (field_order, field_mapping): The column names in order and a
+            dictionary of column to declared type'''
+        rows = self.FetchAll(
+            "PRAGMA table_info('{0:s}')".format(table_name)
+        )
+        field_order = [row[1] for row in rows]
+        field_mapping = dict((row[1],row[2]) for row in rows)
+        
+        return field_order,field_mapping
+    
+    def AddColumn(self,table_name,column,column_type):
+        '''Add a column to a table if it does not exist
+        
+        Returns:
+            added: True if the column was added'''
+        if column in self.GetColumnNames(table_name):
+            return False
+        
+        dbh = self.GetDbHandle()
+        dbh.execute(u"ALTER TABLE '{}' ADD COLUMN '{}' {}".format(
+            table_name,
+            column,
+            column_type
+        ))
+        dbh.commit()
+        self.ReleaseDbHandle(dbh)
+        
+        return True
+    
+    def FetchAll(self,sql_string,parameters=()):
+        '''Run a query and return all of its rows as tuples'''
+        dbh = self.GetDbHandle()
+        cursor = dbh.cursor()
+        cursor.execute(sql_string,parameters)
+        rows = [tuple(row) for row in cursor.fetchall()]
+        self.ReleaseDbHandle(dbh)
         
+        return rows
+    
+    def Execute(self,sql_string,parameters=()):
+        '''Run a statement and commit'''
+        dbh = self.GetDbHandle()
+        dbh.execute(sql_string,parameters)
+        dbh.commit()
+        self.ReleaseDbHandle(dbh)
+    
+    def ExecuteMany(self,sql_string,rows):
+        '''Run a statement for every row and commit'''
+        dbh = self.GetDbHandle()
+        dbh.cursor().executemany(sql_string,rows)
+        dbh.commit()
+        self.ReleaseDbHandle(dbh)
+    
+    def CreateIndex(self,table_name,columns):
+        '''Create an index on columns of a table if it does not exist
+        
+        Args:
+            table_name: The table to index
+            columns: A list of columns to index
+        Returns:
+            created: True if the index was created'''
+        index_name = u'idx_{}_{}'.format(
+            table_name,
+            '_'.join(columns)
+        )
+        
+        dbh = self.GetDbHandle()
+        cursor = dbh.cursor()
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND name=?",
+            (index_name,)
+        )
+        created = cursor.fetchone() is None
+        if created:
+            cursor.execute(u"CREATE INDEX '{}' ON '{}' ({})".format(
+                index_name,
+                table_name,
+                ', '.join(u"'{}'".format(column) for column in columns)
+            ))
+            dbh.commit()
+        self.ReleaseDbHandle(dbh)
+        
+        return created
+    
+    def Analyze(self):
+        '''Gather statistics for the query planner'''
+        dbh = self.GetDbHandle()
+        dbh.execute('ANALYZE')
         dbh.commit()
+        self.ReleaseDbHandle(dbh)
     
     def CreateView(self,view_str):
         dbh = self.GetDbHandle()
@@ -955,9 +5441,80 @@ class DbHandler():
         
         cursor.execute(view_str)
         dbh.commit()
+        self.ReleaseDbHandle(dbh)
+    
+    def CreateTimestampView(self,view_name,table_name,timestamp_columns):
+        '''(Re)create a view of a table that formats its epoch microsecond
+        timestamp columns as datetime text
+        
+        Args:
+            view_name: The name of the view
+            table_name: The table with epoch timestamps
+            timestamp_columns: The names of the timestamp columns'''
+        columns = []
+        for column in self.GetColumnNames(table_name):
+            if column in timestamp_columns:
+                columns.append(u'{} AS "{}"'.format(
+                    GetEpochDatetimeSql(column),
+                    column
+                ))
+            else:
+                columns.append(u'"{}"'.format(column))
+        
+        self.Execute(
+            u"DROP VIEW IF EXISTS '{}'".format(view_name)
+        )
+        self.CreateView(
+            u"CREATE VIEW '{}' AS SELECT {} FROM '{}'".format(
+                view_name,
+                ', '.join(columns),
+                table_name
+            )
+        )
+    
+    def BeginBulkLoad(self):
+        '''Open one persistent connection with write optimized PRAGMAs.
+        
+        Until EndBulkLoad is called every operation shares this connection
+        and inserts are committed once per table. Journaling and syncing are
+        turned off, so the database is only consistent after EndBulkLoad.'''
+        self.dbh = self._Connect()
+        cursor = self.dbh.cursor()
+        for pragma,value in DbHandler.BULK_LOAD_PRAGMAS:
+            cursor.execute('PRAGMA {}={}'.format(pragma,value))
+        
+        self.bulk_load = True
+    
+    def EndBulkLoad(self):
+        '''Restore the durable settings and close the persistent connection'''
+        if self.dbh is None:
+            return
+        
+        self.dbh.commit()
+        cursor = self.dbh.cursor()
+        for pragma,value in DbHandler.DURABLE_PRAGMAS:
+            cursor.execute('PRAGMA {}={}'.format(pragma,value))
+        
+        # locking_mode=NORMAL only releases the lock on the next access #
+        cursor.execute('SELECT count(*) FROM sqlite_master')
+        
+        self.dbh.close()
+        self.dbh = None
+        self.bulk_load = False
+    
+    def ReleaseDbHandle(self,dbh):
+        '''Close a handle from GetDbHandle unless it is the persistent one'''
+        if dbh is not self.dbh:
+            dbh.close()
     
     def GetDbHandle(self):
         '''Create database handle based off of databaseinfo'''
+        if self.dbh is not None:
+            return self.dbh
+        
+        return self._Connect()
+    
+    def _Connect(self):
         dbh = None
         
         dbh = sqlite3.connect(
@@ -966,12 +5523,40 @@ class DbHandler():
             detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES
         )
         
+        if self.db_config.read_only:
+            dbh.execute('PRAGMA query_only=ON')
+        
         return dbh
     
+    def ExecuteQuery(self,sql_string):
+        '''Run a query
+        
+        Returns:
+            (column_names, cursor): The result column names and a cursor to
+            iterate the rows with'''
+        dbh = self.GetDbHandle()
+        
+        #Register User Functions#
+        RegisterFunctions(dbh)
+        
+        sql_c = dbh.cursor()
+        sql_c.execute(sql_string)
+        
+        column_names = []
+        for desc in sql_c.description:
+            column_names.append(
+                desc[0]
+            )
+        
+        return column_names,sql_c
+    
     def FetchRecords(self,sql_string):
         dbh = self.GetDbHandle()
         dbh.row_factory = sqlite3.Row
         
+        #Register User Functions#
+        RegisterFunctions(dbh)
+        
         column_names = []
         
         sql_c = dbh.cursor()
@@ -998,7 +5583,15 @@ class DbHandler():
         
         sql_c.execute(sql_string)
         
-        row = sql_c.fetchone()
+        column_names = []
+        for desc in sql_c.description:
+            column_names.append(
+                desc[0]
+            )
+        
+        self.ReleaseDbHandle(dbh)
+        
+        return column_names
     
 if __name__ == '__main__':
     multiprocessing.freeze_support()
@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+# Benchmark SrumHandler.ConvertDb on a synthetic SRUM database
+#
+# Copyright (C) 2015, G-C Partners, LLC <dev@g-cpartners.com>
+# G-C Partners licenses this file to you under the Apache License, Version
+# 2.0 (the "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.  See the License for the specific language governing
+# permissions and limitations under the License.
+import os
+import sys
+import json
+import time
+import struct
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),'..')
+)
+import SrumMonkey
+from SrumMonkey import DbConfig, DbHandler, SrumHandler, GetPeakRss
+from pyesedb import column_types as DBTYPES
+
+#Provider tables in the order they are generated#
+PROVIDER_TABLES = [
+    '{D10CA2FE-6FCF-4F6D-848E-B2E99266FA89}',
+    '{973F5D5C-1D90-4944-BE8E-24B94231A174}',
+    '{DD6636C4-8929-4683-974E-22C046A43763}',
+    '{D10CA2FE-6FCF-4F6D-848E-B2E99266FA86}',
+    '{FEE4E14F-02A9-4550-B5CE-5FA2DA202E37}'
+]
+#Column names SrumHandler decodes as FILETIMEs#
+FILETIME_COLUMNS = [
+    'ConnectStartTime',
+    'EventTimestamp'
+]
+#Records that share a TimeStamp, like the hourly SRUM flushes#
+RECORDS_PER_TIMESTAMP = 64
+#2016-01-01 as OLE automation days and as a FILETIME#
+OLE_BASE = 42370.0
+FILETIME_BASE = 130960800000000000
+#Name of the sparse file the synthetic pages are read from#
+BACKING_FILE = 'SRUDB.synthetic'
+
+class SyntheticColumn(object):
+    def __init__(self,name,column_type):
+        self.name = name
+        self.type = column_type
+
+class SyntheticRecord(object):
+    def __init__(self,values):
+        self.values = values
+    
+    def get_number_of_values(self):
+        return len(self.values)
+    
+    def get_value_data(self,index):
+        return self.values[index]
+
+class SyntheticTable(object):
+    '''A pyesedb style table whose records are generated on demand, so
+    tables of any size take no memory. Getting a record reads the page
+    that holds it from the backing file like libesedb would.'''
+    def __init__(self,name,columns,number_of_records,get_values):
+        self.name = name
+        self.columns = columns
+        self.number_of_records = number_of_records
+        self.get_values = get_values
+        self.pages = None
+        self.first_page = 0
+    
+    def get_number_of_records(self):
+        return self.number_of_records
+    
+    def get_record(self,index):
+        if self.pages is not None:
+            self.pages.ReadPage(self.first_page + index // self.pages.records_per_page)
+        
+        return SyntheticRecord(self.get_values(index))
+    
+    @property
+    def records(self):
+        for index in xrange(self.number_of_records):
+            yield self.get_record(index)
+
+class SyntheticPages(object):
+    '''Reads the pages of the tables from a file object, skipping the read
+    when a record is on the page read last'''
+    def __init__(self,file_object,page_size,records_per_page):
+        self.file_object = file_object
+        self.page_size = page_size
+        self.records_per_page = records_per_page
+        self.last_page = None
+        self.reads = 0
+        self.read_seconds = 0.0
+    
+    def ReadPage(self,page):
+        if page == self.last_page:
+            return
+        
+        start = time.time()
+        self.file_object.seek(page * self.page_size)
+        self.file_object.read(self.page_size)
+        self.read_seconds += time.time() - start
+        self.reads += 1
+        self.last_page = page
+    
+    def close(self):
+        self.file_object.close()
+
+class SyntheticFile(object):
+    '''A pyesedb style file with a SruDbIdMapTable and provider tables.
+    open reads pages with unbuffered file reads like libesedb does, and
+    open_file_object reads them from the file object given (the InputFile
+    of --input_io).'''
+    def __init__(self,config):
+        self.config = config
+        self.tables = []
+        self.pages = None
+    
+    def open(self,filename):
+        self._SetPages(open(filename,'rb',0))
+    
+    def open_file_object(self,file_object):
+        self._SetPages(file_object)
+    
+    def _SetPages(self,file_object):
+        self.pages = SyntheticPages(
+            file_object,
+            self.config.page_size,
+            self.config.records_per_page
+        )
+        self.tables = GetTables(self.config)
+        
+        first_page = 0
+        for table in self.tables:
+            table.pages = self.pages
+            table.first_page = first_page
+            first_page += GetTablePages(self.config,table.number_of_records)
+    
+    def close(self):
+        self.tables = []
+        if self.pages is not None:
+            self.pages.close()
+            self.pages = None
+    
+    def get_table_by_name(self,name):
+        for table in self.tables:
+            if table.name == name:
+                return table
+        
+        return None
+
+class SyntheticPyesedb(object):
+    '''Stands in for the pyesedb module in SrumMonkey. Every file opened
+    returns the same synthetic tables.'''
+    column_types = DBTYPES
+    
+    def __init__(self,config):
+        self.config = config
+    
+    def file(self):
+        return SyntheticFile(self.config)
+
+def GetTablePages(config,number_of_records):
+    '''The number of pages a table of number_of_records takes'''
+    return max(-(-number_of_records // config.records_per_page),1)
+
+def CreateBackingFile(config,folder):
+    '''Create a sparse file with room for the pages of every table
+    
+    Returns:
+        path: The backing file'''
+    pages = GetTablePages(config,config.id_map_entries)
+    pages += GetTablePages(config,config.records) * min(config.provider_tables,len(PROVIDER_TABLES))
+    
+    path = os.path.join(folder,BACKING_FILE)
+    with open(path,'wb') as fh:
+        fh.truncate(pages * config.page_size)
+    
+    return path
+
+def GetSid(rid):
+    '''S-1-5-21-1-2-3-<rid> in its binary form'''
+    return struct.pack('<BB6s5L',1,5,'\x00\x00\x00\x00\x00\x05',21,1,2,3,rid)
+
+def GetTables(config):
+    '''Build the synthetic tables for a benchmark configuration'''
+    entries = config.id_map_entries
+    sid_every = config.sid_every
+    pack_id = struct.Struct('i').pack
+    
+    def id_map_values(index):
+        id_index = index + 1
+        if id_index % sid_every == 0:
+            return [chr(3),pack_id(id_index),GetSid(1000 + id_index)]
+        
+        return [
+            chr(0),
+            pack_id(id_index),
+            u'\\Device\\HarddiskVolume2\\Program Files\\Vendor{}\\App{}.exe'.format(
+                id_index % 97,id_index
+            ).encode('utf-16le')
+        ]
+    
+    tables = [SyntheticTable(
+        'SruDbIdMapTable',
+        [
+            SyntheticColumn('IdType',DBTYPES.INTEGER_8BIT_UNSIGNED),
+            SyntheticColumn('IdIndex',DBTYPES.INTEGER_32BIT_SIGNED),
+            SyntheticColumn('IdBlob',DBTYPES.LARGE_BINARY_DATA)
+        ],
+        entries,
+        id_map_values
+    )]
+    
+    columns = [
+        SyntheticColumn('AutoIncId',DBTYPES.INTEGER_32BIT_SIGNED),
+        SyntheticColumn('TimeStamp',DBTYPES.DATE_TIME),
+        SyntheticColumn('AppId',DBTYPES.INTEGER_32BIT_SIGNED),
+        SyntheticColumn('UserId',DBTYPES.INTEGER_32BIT_SIGNED)
+    ]
+    columns += [
+        SyntheticColumn('Counter{}'.format(number),DBTYPES.INTEGER_64BIT_SIGNED)
+        for number in xrange(config.counter_columns)
+    ]
+    columns += [
+        SyntheticColumn(name,DBTYPES.INTEGER_64BIT_SIGNED)
+        for name in FILETIME_COLUMNS[:config.filetime_columns]
+    ]
+    columns += [
+        SyntheticColumn('BinaryData{}'.format(number),DBTYPES.LARGE_BINARY_DATA)
+        for number in xrange(config.synthetic_binary_columns)
+    ]
+    
+    pack_counter = struct.Struct('q').pack
+    pack_ole = struct.Struct('d').pack
+    pack_filetime = struct.Struct('Q').pack
+    counter_columns = config.counter_columns
+    filetime_columns = config.filetime_columns
+    binary_data = 'B' * config.synthetic_binary_size
+    binary_columns = config.synthetic_binary_columns
+    sid_ids = range(sid_every,entries + 1,sid_every) or [1]
+    
+    def provider_values(index):
+        mixed = index * 2654435761
+        values = [
+            pack_id(index + 1),
+            pack_ole(OLE_BASE + (index // RECORDS_PER_TIMESTAMP) / 24.0),
+            pack_id(1 + mixed % entries),
+            pack_id(sid_ids[mixed % len(sid_ids)])
+        ]
+        for number in xrange(counter_columns):
+            values.append(pack_counter((mixed >> number) % 1000000000))
+        for number in xrange(filetime_columns):
+            values.append(pack_filetime(FILETIME_BASE + index * 10000000 + number))
+        for number in xrange(binary_columns):
+            values.append(None if index % 7 == 0 else binary_data)
+        
+        return values
+    
+    for table_name in PROVIDER_TABLES[:config.provider_tables]:
+        tables.append(SyntheticTable(
+            table_name,
+            columns,
+            config.records,
+            provider_values
+        ))
+    
+    return tables
+
+class TimedDbHandler(DbHandler):
+    '''A DbHandler that keeps the time spent writing to SQLite. Time spent
+    waiting on the row iterator (decoding records) is not counted.'''
+    def __init__(self,db_config):
+        DbHandler.__init__(self,db_config)
+        self.write_time = 0.0
+    
+    def InsertFromIterator(self,table,row_iter,column_order,**kwargs):
+        timer = {'rows':0.0}
+        
+        def timed_rows():
+            row_iter_next = iter(row_iter).next
+            while True:
+                start = time.time()
+                try:
+                    row = row_iter_next()
+                finally:
+                    timer['rows'] += time.time() - start
+                yield row
+        
+        start = time.time()
+        count = DbHandler.InsertFromIterator(
+            self,table,timed_rows(),column_order,**kwargs
+        )
+        self.write_time += time.time() - start - timer['rows']
+        
+        return count
+    
+    def MergeDatabase(self,*args,**kwargs):
+        start = time.time()
+        try:
+            return DbHandler.MergeDatabase(self,*args,**kwargs)
+        finally:
+            self.write_time += time.time() - start
+
+def RunBenchmark(config,process_args):
+    outpath = tempfile.mkdtemp(prefix='SrumBenchmark')
+    backing_folder = outpath
+    if config.backing_folder:
+        backing_folder = tempfile.mkdtemp(
+            prefix='SrumBenchmark',
+            dir=config.backing_folder
+        )
+    try:
+        backing_file = CreateBackingFile(config,backing_folder)
+        options = SrumMonkey.GetOptions().parse_args(
+            ['process','--srum_db',backing_file,'--software_hive','synthetic','--outpath',outpath] + process_args
+        )
+        options.output_db = os.path.join(outpath,'SRUM.db')
+        
+        SrumMonkey.pyesedb = SyntheticPyesedb(config)
+        
+        db_handler = TimedDbHandler(
+            DbConfig(
+                dbname=options.output_db
+            )
+        )
+        if options.fast_load:
+            db_handler.BeginBulkLoad()
+        
+        start = time.time()
+        try:
+            srum_handler = SrumHandler(
+                options,
+                db_handler=db_handler
+            )
+            srum_handler.ConvertDb()
+        finally:
+            db_handler.EndBulkLoad()
+        elapsed = time.time() - start
+        
+        #Reads of the main process, workers read their own pages#
+        pages = srum_handler.esedb_file.pages
+        input_counters = {
+            'page_reads':pages.reads,
+            'page_read_seconds':pages.read_seconds
+        }
+        if srum_handler.input_file is not None:
+            input_counters.update(srum_handler.input_file.counters)
+        
+        db_size = os.path.getsize(options.output_db)
+    finally:
+        shutil.rmtree(outpath,ignore_errors=True)
+        shutil.rmtree(backing_folder,ignore_errors=True)
+    
+    records = config.id_map_entries + config.records * config.provider_tables
+    return {
+        'records':records,
+        'elapsed':elapsed,
+        'records_per_sec':records / elapsed,
+        'sqlite_write_time':db_handler.write_time,
+        'peak_rss_mb':GetPeakRss(),
+        'db_size':db_size,
+        'input_io':options.input_io,
+        'input':input_counters,
+        'process_args':process_args
+    }
+
+def Main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark SrumHandler.ConvertDb on a synthetic SRUM database. '
+            'Arguments not listed here are passed on to the process sub-command '
+            '(e.g. --workers 4 --fast_load --timestamp_format epoch).'
+    )
+    parser.add_argument(
+        '--records',
+        dest='records',
+        action="store",
+        type=int,
+        default=100000,
+        help='Number of records per provider table (default: 100000)'
+    )
+    parser.add_argument(
+        '--provider_tables',
+        dest='provider_tables',
+        action="store",
+        type=int,
+        default=2,
+        help='Number of provider tables, up to {} (default: 2)'.format(len(PROVIDER_TABLES))
+    )
+    parser.add_argument(
+        '--id_map_entries',
+        dest='id_map_entries',
+        action="store",
+        type=int,
+        default=5000,
+        help='Number of SruDbIdMapTable entries (default: 5000)'
+    )
+    parser.add_argument(
+        '--sid_every',
+        dest='sid_every',
+        action="store",
+        type=int,
+        default=5,
+        help='Every Nth SruDbIdMapTable entry is a SID, the rest are paths (default: 5)'
+    )
+    parser.add_argument(
+        '--counter_columns',
+        dest='counter_columns',
+        action="store",
+        type=int,
+        default=15,
+        help='Number of 64-bit counter columns per provider table (default: 15)'
+    )
+    parser.add_argument(
+        '--filetime_columns',
+        dest='filetime_columns',
+        action="store",
+        type=int,
+        choices=range(len(FILETIME_COLUMNS) + 1),
+        default=1,
+        help='Number of FILETIME columns per provider table (default: 1)'
+    )
+    parser.add_argument(
+        '--synthetic_binary_columns',
+        dest='synthetic_binary_columns',
+        action="store",
+        type=int,
+        default=1,
+        help='Number of binary columns per provider table (default: 1)'
+    )
+    parser.add_argument(
+        '--synthetic_binary_size',
+        dest='synthetic_binary_size',
+        action="store",
+        type=int,
+        default=64,
+        help='Size in bytes of the binary column values (default: 64)'
+    )
+    parser.add_argument(
+        '--page_size',
+        dest='page_size',
+        action="store",
+        type=int,
+        default=32768,
+        help='Size in bytes of the pages read from the backing file (default: 32768)'
+    )
+    parser.add_argument(
+        '--records_per_page',
+        dest='records_per_page',
+        action="store",
+        type=int,
+        default=200,
+        help='Number of records per page (default: 200)'
+    )
+    parser.add_argument(
+        '--backing_folder',
+        dest='backing_folder',
+        action="store",
+        default=None,
+        help='Folder for the sparse file the pages are read from, e.g. on network storage (default: a temporary folder)'
+    )
+    parser.add_argument(
+        '--results',
+        dest='results',
+        action="store",
+        default=None,
+        help='Write the results as JSON to this file'
+    )
+    parser.add_argument(
+        '--min_records_per_sec',
+        dest='min_records_per_sec',
+        action="store",
+        type=float,
+        default=None,
+        help='Exit with status 1 if the conversion is slower than this'
+    )
+    config,process_args = parser.parse_known_args()
+    
+    results = RunBenchmark(config,process_args)
+    
+    print 'converted  {:>10} records {:>8.3f}s {:>12.0f} records/sec'.format(
+        results['records'],results['elapsed'],results['records_per_sec']
+    )
+    print 'sqlite     {:>10} bytes   {:>8.3f}s {:>11.1f}% of conversion'.format(
+        results['db_size'],results['sqlite_write_time'],
+        100.0 * results['sqlite_write_time'] / results['elapsed']
+    )
+    print 'input      {:>10} page reads {:>5.3f}s ({})'.format(
+        results['input']['page_reads'],results['input']['page_read_seconds'],
+        results['input_io']
+    )
+    if results['peak_rss_mb'] is not None:
+        print 'peak rss   {:>10.1f} MB'.format(results['peak_rss_mb'])
+    
+    if config.results:
+        with open(config.results,'wb') as fh:
+            json.dump(results,fh,indent=4,sort_keys=True)
+    
+    if config.min_records_per_sec and results['records_per_sec'] < config.min_records_per_sec:
+        print 'FAILED: slower than {:.0f} records/sec'.format(config.min_records_per_sec)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    Main()
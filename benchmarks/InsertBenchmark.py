@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# Compare the DbHandler bulk insert path against the per-row insert path
+#
+# Copyright (C) 2015, G-C Partners, LLC <dev@g-cpartners.com>
+# G-C Partners licenses this file to you under the Apache License, Version
+# 2.0 (the "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.  See the License for the specific language governing
+# permissions and limitations under the License.
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),'..')
+)
+from SrumMonkey import DbConfig, DbHandler
+
+COLUMN_ORDER = [
+    'AutoIncId',
+    'TimeStamp',
+    'AppId',
+    'UserId',
+    'ForegroundCycleTime',
+    'BackgroundCycleTime',
+    'FaceTime',
+    'ForegroundBytesRead',
+    'ForegroundBytesWritten'
+]
+FIELD_MAPPING = {
+    'AutoIncId':'INTEGER',
+    'TimeStamp':'DATETIME',
+    'AppId':'INTEGER',
+    'UserId':'INTEGER',
+    'ForegroundCycleTime':'INTEGER',
+    'BackgroundCycleTime':'INTEGER',
+    'FaceTime':'INTEGER',
+    'ForegroundBytesRead':'INTEGER',
+    'ForegroundBytesWritten':'INTEGER'
+}
+
+def GetRows(count):
+    '''Yield synthetic ApplicationResourceUsageProvider rows'''
+    for i in xrange(count):
+        yield (i,'2016-01-01 00:00:00',i % 250,i % 12,i * 3,i * 7,i,i * 11,i * 13)
+
+def LegacyInsert(dbhandler,table,rows):
+    '''The original insert path: build the INSERT string and scan the row
+    keys for every row, then execute one row at a time.'''
+    dbh = dbhandler.GetDbHandle()
+    dbh.text_factory = str
+    sql_c = dbh.cursor()
+    for values in rows:
+        row = dict(zip(COLUMN_ORDER,values))
+        sql = dbhandler.CreateInsertString(table,row,COLUMN_ORDER)
+        in_row = []
+        for key in COLUMN_ORDER:
+            if key in row.keys():
+                in_row.append(row[key])
+            else:
+                in_row.append(None)
+        sql_c.execute(sql,in_row)
+    dbh.commit()
+    dbh.close()
+
+def BulkInsert(dbhandler,table,rows):
+    dbhandler.InsertFromIterator(table,rows,COLUMN_ORDER)
+
+def RunBenchmark(name,function,count):
+    handle,db_path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    try:
+        dbhandler = DbHandler(DbConfig(dbname=db_path))
+        dbhandler.CreateTableFromMapping(
+            'ApplicationResourceUsageProvider',
+            FIELD_MAPPING,
+            None,
+            COLUMN_ORDER
+        )
+        start = time.time()
+        function(dbhandler,'ApplicationResourceUsageProvider',GetRows(count))
+        elapsed = time.time() - start
+    finally:
+        os.remove(db_path)
+    
+    print '{:<8} {:>10} rows {:>8.3f}s {:>12.0f} rows/sec'.format(
+        name,count,elapsed,count / elapsed
+    )
+    return elapsed
+
+def Main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark DbHandler insert paths.'
+    )
+    parser.add_argument(
+        '--rows',
+        dest='rows',
+        action="store",
+        type=int,
+        default=200000,
+        help='Number of rows to insert (default: 200000)'
+    )
+    options = parser.parse_args()
+    
+    legacy = RunBenchmark('legacy',LegacyInsert,options.rows)
+    bulk = RunBenchmark('bulk',BulkInsert,options.rows)
+    print 'speedup: {:.2f}x'.format(legacy / bulk)
+
+if __name__ == '__main__':
+    Main()
@@ -11,11 +11,9 @@ setup(
         'SrumMonkey.py'
     ],
     dependency_links = [
-        'https://github.com/williballenthin/python-registry/tarball/master#egg=Registry-1.2.0',
-        'https://github.com/devgc/GcHelpers/tarball/master#egg=gchelpers-0.0.1'
+        'https://github.com/williballenthin/python-registry/tarball/master#egg=Registry-1.2.0'
     ],
     install_requires = [
-        'gchelpers==0.0.1',
         'python_registry',
         'XlsxWriter',
         'pkg_resources'
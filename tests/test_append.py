@@ -0,0 +1,149 @@
+'''Tests for process --append (SrumHandler high water marks)
+
+Run from the repository root with:
+    python -m unittest discover tests'''
+import os
+import sys
+import shutil
+import sqlite3
+import struct
+import tempfile
+import unittest
+
+sys.path.insert(
+    0,
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+import SrumMonkey
+
+DBTYPES = SrumMonkey.DBTYPES
+
+class FakeColumn(object):
+    def __init__(self,name,column_type):
+        self.name = name
+        self.type = column_type
+
+class FakeRecord(object):
+    def __init__(self,columns,values):
+        self.columns = columns
+        self.values = values
+    
+    def get_value_data(self,index):
+        return self.values[index]
+    
+    def get_column_name(self,index):
+        return self.columns[index].name
+    
+    def get_column_type(self,index):
+        return self.columns[index].type
+    
+    def get_number_of_values(self):
+        return len(self.values)
+    
+    number_of_values = property(get_number_of_values)
+
+class FakeTable(object):
+    '''A table of hourly records with AutoIncId 1 to number_of_records'''
+    COLUMNS = [
+        FakeColumn('AutoIncId',DBTYPES.INTEGER_32BIT_SIGNED),
+        FakeColumn('TimeStamp',DBTYPES.DATE_TIME),
+        FakeColumn('Value',DBTYPES.INTEGER_32BIT_SIGNED)
+    ]
+    
+    def __init__(self,number_of_records):
+        self.name = 'TestTable'
+        self.columns = FakeTable.COLUMNS
+        self.number_of_columns = len(self.columns)
+        self.rows = []
+        for index in range(number_of_records):
+            self.rows.append([
+                struct.pack('<i',index + 1),
+                struct.pack('<d',42370 + index / 24.0),
+                struct.pack('<i',index * 10)
+            ])
+    
+    def get_number_of_records(self):
+        return len(self.rows)
+    
+    def get_record(self,index):
+        return FakeRecord(self.columns,self.rows[index])
+    
+    @property
+    def records(self):
+        for index in range(len(self.rows)):
+            yield self.get_record(index)
+
+class FakeEsedbFile(object):
+    #The table the next opened file contains#
+    table = None
+    
+    def __init__(self):
+        self.tables = [FakeEsedbFile.table]
+    
+    def open(self,filename):
+        pass
+    
+    def close(self):
+        pass
+
+class AppendTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.output_db = os.path.join(self.folder,'SRUM.db')
+        self.esedb_file = SrumMonkey.pyesedb.file
+        SrumMonkey.pyesedb.file = FakeEsedbFile
+    
+    def tearDown(self):
+        SrumMonkey.pyesedb.file = self.esedb_file
+        shutil.rmtree(self.folder)
+    
+    def _Convert(self,number_of_records,arguments):
+        FakeEsedbFile.table = FakeTable(number_of_records)
+        options = SrumMonkey.GetOptions().parse_args([
+            'process',
+            '--srum_db',os.path.join(self.folder,'SRUDB.dat'),
+            '--software_hive',os.path.join(self.folder,'SOFTWARE'),
+            '--outpath',self.folder
+        ] + arguments)
+        options.output_db = self.output_db
+        
+        db_handler = SrumMonkey.DbHandler(
+            SrumMonkey.DbConfig(dbname=self.output_db)
+        )
+        SrumMonkey.SrumHandler(
+            options,
+            db_handler=db_handler
+        ).ConvertDb()
+    
+    def _GetIds(self):
+        dbh = sqlite3.connect(self.output_db)
+        try:
+            return [
+                row[0] for row in dbh.execute('SELECT AutoIncId FROM TestTable ORDER BY AutoIncId')
+            ]
+        finally:
+            dbh.close()
+    
+    def testAppend(self):
+        self._Convert(10,[])
+        self._Convert(15,['--append'])
+        self._Convert(15,['--append'])
+        
+        self.assertEqual(self._GetIds(),range(1,16))
+    
+    def testWindowedAppendThenAppend(self):
+        self._Convert(10,[])
+        #Records 13 to 16, starting 2016-01-01 12:00#
+        self._Convert(20,[
+            '--append',
+            '--since','2016-01-01 12:00:00',
+            '--until','2016-01-01 16:00:00'
+        ])
+        self.assertEqual(self._GetIds(),range(1,11) + range(13,17))
+        
+        self._Convert(20,['--append'])
+        
+        self.assertEqual(self._GetIds(),range(1,11) + range(13,21))
+
+if __name__ == '__main__':
+    unittest.main()
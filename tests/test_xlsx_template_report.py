@@ -0,0 +1,263 @@
+'''Tests for the XLSX template renderer (XlsxTemplateReport)
+
+Run from the repository root with:
+    python -m unittest discover tests'''
+import os
+import re
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(
+    0,
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+import SrumMonkey
+
+RECORDS_TEMPLATE = u'''
+workbook_name: 'Test.xlsx'
+worksheets:
+  - worksheet_name: 'Apps'
+    worksheet_type: 'records'
+    attributes:
+      freeze_panes:
+          row: 1
+      xlsx_column_formats:
+        0:
+          column_type: datetime
+          strptime: '%Y-%m-%d %H:%M:%S'
+          format: {'num_format': 'mm/dd/yyyy hh:mm:ss'}
+      sql_query: |
+          SELECT TimeStamp, Name, Bytes, Data FROM Apps ORDER BY Bytes
+  - worksheet_name: 'BytesChart'
+    worksheet_type: 'chart'
+    attributes:
+      chart:
+        type: 'column'
+      series:
+        - name: 'Apps!$C$1'
+          categories: 'Apps!$B$2:$B${Apps[EndRow]}'
+          values: '=(Apps!$C$2:$C${Apps[EndRow]})'
+'''
+
+ROLLUP_TEMPLATE = u'''
+workbook_name: 'Test.xlsx'
+worksheets:
+  - worksheet_name: 'Apps'
+    worksheet_type: 'records'
+    attributes:
+      sql_query: 'SELECT Name, SUM(Bytes) AS Bytes FROM Apps GROUP BY Name'
+      rollup_tables: ['Apps_Total']
+      rollup_query: 'SELECT Name, Bytes FROM Apps_Total'
+'''
+
+FAILING_TEMPLATE = u'''
+workbook_name: 'Test.xlsx'
+worksheets:
+  - worksheet_name: 'Apps'
+    worksheet_type: 'records'
+    attributes:
+      sql_query: 'SELECT Name FROM Apps'
+  - worksheet_name: 'Missing'
+    worksheet_type: 'records'
+    attributes:
+      sql_query: 'SELECT * FROM NoSuchTable'
+'''
+
+class XlsxTemplateReportTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.outpath = os.path.join(self.folder,'out')
+        os.makedirs(self.outpath)
+        
+        self.db_path = os.path.join(self.folder,'SRUM.db')
+        dbh = sqlite3.connect(self.db_path)
+        dbh.execute('CREATE TABLE Apps (TimeStamp TEXT, Name TEXT, Bytes INTEGER, Data BLOB)')
+        dbh.executemany(
+            'INSERT INTO Apps VALUES (?,?,?,?)',
+            [
+                (u'2016-01-01 10:00:00',u'a.exe',30,buffer('\x01\x02')),
+                (u'2016-01-01 11:00:00.5',u'b.exe',10,None),
+                (None,u'c.exe',20,None)
+            ]
+        )
+        dbh.commit()
+        dbh.close()
+        
+        self.db_handler = SrumMonkey.DbHandler(
+            SrumMonkey.DbConfig(
+                dbname=self.db_path,
+                read_only=True
+            )
+        )
+    
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    
+    def _CreateReport(self,template_text,query_cache=None):
+        template_path = os.path.join(self.folder,'Test.yml')
+        with open(template_path,'wb') as fh:
+            fh.write(template_text.encode('utf-8'))
+        
+        report = SrumMonkey.XlsxTemplateReport(template_path)
+        report.CreateReport(
+            self.db_handler,
+            self.outpath,
+            query_cache=query_cache
+        )
+        
+        return os.path.join(self.outpath,'Test.xlsx')
+    
+    @staticmethod
+    def _ReadWorkbook(report_file):
+        '''Get the sheet names, the cell values per sheet and the chart XML'''
+        with zipfile.ZipFile(report_file) as archive:
+            workbook_xml = archive.read('xl/workbook.xml')
+            sheet_names = re.findall(r'<sheet name="([^"]+)"',workbook_xml)
+            
+            sheets = {}
+            for number,sheet_name in enumerate(sheet_names,1):
+                sheet_xml = archive.read('xl/worksheets/sheet{}.xml'.format(number))
+                rows = []
+                for row_xml in re.findall(r'<row [^>]*>(.*?)</row>',sheet_xml):
+                    rows.append(re.findall(r'<(?:v|t)>([^<]*)</(?:v|t)>',row_xml))
+                sheets[sheet_name] = rows
+            
+            charts = [
+                archive.read(name) for name in archive.namelist()
+                if name.startswith('xl/charts/')
+            ]
+        
+        return sheet_names,sheets,charts
+    
+    def testRecordsAndChart(self):
+        report_file = self._CreateReport(RECORDS_TEMPLATE)
+        sheet_names,sheets,charts = self._ReadWorkbook(report_file)
+        
+        self.assertEqual(sheet_names,['Apps','BytesChart'])
+        self.assertEqual(
+            sheets['Apps'][0],
+            ['TimeStamp','Name','Bytes','Data']
+        )
+        self.assertEqual(len(sheets['Apps']),4)
+        #Datetimes become serial dates, fractional seconds included#
+        self.assertEqual(sheets['Apps'][1][1:],['b.exe','10'])
+        self.assertAlmostEqual(
+            float(sheets['Apps'][1][0]),
+            42370 + (11 * 3600 + 0.5) / 86400.0
+        )
+        self.assertEqual(sheets['Apps'][3][1:],['a.exe','30','0102'])
+        self.assertAlmostEqual(
+            float(sheets['Apps'][3][0]),
+            42370 + 10 / 24.0
+        )
+        #NULL cells are left empty#
+        self.assertEqual(sheets['Apps'][2],['c.exe','20'])
+        
+        self.assertEqual(len(charts),1)
+        self.assertIn('Apps!$C$2:$C$4',charts[0])
+        self.assertIn('Apps!$B$2:$B$4',charts[0])
+        self.assertFalse(os.path.exists(report_file + '.part'))
+    
+    def testRowLimitSpill(self):
+        max_rows = SrumMonkey.XlsxTemplateReport.MAX_ROWS
+        SrumMonkey.XlsxTemplateReport.MAX_ROWS = 3
+        try:
+            report_file = self._CreateReport(RECORDS_TEMPLATE)
+        finally:
+            SrumMonkey.XlsxTemplateReport.MAX_ROWS = max_rows
+        
+        sheet_names,sheets,charts = self._ReadWorkbook(report_file)
+        
+        self.assertEqual(sheet_names,['Apps','Apps_2','BytesChart'])
+        self.assertEqual(len(sheets['Apps']),3)
+        self.assertEqual(len(sheets['Apps_2']),2)
+        self.assertEqual(sheets['Apps_2'][0],sheets['Apps'][0])
+        #{Apps[EndRow]} is the last row of the first worksheet#
+        self.assertIn('Apps!$C$2:$C$3',charts[0])
+    
+    def testQueryCache(self):
+        expected = self._ReadWorkbook(self._CreateReport(RECORDS_TEMPLATE))
+        
+        query_cache = SrumMonkey.QueryCache(self.db_path,1024 * 1024)
+        for attempt in range(2):
+            report_file = self._CreateReport(
+                RECORDS_TEMPLATE,
+                query_cache=query_cache
+            )
+            self.assertEqual(self._ReadWorkbook(report_file),expected)
+        
+        self.assertEqual((query_cache.hits,query_cache.misses),(1,1))
+    
+    def testRollupQuery(self):
+        sheet_names,sheets,charts = self._ReadWorkbook(
+            self._CreateReport(ROLLUP_TEMPLATE)
+        )
+        self.assertEqual(len(sheets['Apps']),4)
+        
+        dbh = sqlite3.connect(self.db_path)
+        dbh.execute('CREATE TABLE Apps_Total (Name TEXT, Bytes INTEGER)')
+        dbh.execute("INSERT INTO Apps_Total VALUES ('total.exe',60)")
+        dbh.commit()
+        dbh.close()
+        
+        sheet_names,sheets,charts = self._ReadWorkbook(
+            self._CreateReport(ROLLUP_TEMPLATE)
+        )
+        self.assertEqual(sheets['Apps'],[['Name','Bytes'],['total.exe','60']])
+    
+    def testFailedReportKeepsPreviousWorkbook(self):
+        report_file = self._CreateReport(RECORDS_TEMPLATE)
+        with open(report_file,'rb') as fh:
+            previous = fh.read()
+        
+        with self.assertRaises(sqlite3.OperationalError):
+            self._CreateReport(FAILING_TEMPLATE)
+        
+        with open(report_file,'rb') as fh:
+            self.assertEqual(fh.read(),previous)
+        self.assertEqual(os.listdir(self.outpath),['Test.xlsx'])
+    
+    def testFailedReportLeavesNoFile(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self._CreateReport(FAILING_TEMPLATE)
+        
+        self.assertEqual(os.listdir(self.outpath),[])
+    
+    def testCreateTemplateReportError(self):
+        template_path = os.path.join(self.folder,'Test.yml')
+        with open(template_path,'wb') as fh:
+            fh.write(FAILING_TEMPLATE.encode('utf-8'))
+        
+        filename,elapsed,error,stages = SrumMonkey.CreateTemplateReport((
+            template_path,
+            self.db_path,
+            self.outpath,
+            0,
+            False
+        ))
+        
+        self.assertEqual(filename,'Test.yml')
+        self.assertIn('NoSuchTable',error)
+        self.assertEqual(os.listdir(self.outpath),[])
+    
+    def testCreateReportsFailure(self):
+        template_folder = os.path.join(self.folder,'templates')
+        os.makedirs(template_folder)
+        for filename,template_text in [('Good.yml',RECORDS_TEMPLATE),('Bad.yml',FAILING_TEMPLATE)]:
+            with open(os.path.join(template_folder,filename),'wb') as fh:
+                fh.write(template_text.encode('utf-8'))
+        
+        report_handler = SrumMonkey.ReportHandler(template_folder)
+        with self.assertRaises(Exception) as context:
+            report_handler.CreateReports(self.db_path,self.outpath)
+        
+        self.assertIn('1 of 2 reports failed',str(context.exception))
+        #The other report is still created#
+        self.assertEqual(os.listdir(self.outpath),['Test.xlsx'])
+
+if __name__ == '__main__':
+    unittest.main()